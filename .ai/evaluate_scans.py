@@ -1,12 +1,16 @@
 import os
 import sys
 import json
+import asyncio
 import requests
 import yaml
 
-from watsonx_client import call_watsonx
 from watsonx_prompt import build_prompt
 
+# The model providers are shared with the backend
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Backend"))
+from providers import router_from_env
+
 # -----------------------------
 # GitHub environment
 # -----------------------------
@@ -23,14 +27,10 @@ HEADERS = {
 }
 
 # -----------------------------
-# Watsonx environment
+# Model providers: Watsonx unless DETECTAI_PROVIDERS says otherwise
+# (e.g. "watsonx,openai" to fail over, or "stub" for a dry run)
 # -----------------------------
-WATSONX_API_KEY = os.getenv("WATSONX_API_KEY")
-WATSONX_PROJECT_ID = os.getenv("WATSONX_PROJECT_ID")
-WATSONX_REGION = os.getenv("WATSONX_REGION")
-
-if not all([WATSONX_API_KEY, WATSONX_PROJECT_ID, WATSONX_REGION]):
-    raise RuntimeError("Missing required Watsonx environment variables")
+router = router_from_env(default="watsonx")
 
 # -----------------------------
 # Load GitHub event
@@ -119,14 +119,22 @@ prompt = build_prompt(
 )
 
 # -----------------------------
-# Call Watsonx
+# Call the model
 # -----------------------------
-raw_response = call_watsonx(prompt)
+async def ask_model(prompt: str) -> str:
+    try:
+        completion = await router.complete([{"role": "user", "content": prompt}], json_mode=True)
+        print("Answered by:", completion.provider)
+        return completion.text
+    finally:
+        await router.aclose()
+
+raw_response = asyncio.run(ask_model(prompt))
 
 try:
     ai_result = json.loads(raw_response)
 except json.JSONDecodeError:
-    raise RuntimeError("Watsonx returned invalid JSON")
+    raise RuntimeError("The model returned invalid JSON")
 
 decision = ai_result.get("decision")
 comment = ai_result.get("comment")
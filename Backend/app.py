@@ -1,18 +1,135 @@
 # app.py
 
-import os, json, re
-from fastapi import FastAPI, UploadFile, File, Form
+import os, json, asyncio, tempfile, time
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Depends, Request
+from fastapi.responses import StreamingResponse, JSONResponse, PlainTextResponse
+from starlette.routing import Match
+from typing import Optional, List
 from pydantic import BaseModel
-from openai import OpenAI
 from dotenv import load_dotenv
 
+from cache import ResultCache, make_key
+from shared import store_from_env
+from llm import LLMClientProvider
+from providers import ProviderRouter, ProviderError, router_from_env
+from ratelimit import with_retries
+from singleflight import SingleFlight
+from incremental import Diff, carry_forward
+from chunking import make_chunks, merge_results, estimate_tokens, LIST_KEYS, TEXT_KEYS, POINT_KEYS
+from batch import Archive, BatchJob, BatchJobStore, select_members, read_member, content_digest
+from jobs import Job, JobQueue, MemoryJobStore, SQLiteJobStore, SharedJobStore, QueueFull, PRIORITIES, FINISHED
+from streaming import JsonItemStream, format_event
+from detection import detect
+from ingest import read_upload
+from rules import scan as static_scan, local_result, suspicious_regions, merge_findings
+from compaction import compact, restore_lines, count_tokens
+from units import split as split_into_units, anchors, relocate
+from semantic import SemanticCache, signature as semantic_signature
+from cascade import CascadeStats, Decision, EscalationPolicy
+from findings import FindingsStore, FILTERS as FINDING_FILTERS, GROUPS as FINDING_GROUPS
+from prompts import ANALYSIS_PROMPT, SCAN_PROMPT, OPTIMIZATION_PROMPT, SUMMARY_PROMPT
+from parsing import ParseStats, parse_reply, AnalysisResult, OptimizationResult, SummaryResult, ScanResult
+import metrics
+
 from fastapi.middleware.cors import CORSMiddleware
 
 # Load environment variables from .env file
 load_dotenv()
 
+# 3️⃣ Get API key from environment
+api_key = os.getenv("OPENAI_API_KEY")
+
+# One pooled AsyncOpenAI client lives for the whole application and is shared by every
+# call to the "openai" provider, so model calls never block the event loop and reuse
+# warm connections.
+llm_provider = LLMClientProvider.from_env(api_key=api_key)
+LLM_TIMEOUT = llm_provider.timeout
+
+# Model backends (providers.py), e.g. DETECTAI_PROVIDERS="openai,watsonx": each call goes
+# to the fastest healthy one, slow calls are hedged and 429/5xx fail over to the next.
+# Each provider is held under its quota by DETECTAI_<NAME>_RPM / _TPM (ratelimit.py).
+llm_router = router_from_env(llm_provider)
+
+# Optional cascade (cascade.py): with DETECTAI_CASCADE_PROVIDERS set (e.g. "openai" plus
+# DETECTAI_CASCADE_OPENAI_MODEL), that cheaper tier answers first and the router above only
+# gets the requests whose first answer fails the DETECTAI_CASCADE_SEVERITY /
+# DETECTAI_CASCADE_MIN_CONFIDENCE checks. Streaming endpoints always use the router above.
+cascade_router = router_from_env(llm_provider, prefix="DETECTAI_CASCADE_") if os.getenv("DETECTAI_CASCADE_PROVIDERS") else None
+escalation_policy = EscalationPolicy.from_env()
+cascade_stats = CascadeStats()
+
+# When every provider is throttled or failing, retry with jittered backoff, but give
+# up once DETECTAI_RETRY_DEADLINE seconds have passed since the first attempt
+RETRY_ATTEMPTS = int(os.getenv("DETECTAI_RETRY_ATTEMPTS", "4"))
+RETRY_DEADLINE = float(os.getenv("DETECTAI_RETRY_DEADLINE", "90"))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    llm_router.start()
+    if cascade_router is not None:
+        cascade_router.start()
+    job_queue.start(run_job, JOB_WORKERS)
+    loop_watch = asyncio.create_task(metrics.watch_event_loop())
+    yield
+    loop_watch.cancel()
+    if semantic_cache is not None:
+        semantic_cache.save()
+    await job_queue.stop()
+    await llm_router.aclose()
+    if cascade_router is not None:
+        await cascade_router.aclose()
+
+async def get_llm() -> ProviderRouter:
+    return llm_router
+
 # Create a FastAPI instance (our backend application)
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
+
+# Largest single file / code snippet accepted (archives for /batchReview have their own limit)
+MAX_UPLOAD_BYTES = int(os.getenv("DETECTAI_MAX_UPLOAD_BYTES", str(5 * 1024 * 1024)))
+# Room for multipart boundaries and form fields on top of the file itself
+MULTIPART_OVERHEAD = 64 * 1024
+
+# Reject oversized bodies from their Content-Length before anything is read or spooled.
+# Registered before CORS so the 413 still carries CORS headers.
+@app.middleware("http")
+async def reject_oversized_bodies(request: Request, call_next):
+    length = request.headers.get("content-length")
+    if request.method == "POST" and length and length.isdigit():
+        limit = BATCH_MAX_BYTES if request.url.path == "/batchReview" else MAX_UPLOAD_BYTES
+        if int(length) > limit + MULTIPART_OVERHEAD:
+            return JSONResponse(status_code=413, content={"detail": "Request body is too large."})
+    return await call_next(request)
+
+# Stage timings for /metrics (metrics.py): uploads (ingest), the looks-like-code check
+# (gate) and the local rule engine are timed wherever they are called
+read_upload = metrics.timed("ingest", read_upload)
+detect = metrics.timed("gate", detect)
+static_scan = metrics.timed("rules", static_scan)
+
+# Time every request under its route template (e.g. /jobs/{job_id}) and tell the stages
+# inside it which endpoint they belong to. For streamed responses this is the time to
+# the first byte; the rest of the stream is covered by the upstream stage.
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    endpoint = route_template(request.scope)
+    token = metrics.current_endpoint.set(endpoint)
+    started, status = time.perf_counter(), 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        metrics.requests.observe(time.perf_counter() - started, endpoint, request.method, status)
+        metrics.current_endpoint.reset(token)
+
+def route_template(scope):
+    for route in app.router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"
 
 app.add_middleware(
     CORSMiddleware,
@@ -22,238 +139,641 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# 3️⃣ Get API key from environment
-api_key = os.getenv("OPENAI_API_KEY")
+# Identifies the configured providers and models (both tiers with a cascade) in cache keys
+MODEL = llm_router.id if cascade_router is None else f"{cascade_router.id}>{llm_router.id}"
+
+# Upper bound on model calls in flight from this worker; extra requests wait for a slot
+llm_slots = asyncio.Semaphore(int(os.getenv("DETECTAI_MAX_CONCURRENCY", "64")))
+
+# Shared state (shared.py): with DETECTAI_SHARED_STATE set (sqlite:///path for one host,
+# redis://host:port for several), every worker process shares the result caches, the
+# single-flight leases and the job records, so adding workers doesn't repeat model calls.
+shared_state = store_from_env()
+
+# Result cache: identical code sent to the same endpoint is answered without a model call.
+# Set DETECTAI_CACHE_DB to a file path to keep results across restarts.
+result_cache = ResultCache(
+    max_entries=int(os.getenv("DETECTAI_CACHE_SIZE", "1024")),
+    ttl_seconds=float(os.getenv("DETECTAI_CACHE_TTL", "86400")),
+    db_path=os.getenv("DETECTAI_CACHE_DB") or None,
+    shared=shared_state,
+    namespace="result:",
+)
 
-# Initialize OpenAI client (uses API key from environment variable)
-client = OpenAI(api_key=api_key)
+# Earlier reviews, so a later request can re-review only what changed.
+# result_id -> {"task", "code", "result"}
+review_history = ResultCache(
+    max_entries=int(os.getenv("DETECTAI_HISTORY_SIZE", "512")),
+    ttl_seconds=float(os.getenv("DETECTAI_HISTORY_TTL", str(7 * 86400))),
+    db_path=os.getenv("DETECTAI_HISTORY_DB") or None,
+    shared=shared_state,
+    namespace="history:",
+)
+
+async def remember_result(task, code_text, result):
+    """Store a successful review and return its result_id (None if the reply was unusable)."""
+    if not isinstance(result, dict) or "raw" in result:
+        return None
+    result_id = make_key(f"history:{task}", MODEL, None, code_text)
+    await review_history.aset(result_id, json.dumps({"task": task, "code": code_text, "result": result}))
+    return result_id
+
+# Findings store (findings.py): every analysis and scan finding is recorded, so dashboards
+# can query past findings at /findings without re-running anything. DETECTAI_FINDINGS_DB
+# names the file (findings.db by default, shared by the workers on one host); DETECTAI_FINDINGS=0
+# turns it off. Inserts run on a worker thread, off the event loop.
+findings_store = FindingsStore(
+    os.getenv("DETECTAI_FINDINGS_DB") or "findings.db",
+    retention_seconds=float(os.getenv("DETECTAI_FINDINGS_RETENTION_DAYS", "90")) * 86400,
+) if os.getenv("DETECTAI_FINDINGS", "1") != "0" else None
+
+async def record_findings(response, code_text, filename=None, language=None):
+    """Store the findings of the "analysis" and "scan" results in a response; returns the response.
+
+    A file reviewed again with the same code_text replaces its earlier findings.
+    """
+    if findings_store is not None:
+        for task, key in (("analyze", "analysis"), ("scan", "scan")):
+            result = response.get(key)
+            if isinstance(result, dict) and "raw" not in result and "error" not in result:
+                await asyncio.to_thread(findings_store.record, task, result, metrics.current_endpoint.get(), filename,
+                                        language or response.get("language"), response.get("result_id"), code_text)
+    return response
+
+# Identical requests that miss the cache at the same time wait on a single model call;
+# with shared state, across all workers (the lease is renewed while the call runs)
+inflight = SingleFlight(shared_state, lease_seconds=float(os.getenv("DETECTAI_SHARED_LEASE", "30")))
+
+# Near-duplicate cache (semantic.py), off by default. With DETECTAI_SEMANTIC_CACHE=1, a
+# summarize request whose code is at least DETECTAI_SEMANTIC_THRESHOLD similar to an
+# earlier one (same names and formatting not required) gets that earlier result, with the
+# similarity under "semantic_cache". DETECTAI_SEMANTIC_SNAPSHOT keeps the index on disk.
+# Optimize is never served this way, even if listed: the earlier optimized_code is another
+# snippet's code, with its names and literals (possibly another user's).
+UNSHAREABLE_TASKS = {"optimize"}
+SEMANTIC_TASKS = {task.strip() for task in os.getenv("DETECTAI_SEMANTIC_TASKS", "summarize").split(",")} - UNSHAREABLE_TASKS
+semantic_cache = SemanticCache(
+    threshold=float(os.getenv("DETECTAI_SEMANTIC_THRESHOLD", "0.9")),
+    max_entries=int(os.getenv("DETECTAI_SEMANTIC_SIZE", "5000")),
+    snapshot_path=os.getenv("DETECTAI_SEMANTIC_SNAPSHOT") or None,
+) if os.getenv("DETECTAI_SEMANTIC_CACHE") == "1" else None
+
+# Every endpoint that calls the model belongs to one review task
+ENDPOINT_TASKS = {
+    "/analyze": "analyze",
+    "/upload": "analyze",
+    "/uploadFileToAnalyze": "analyze",
+    "/optimize": "optimize",
+    "/uploadFileToOptimize": "optimize",
+    "/summarize": "summarize",
+    "/uploadFileToSummarize": "summarize",
+    "/security-scan": "scan",
+    "/uploadFileToScan": "scan",
+}
+
+# Replies are parsed (and repaired if needed) against the response model for their task.
+# JSON mode asks the provider for a syntactically valid object; a reply that still can't be
+# used is retried up to DETECTAI_PARSE_RETRIES times with a reminder to send only JSON.
+RESPONSE_MODELS = {
+    "analyze": AnalysisResult,
+    "optimize": OptimizationResult,
+    "summarize": SummaryResult,
+    "scan": ScanResult,
+}
+JSON_MODE = os.getenv("DETECTAI_JSON_MODE", "1") != "0"
+PARSE_RETRIES = int(os.getenv("DETECTAI_PARSE_RETRIES", "1"))
+RETRY_PROMPT = "Your previous reply was not a valid JSON object in the requested structure. Reply again with ONLY that JSON object."
+parse_stats = ParseStats()
+
+# Code is compacted (compaction.py) before it goes into a prompt, within a per-task token
+# budget, e.g. DETECTAI_TOKEN_BUDGET_SUMMARIZE=8000. The optimizer keeps comments, since
+# its output replaces the user's code, and for the same reason never gets a shortened
+# file: code still over its budget is refused (413) instead of having its tail cut.
+TOKEN_BUDGETS = {
+    task: int(os.getenv(f"DETECTAI_TOKEN_BUDGET_{task.upper()}", str(default)))
+    for task, default in (("analyze", 6000), ("optimize", 8000), ("summarize", 12000), ("scan", 6000))
+}
+KEEP_COMMENTS = {"optimize"}
+compaction_totals = {"prompts": 0, "original_tokens": 0, "prompt_tokens": 0}
+
+def compact_prompt_code(endpoint, code_text):
+    task = ENDPOINT_TASKS[endpoint]
+    with metrics.stage("prompt"):
+        prompt = compact(code_text, TOKEN_BUDGETS[task], strip_comments=task not in KEEP_COMMENTS,
+                         lossy=task not in KEEP_COMMENTS)
+    if task in KEEP_COMMENTS and prompt.tokens > TOKEN_BUDGETS[task]:
+        raise HTTPException(status_code=413, detail=(
+            f"The code is too large to {task} in one request ({prompt.tokens} tokens, limit "
+            f"{TOKEN_BUDGETS[task]}). Please send a smaller part of the file."))
+    compaction_totals["prompts"] += 1
+    compaction_totals["original_tokens"] += prompt.original_tokens
+    compaction_totals["prompt_tokens"] += prompt.tokens
+    return prompt
+
+def provider_error_response(error: ProviderError) -> HTTPException:
+    if error.timeout:
+        return HTTPException(status_code=504, detail="The model did not respond in time. Please try again.")
+    if error.status == 429:
+        headers = {"Retry-After": str(int(error.retry_after))} if error.retry_after else None
+        return HTTPException(status_code=503, detail="The model provider is busy. Please try again shortly.", headers=headers)
+    return HTTPException(status_code=502, detail="The model provider is unavailable. Please try again.")
+
+# Tokens in each template's fixed system message, counted once per template
+template_tokens = {}
+
+def record_tokens(template, messages, reply, model):
+    """Count the prompt and completion tokens of one model call for /metrics."""
+    if template.id not in template_tokens:
+        template_tokens[template.id] = count_tokens(template.system["content"])
+    prompt_tokens = template_tokens[template.id] + sum(count_tokens(m["content"] or "") for m in messages[1:])
+    endpoint = metrics.current_endpoint.get()
+    metrics.prompt_sizes.observe(prompt_tokens, endpoint)
+    metrics.tokens.inc(endpoint, model, "prompt", amount=prompt_tokens)
+    metrics.tokens.inc(endpoint, model, "completion", amount=count_tokens(reply or ""))
+
+def parse_model_reply(endpoint, content, prompt=None, model=None):
+    """Parse and validate a reply, recording the outcome; returns (result dict or None, outcome).
+
+    With the compacted prompt, finding lines are mapped back to the original code and
+    the tokens saved are reported under "compaction".
+    """
+    with metrics.stage("parse"):
+        result, outcome = parse_reply(content, RESPONSE_MODELS[ENDPOINT_TASKS[endpoint]])
+    parse_stats.record(endpoint, outcome)
+    metrics.parses.inc(metrics.current_endpoint.get(), model, outcome)
+    if result is not None and prompt is not None:
+        restore_lines(result, prompt.line_map)
+        result["compaction"] = prompt.report()
+    return result, outcome
+
+async def first_pass(endpoint, code_text, template, temperature, prompt, messages):
+    """Ask the cascade's small tier; returns (result, decision), result None if escalated."""
+    started = time.monotonic()
+    result = None
+    try:
+        with metrics.stage("upstream"):
+            async with llm_slots:
+                reply = await cascade_router.complete(messages, temperature, JSON_MODE, LLM_TIMEOUT)
+    except ProviderError:
+        decision = Decision(True, "error", 0.0)  # the large tier has its own retries and failover
+    else:
+        model = f"{reply.provider}:{reply.model}"
+        record_tokens(template, messages, reply.text, model)
+        result, outcome = parse_model_reply(endpoint, reply.text, prompt, model)
+        decision = escalation_policy.decide(ENDPOINT_TASKS[endpoint], code_text, result, outcome)
+    record_tier(endpoint, "small", decision.reason, time.monotonic() - started)
+    if decision.escalate:
+        cascade_stats.record_escalation(decision.reason)
+        return None, decision
+    cascade_stats.record_answer("small")
+    result["cascade"] = {"tier": "small", "confidence": decision.confidence}
+    return result, decision
+
+def record_tier(endpoint, tier, outcome, latency):
+    cascade_stats.record_call(tier, latency)
+    metrics.cascade.inc(metrics.current_endpoint.get(), tier, outcome)
+    metrics.cascade_seconds.observe(latency, tier)
+
+async def ask_model(llm, endpoint, code_text, template, temperature=None):
+    """Return the model's reply for this code, served from the result cache when possible.
+
+    A usable reply comes back as normalized JSON; if it could not be parsed even after
+    the retries, the last raw reply is returned. Concurrent identical requests (same
+    cache key) share one upstream call.
+    """
+    key = make_key(endpoint, MODEL, temperature, code_text, template.id)
+    cached = await result_cache.aget(key)
+    metrics.cache.inc(metrics.current_endpoint.get(), "miss" if cached is None else "hit")
+    if cached is not None:
+        return cached
+
+    async def call_model():
+        near = None
+        if semantic_cache is not None and ENDPOINT_TASKS[endpoint] in SEMANTIC_TASKS:
+            namespace = f"{ENDPOINT_TASKS[endpoint]}|{MODEL}|{temperature!r}|{template.id}"
+            near = await asyncio.to_thread(semantic_signature, code_text)
+            hit = semantic_cache.lookup(namespace, near)
+            metrics.cache.inc(metrics.current_endpoint.get(), "semantic_miss" if hit is None else "semantic_hit")
+            if hit is not None:
+                result = json.loads(hit.value)
+                result["semantic_cache"] = {"similarity": hit.similarity, "threshold": semantic_cache.threshold}
+                return json.dumps(result)
+
+        async def keep(content):
+            await result_cache.aset(key, content)
+            if near is not None:
+                semantic_cache.add(namespace, near, content)
+            return content
+
+        prompt = compact_prompt_code(endpoint, code_text)
+        messages = attempt_messages = template.messages(prompt.text)
+        decision = None
+        if cascade_router is not None:
+            result, decision = await first_pass(endpoint, code_text, template, temperature, prompt, messages)
+            if result is not None:
+                return await keep(json.dumps(result))
+
+        for attempt in range(PARSE_RETRIES + 1):
+            if attempt:
+                parse_stats.record(endpoint, "retries")
+            async def complete(timeout, attempt_messages=attempt_messages):
+                async with llm_slots:
+                    return await llm.complete(attempt_messages, temperature, JSON_MODE, timeout)
+
+            started = time.monotonic()
+            try:
+                with metrics.stage("upstream"):
+                    reply = await with_retries(complete, RETRY_DEADLINE, RETRY_ATTEMPTS, LLM_TIMEOUT,
+                                               retryable=lambda error: isinstance(error, ProviderError) and error.retryable)
+            except ProviderError as exc:
+                if decision is not None:
+                    record_tier(endpoint, "large", "error", time.monotonic() - started)
+                raise provider_error_response(exc)
+            content = reply.text
+            model = f"{reply.provider}:{reply.model}"
+            record_tokens(template, attempt_messages, content, model)
+
+            # Only cache replies we can actually use; a bad reply should be retried next time
+            result, outcome = parse_model_reply(endpoint, content, prompt, model)
+            if decision is not None:
+                record_tier(endpoint, "large", "answered" if result is not None else "parse_failure", time.monotonic() - started)
+            if result is not None:
+                if decision is not None:
+                    cascade_stats.record_answer("large")
+                    result["cascade"] = {"tier": "large", "escalated": decision.reason, "first_pass_confidence": decision.confidence}
+                return await keep(json.dumps(result))
+            attempt_messages = messages + [
+                {"role": "assistant", "content": content or ""},
+                {"role": "user", "content": RETRY_PROMPT},
+            ]
+        return content
+
+    return await inflight.do(key, call_model, lambda: result_cache.published(key))
+
+async def stream_model(llm, endpoint, code_text, template, temperature=None):
+    """Yield (piece, prompt) as the model's reply is generated; a cached reply is yielded whole.
+
+    prompt is the compacted code the model saw, whose line numbers still have to be
+    mapped back, or None for a cached reply (already in original line numbers).
+    """
+    key = make_key(endpoint, MODEL, temperature, code_text, template.id)
+    cached = await result_cache.aget(key)
+    metrics.cache.inc(metrics.current_endpoint.get(), "miss" if cached is None else "hit")
+    if cached is not None:
+        yield cached, None
+        return
+
+    prompt = compact_prompt_code(endpoint, code_text)
+    messages = template.messages(prompt.text)
+    parts, model = [], None
+    with metrics.stage("upstream"):
+        async with llm_slots:
+            async for piece, model in llm.stream(messages, temperature, JSON_MODE, LLM_TIMEOUT):
+                parts.append(piece)
+                yield piece, prompt
+
+    content = "".join(parts)
+    record_tokens(template, messages, content, model)
+    result, _ = parse_model_reply(endpoint, content, prompt, model)
+    if result is not None:
+        await result_cache.aset(key, json.dumps(result))
+
+# Files over this many (estimated) tokens are split on function/class boundaries
+# and the chunks are reviewed concurrently
+CHUNK_TOKENS = int(os.getenv("DETECTAI_CHUNK_TOKENS", "4000"))
+
+async def review_in_chunks(llm, endpoint, task, chunks, template):
+    """Review every chunk concurrently and merge the findings with file-level line numbers."""
+    async def review(chunk):
+        reply = await ask_model(llm, endpoint, chunk.text, template)
+        try:
+            return json.loads(reply)
+        except (TypeError, json.JSONDecodeError):
+            return None
+
+    results = await asyncio.gather(*(review(chunk) for chunk in chunks))
+    merged = merge_results(task, chunks, results)
+    reports = [result["compaction"] for result in results if isinstance(result, dict) and "compaction" in result]
+    if reports:
+        merged["compaction"] = {field: sum(report.get(field, 0) for report in reports) for field in reports[0]}
+    return merged
+
+# Function-level memo (units.py): findings are remembered per top-level unit under a
+# whitespace- and comment-insensitive fingerprint, so reviewing an edited file only
+# sends the units that changed. DETECTAI_UNIT_DB keeps the memo across restarts;
+# DETECTAI_UNIT_MEMO=0 goes back to reviewing whole files (in chunks).
+UNIT_MEMO = os.getenv("DETECTAI_UNIT_MEMO", "1") != "0"
+unit_memo = ResultCache(
+    max_entries=int(os.getenv("DETECTAI_UNIT_MEMO_SIZE", "20000")),
+    ttl_seconds=float(os.getenv("DETECTAI_UNIT_MEMO_TTL", str(30 * 86400))),
+    db_path=os.getenv("DETECTAI_UNIT_DB") or None,
+    shared=shared_state,
+    namespace="unit:",
+)
+
+def unit_key(task, template, unit):
+    return make_key(f"unit:{task}", MODEL, None, unit.fingerprint, template.id)
+
+def split_batch_result(task, batch, result):
+    """Split the findings in the reply for a batch of units into unit-relative findings.
+
+    batch is [(line offset in the batch, unit)]. Findings go to the unit their line falls
+    in; findings without a line inside some unit are dropped.
+    """
+    per_unit = [{key: [] for key in LIST_KEYS[task]} for _ in batch]
+    for key in LIST_KEYS[task]:
+        for item in result.get(key) or []:
+            line = item.get("line") if isinstance(item, dict) else None
+            index = next((i for i, (offset, unit) in enumerate(batch)
+                          if isinstance(line, int) and offset < line <= offset + unit.line_count), None)
+            if index is not None:
+                per_unit[index][key].append({**item, "line": line - batch[index][0]})
+    return per_unit
+
+async def review_units(llm, endpoint, task, code_text, language, template):
+    """Review a file unit by unit; only units without memoized findings go to the model."""
+    units = split_into_units(code_text, language, CHUNK_TOKENS)
+    results, missed = [None] * len(units), []
+    memos = await asyncio.gather(*(unit_memo.aget(unit_key(task, template, unit)) for unit in units))
+    for index, (unit, memo) in enumerate(zip(units, memos)):
+        if memo is None:
+            missed.append(index)
+            continue
+        memo = json.loads(memo)
+        results[index] = {
+            key: relocate(memo["result"].get(key) or [], memo["anchors"], anchors(unit.text))
+            for key in LIST_KEYS[task]
+        }
+    metrics.cache.inc(metrics.current_endpoint.get(), "unit_hit", amount=len(units) - len(missed))
+    metrics.cache.inc(metrics.current_endpoint.get(), "unit_miss", amount=len(missed))
+
+    # Changed units are packed in file order into batches of up to CHUNK_TOKENS
+    batches, size = [], 0
+    for index in missed:
+        tokens = estimate_tokens(units[index].text)
+        if not batches or size + tokens > CHUNK_TOKENS:
+            batches.append([])
+            size = 0
+        batches[-1].append(index)
+        size += tokens
+
+    async def review(batch):
+        reply = await ask_model(llm, endpoint, "\n".join(units[index].text for index in batch), template)
+        try:
+            result = json.loads(reply)
+        except (TypeError, json.JSONDecodeError):
+            return None
+        return result if isinstance(result, dict) else None
+
+    reports = []
+    for batch, result in zip(batches, await asyncio.gather(*(review(batch) for batch in batches))):
+        if result is None:
+            continue  # not memoized, so the next review tries these units again
+        report = result.pop("compaction", None)
+        if report is not None:
+            reports.append(report)
+        offsets, offset = [], 0
+        for index in batch:
+            offsets.append((offset, units[index]))
+            offset += units[index].line_count
+        # The free-text fields describe the whole batch, so they are reported but never memoized
+        notes = {key: result[key] for key in TEXT_KEYS[task] + POINT_KEYS[task] if key in result}
+        for index, unit_result in zip(batch, split_batch_result(task, offsets, result)):
+            results[index] = {**unit_result, **notes} if index == batch[0] else unit_result
+            if report and report.get("lines_cut"):
+                continue  # the model only saw part of these units; review them again next time
+            memo = {"anchors": anchors(units[index].text), "result": unit_result}
+            await unit_memo.aset(unit_key(task, template, units[index]), json.dumps(memo))
+
+    merged = merge_results(task, units, results)
+    del merged["chunks"]
+    merged["units"] = {"total": len(units), "reviewed": len(missed), "memoized": len(units) - len(missed)}
+    if reports:
+        merged["compaction"] = {field: sum(report.get(field, 0) for report in reports) for field in reports[0]}
+    return merged
+
+async def review_file(llm, endpoint, task, code_text, language, template):
+    """Review a whole file for "analyze" or "scan": unit by unit, or in chunks with the memo off."""
+    if UNIT_MEMO:
+        return await review_units(llm, endpoint, task, code_text, language, template)
+    chunks = make_chunks(code_text, CHUNK_TOKENS, language)
+    if len(chunks) > 1:
+        return await review_in_chunks(llm, endpoint, task, chunks, template)
+    reply = await ask_model(llm, endpoint, code_text, template)
+    try:
+        result = json.loads(reply)
+    except (TypeError, json.JSONDecodeError):
+        result = None
+    return result if isinstance(result, dict) else {"summary": "Parsing failed", "raw": reply}
 
 # Define the input schema for requests
 # This ensures we receive JSON like: {"code": "some code here"}
 class CodeInput(BaseModel):
     code: str
 
+# /security-scan also takes an optional scan mode: "full", "narrow" or "local"
+class ScanInput(CodeInput):
+    mode: Optional[str] = None
+
+# /review runs several tasks ("facets") on the same code; all four by default
+class ReviewInput(ScanInput):
+    facets: Optional[List[str]] = None
+
+# Incremental endpoints take the new code plus either the result_id of an earlier
+# review or the earlier version of the code
+class IncrementalInput(CodeInput):
+    base_result_id: Optional[str] = None
+    base_code: Optional[str] = None
+
+# Review tasks runnable outside their own endpoint (batch jobs, full review):
+# task -> (cache endpoint, prompt template, temperature, response key)
+REVIEW_TASKS = {
+    "analyze": ("/uploadFileToAnalyze", ANALYSIS_PROMPT, None, "analysis"),
+    "optimize": ("/uploadFileToOptimize", OPTIMIZATION_PROMPT, None, "optimization"),
+    "summarize": ("/uploadFileToSummarize", SUMMARY_PROMPT, None, "summarization"),
+    "scan": ("/uploadFileToScan", SCAN_PROMPT, None, "scan"),
+}
+
+async def run_review(llm, task, code_text, language=None, mode=None):
+    """Run one review task on a piece of code and return the parsed result."""
+    endpoint, template, temperature, _ = REVIEW_TASKS[task]
+    if task == "scan":
+        return await scan_code(llm, endpoint, code_text, mode, language)
+    if task == "analyze":
+        return await review_file(llm, endpoint, task, code_text, language, template)
+
+    reply = await ask_model(llm, endpoint, code_text, template, temperature)
+    try:
+        return json.loads(reply)
+    except (TypeError, json.JSONDecodeError):
+        return {"summary": "⚠️ JSON parsing failed.", "raw": reply}
+
+# Security scans run the local rule engine (rules.py) before any model call:
+#   full   - rules + model scan of the whole file, findings merged (default)
+#   narrow - the model only sees the regions the rules flagged; no call if nothing is flagged
+#   local  - rules only, no model call
+SCAN_MODES = ("full", "narrow", "local")
+SCAN_MODE = os.getenv("DETECTAI_SCAN_MODE", "full")
+
+async def scan_code(llm, endpoint, code_text, mode=None, language=None):
+    mode = mode or SCAN_MODE
+    if mode not in SCAN_MODES:
+        raise HTTPException(status_code=400, detail=f"Unknown scan mode '{mode}'. Use one of: {', '.join(SCAN_MODES)}.")
+
+    static = static_scan(code_text)
+    if mode == "local" or (mode == "narrow" and not static):
+        return {**local_result(static), "mode": mode}
+
+    if mode == "narrow":
+        result = await review_in_chunks(llm, endpoint, "scan", suspicious_regions(code_text, static), SCAN_PROMPT)
+    else:
+        result = await review_file(llm, endpoint, "scan", code_text, language, SCAN_PROMPT)
+
+    result["vulnerabilities"] = merge_findings(result.get("vulnerabilities") or [], static)
+    result["mode"] = mode
+    return result
+
 # Simple root endpoint (to check if backend is running)
 @app.get("/")
 def root():
     return {"message": "Backend is running!"}
 
+@app.get("/cache/stats")
+def cache_stats():
+    compaction = {**compaction_totals, "tokens_saved": compaction_totals["original_tokens"] - compaction_totals["prompt_tokens"]}
+    return {**result_cache.stats(), "singleflight": inflight.stats(), "compaction": compaction, "units": unit_memo.stats(),
+            "semantic": semantic_cache.stats() if semantic_cache is not None else None,
+            "shared_state": shared_state.stats() if shared_state is not None else None}
+
+@app.get("/providers/stats")
+def provider_stats():
+    return llm_router.stats()
+
+# Past findings, newest first, filtered by any of severity / vulnerability_type / category /
+# file / task (comma-separated values match any) and a since/until time range (epoch seconds).
+# Pages are fetched with the next_cursor of the previous page.
+@app.get("/findings")
+def list_findings(
+    severity: Optional[str] = None, vulnerability_type: Optional[str] = None, category: Optional[str] = None,
+    file: Optional[str] = None, task: Optional[str] = None, since: Optional[float] = None,
+    until: Optional[float] = None, cursor: Optional[str] = None, limit: int = 50,
+):
+    filters = finding_filters(severity, vulnerability_type, category, file, task)
+    try:
+        return findings_enabled().query(filters, since, until, cursor, limit)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+# Finding counts per severity, vulnerability_type, category, file, task or day, with the same filters
+@app.get("/findings/summary")
+def summarize_findings(
+    group_by: str = "severity", severity: Optional[str] = None, vulnerability_type: Optional[str] = None,
+    category: Optional[str] = None, file: Optional[str] = None, task: Optional[str] = None,
+    since: Optional[float] = None, until: Optional[float] = None,
+):
+    if group_by not in FINDING_GROUPS:
+        raise HTTPException(status_code=400, detail=f"Unknown group_by '{group_by}'. Use one of: {', '.join(FINDING_GROUPS)}.")
+    filters = finding_filters(severity, vulnerability_type, category, file, task)
+    return findings_enabled().summary(group_by, filters, since, until)
+
+@app.get("/findings/stats")
+def findings_statistics():
+    return findings_enabled().stats()
+
+def findings_enabled():
+    if findings_store is None:
+        raise HTTPException(status_code=404, detail="The findings store is turned off (DETECTAI_FINDINGS=0).")
+    return findings_store
+
+def finding_filters(*values):
+    # The file filter is one path, which may itself contain commas
+    return {
+        name: ([value] if name == "file" else [part.strip() for part in value.split(",")]) if value else []
+        for name, value in zip(FINDING_FILTERS, values)
+    }
+
+@app.get("/cascade/stats")
+def cascade_statistics():
+    return {"enabled": cascade_router is not None, "policy": escalation_policy._asdict(), **cascade_stats.stats()}
+
+@app.get("/parse/stats")
+def parse_statistics():
+    return parse_stats.stats()
+
+# Prometheus scrape endpoint: request, stage and token histograms plus cache/parse counters
+@app.get("/metrics")
+def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 @app.post("/analyze")
-def analyze_code(input: CodeInput):
+async def analyze_code(input: CodeInput, llm: ProviderRouter = Depends(get_llm)):
 
     code_text = input.code.strip()
 
-    # 🔎 Simple heuristic: look for keywords or symbols
-    code_pattern = re.compile(r"(class |def |public |function |\{|\};|;|\(|\))", re.MULTILINE)
-    if not code_pattern.search(code_text):
+    # 🔎 Quick check that the input looks like source code
+    detection = detect(code_text)
+    if not detection.is_code:
         return {
             "errors": [],
             "errorMsg": "⚠️ The input does not appear to be source code. Please paste a valid code snippet."
         }
 
-    messages=[
-        {"role": "system", "content": "You are a code review assistant."},
-        {"role": "user", "content": f"""
-Analyze the following code and return ONLY a JSON object in this exact structure:
-
-{{
-  "errors": [
-    {{
-      "line": <line_number>,                
-      "description": "<short explanation>", 
-      "code": "<exact code from that line>",
-      "fix_suggestion": "<how to fix in words>",
-      "corrected_code": "<corrected line or snippet>"
-      "severity": "<Critical|Major|Minor>",
-      "category": "<Runtime Error|Logic Error|Best Practice|Syntax Error>"
-    }}
-  ],
-  "fixes": [
-    {{
-      "line": <line_number>,
-      "suggestion": "<how to fix>",
-      "corrected_code": "<corrected code line>"
-    }}
-  ],
-  "summary": "2-3 sentence overall summary of the code",
-  "functionality": [
-    "key functionality point 1",
-    "key functionality point 2"
-  ],
-  "conclusion": "short final remark about overall code quality"
-}}
-
-Rules:
-    - Always include the line numbers for each error (best estimate based on the code).
-    - Line numbers exactly match the provided code (count from 1).
-    - The 'input' field contains the actual line text, escaped for JSON.
-    - Use concise descriptions.
-    - If there are no errors, return empty arrays for 'errors' and 'fixes'.
-    - Do NOT include any text outside of the JSON.
-    - Use one of the predefined severity and category labels.
-
-Code:
-{input}
-        """}
-    ]
-
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=messages
-    )
-
-    # Parse response safely
-    try:
-        analysis = json.loads(response.choices[0].message.content)
-    except json.JSONDecodeError:
-        analysis = {
-            "summary": "Parsing failed",
-            "raw": response.choices[0].message.content
-        }
+    # Only functions/classes not reviewed before go to the model; findings are merged back
+    analysis = await review_file(llm, "/analyze", "analyze", code_text, detection.language, ANALYSIS_PROMPT)
 
-    return {"analysis": analysis}
+    return await record_findings({"language": detection.language, "analysis": analysis, "result_id": await remember_result("analyze", code_text, analysis)}, code_text)
 
 # New endpoint to handle file uploads
 @app.post("/upload")
-async def upload_file(file: UploadFile = File(...)):
-    content = await file.read()
-    code_text = content.decode("utf-8")  # assumes text file/code file
+async def upload_file(file: UploadFile = File(...), llm: ProviderRouter = Depends(get_llm)):
+    code_text = (await read_upload(file, MAX_UPLOAD_BYTES)).text.strip()
 
-    code_text = input.code.strip()
-
-    # 🔎 Simple heuristic: look for keywords or symbols
-    code_pattern = re.compile(r"(class |def |public |function |\{|\};|;|\(|\))", re.MULTILINE)
-    if not code_pattern.search(code_text):
+    # 🔎 Quick check that the input looks like source code
+    detection = detect(code_text, file.filename)
+    if not detection.is_code:
         return {
             "errors": [],
             "message": "⚠️ The input does not appear to be source code. Please paste a valid code snippet."
         }
         
-    messages=[
-            {"role": "system", "content": "You are a code review assistant."},
-            {"role": "user", "content": f"""
-    Analyze the following code and return ONLY a JSON object in this exact structure:
-
-    {{
-    "errors": [
-    {{
-      "line": <line_number>,                
-      "description": "<short explanation>", 
-      "code": "<exact code from that line>",
-      "fix_suggestion": "<how to fix in words>",
-      "corrected_code": "<corrected line or snippet>",
-      "severity": "<Critical|Major|Minor>",
-      "category": "<Runtime Error|Logic Error|Best Practice|Syntax Error>"
-    }}
-  ],
-    "fixes": [
-    {{
-      "line": <line_number>,
-      "suggestion": "<how to fix>",
-      "corrected_code": "<corrected code line>"
-    }}
-  ],
-    "summary": "2-3 sentence overall summary of the code",
-    "functionality": [
-        "key functionality point 1",
-        "key functionality point 2"
-    ],
-    "conclusion": "short final remark about overall code quality"
-    }}
-
-    Rules:
-    - Always include the line numbers for each error (best estimate based on the code).
-    - Line numbers exactly match the provided code (count from 1).
-    - The 'input' field contains the actual line text, escaped for JSON.
-    - Use concise descriptions.
-    - If there are no errors, return empty arrays for 'errors' and 'fixes'.
-    - Do NOT include any text outside of the JSON.
-    - Use one of the predefined severity and category labels.
-
-    Code:
-    {input}
-            """}
-        ]
-
     # Call OpenAI to analyze code
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=messages
-    )
+    reply = await ask_model(llm, "/upload", code_text, ANALYSIS_PROMPT)
 
-    # return {"filename": file.filename, "analysis": response.choices[0].message.content}
-     # Try parsing JSON safely
+    # Try parsing JSON safely
     try:
-        analysis = json.loads(response.choices[0].message.content)
+        analysis = json.loads(reply)
     except json.JSONDecodeError:
-        analysis = {"summary": "Parsing failed", "raw": response.choices[0].message.content}
+        analysis = {"summary": "Parsing failed", "raw": reply}
 
-    return {"filename": file.filename, "analysis": analysis}
+    return await record_findings({"filename": file.filename, "language": detection.language, "analysis": analysis}, code_text, file.filename)
 
 @app.post("/optimize")
-def optimize_code(input: CodeInput):
-    print("Received code for optimization:", input.code)
+async def optimize_code(input: CodeInput, llm: ProviderRouter = Depends(get_llm)):
     code_text = input.code.strip()
 
     # simple validation like your /analyze
-    code_pattern = re.compile(r"(class |def |public |function |\{|\};|;|\(|\))", re.MULTILINE)
-    if not code_pattern.search(code_text):
+    detection = detect(code_text)
+    if not detection.is_code:
         return {
             "errors": [],
             "errorMsg": "⚠️ The input does not appear to be source code. Please paste a valid code snippet."
         }
 
-    # prompt for GPT
-    messages = [
-        {"role": "system", "content": "You are a senior software engineer who specializes in writing clean, efficient, optimized code."},
-        {"role": "user", "content": f"""
-Optimize the following code and return ONLY a JSON object in this structure:
-
-{{
-  "optimized_code": "<optimized version of the input code>",
-  "explanation": [
-    "point 1: what was optimized",
-    "point 2: why it improves efficiency",
-    "point 3: effect on readability, performance, or complexity"
-  ],
-  "complexity_analysis": {{
-    "before": "<estimated time/space complexity before optimization>",
-    "after": "<estimated time/space complexity after optimization>"
-  }},
-  "remarks": "short summary of improvements"
-}}
-
-Rules:
-- Focus on improving efficiency (time/space), readability, and maintainability.
-- Preserve logic and output correctness.
-- Always return valid JSON and no other text.
-- Use bullet points in explanation.
-- If no optimization possible, say so explicitly in 'remarks'.
-
-Code:
-{code_text}
-        """}
-    ]
-
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=messages,
-        temperature=0.3
-    )
+    content = await ask_model(llm, "/optimize", code_text, OPTIMIZATION_PROMPT, temperature=0.3)
 
     try:
-        optimization = json.loads(response.choices[0].message.content)
+        optimization = json.loads(content)
     except json.JSONDecodeError:
         optimization = {
             "optimized_code": "",
             "explanation": ["⚠️ Parsing failed"],
-            "raw": response.choices[0].message.content
+            "raw": content
         }
 
-    return {"optimization": optimization}
+    return {"language": detection.language, "optimization": optimization}
 
 @app.post("/summarize")
-def summarize_code(input: CodeInput):
+async def summarize_code(input: CodeInput, llm: ProviderRouter = Depends(get_llm)):
     """
     Accepts JSON: { "code": "<...>" }
     Returns: { "summarization": { "summary": "...", "detailed_explanation": "...", "key_points": [...] } }
@@ -261,408 +781,610 @@ def summarize_code(input: CodeInput):
     code_text = input.code.strip()
 
     # quick heuristic check (same as /analyze)
-    code_pattern = re.compile(r"(class |def |public |function |\{|\};|;|\(|\))", re.MULTILINE)
-    if not code_pattern.search(code_text):
+    detection = detect(code_text)
+    if not detection.is_code:
         return {
             "errors": [],
             "errorMsg": "⚠️ The input does not appear to be source code. Please paste a valid code snippet."
         }
 
-    messages = [
-        {"role": "system", "content": "You are an expert senior developer who writes concise, accurate code summaries."},
-        {"role": "user", "content": f"""
-Summarize the code below. Return ONLY a JSON object with this exact structure (no extra text):
-
-{{
-  "summary": "<one- to two-sentence high-level summary of what the code does>",
-  "detailed_explanation": "<2-4 sentence explanation of how the code works, important functions and flow>",
-  "key_points": [
-    "bullet point 1",
-    "bullet point 2",
-    "bullet point 3"
-  ]
-}}
-
-Rules:
-- Keep JSON strictly valid.
-- When you list key_points, keep them short (6-12 words each).
-- Do NOT include examples or extra commentary outside the JSON.
-- If code is too short or trivial, still return valid JSON with concise fields.
-
-Code:
-{code_text}
-        """}
-    ]
-
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=messages,
-        temperature=0.2
-    )
+    content = await ask_model(llm, "/summarize", code_text, SUMMARY_PROMPT, temperature=0.2)
 
     try:
-        result = json.loads(response.choices[0].message.content)
+        result = json.loads(content)
     except json.JSONDecodeError:
         # return safe structure on parse failure
         result = {
             "summary": "",
             "detailed_explanation": "Parsing failed — model returned non-JSON output.",
             "key_points": [],
-            "raw": response.choices[0].message.content
+            "raw": content
         }
 
-    return {"summarization": result}
+    return {"language": detection.language, "summarization": result}
 
 
 @app.post("/security-scan")
-def scan_vulnerabilities(input: CodeInput):
+async def scan_vulnerabilities(input: ScanInput, llm: ProviderRouter = Depends(get_llm)):
     code_text = input.code.strip()
 
     # Quick validation
     if not code_text:
         return {"errorMsg": "No code provided."}
 
-    code_pattern = re.compile(r"(class |def |public |function |\{|\};|;|\(|\))", re.MULTILINE)
-    if not code_pattern.search(code_text):
+    detection = detect(code_text)
+    if not detection.is_code:
         return {
             "errors": [],
             "errorMsg": "⚠️ The input does not appear to be source code. Please paste a valid code snippet."
         }
         
-    messages = [
-        {"role": "system", "content": "You are a cybersecurity code scanning assistant."},
-        {"role": "user", "content": f"""
-Scan the following code for **security vulnerabilities** and return ONLY JSON strictly in this structure:
-
-{{
-  "vulnerabilities": [
-    {{
-      "line": <line_number>,
-      "description": "<short description of issue>",
-      "vulnerability_type": "<SQL Injection | XSS | Hardcoded Secret | etc.>",
-      "severity": "<Critical | High | Medium | Low>",
-      "fix_suggestion": "<how to fix>"
-    }}
-  ],
-  "summary": "Brief summary of the overall code security",
-  "recommendations": [
-    "Recommendation 1",
-    "Recommendation 2"
-  ]
-}}
-
-Rules:
-- If no vulnerabilities are found, return empty array for 'vulnerabilities'.
-- Only return valid JSON (no extra text).
-- Line numbers must correspond to provided code.
-Code:
-{code_text}
-        """}
-    ]
-
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=messages
-    )
-
+    # Local rules first, then the model (unless mode says otherwise)
+    result = await scan_code(llm, "/security-scan", code_text, input.mode, detection.language)
+
+    return await record_findings({"language": detection.language, "scan": result, "result_id": await remember_result("scan", code_text, result)}, code_text)
+
+# Streaming variants: each finished item of the listed arrays is sent as its own event
+# (NDJSON, or SSE when the client accepts text/event-stream), then a final "done" event.
+# task -> (cache endpoint, prompt template, temperature, response key, streamed arrays)
+STREAM_TASKS = {
+    "analyze": ("/analyze", ANALYSIS_PROMPT, None, "analysis", ("errors", "fixes")),
+    "optimize": ("/optimize", OPTIMIZATION_PROMPT, 0.3, "optimization", ("explanation",)),
+    "summarize": ("/summarize", SUMMARY_PROMPT, 0.2, "summarization", ("key_points",)),
+    "scan": ("/security-scan", SCAN_PROMPT, None, "scan", ("vulnerabilities",)),
+}
+
+async def stream_review(llm, task, code_text, sse):
+    endpoint, template, temperature, result_key, keys = STREAM_TASKS[task]
+    items = JsonItemStream(keys)
+
+    # Static findings are known before the model starts, so they go out first
+    static = static_scan(code_text) if task == "scan" else []
+    for finding in static:
+        yield format_event("item", {"key": "vulnerabilities", "item": finding}, sse)
+
+    prompt = None
     try:
-        result = json.loads(response.choices[0].message.content)
-    except json.JSONDecodeError:
-        result = {
-            "summary": "Parsing failed.",
-            "raw": response.choices[0].message.content
+        async for piece, prompt in stream_model(llm, endpoint, code_text, template, temperature):
+            for key, item in items.feed(piece):
+                if prompt is not None:
+                    restore_lines({key: [item]}, prompt.line_map)
+                yield format_event("item", {"key": key, "item": item}, sse)
+    except ProviderError as exc:
+        yield format_event("error", {"detail": provider_error_response(exc).detail}, sse)
+        return
+    except HTTPException as exc:
+        yield format_event("error", {"detail": exc.detail}, sse)
+        return
+
+    # Streamed replies can't be retried mid-stream, but they still get the local repair pass
+    result, _ = parse_reply(items.text, RESPONSE_MODELS[task])
+    if result is None:
+        result = {"summary": "Parsing failed", "raw": items.text}
+    elif prompt is not None:
+        restore_lines(result, prompt.line_map)
+        result["compaction"] = prompt.report()
+    if static and isinstance(result, dict):
+        result["vulnerabilities"] = merge_findings(result.get("vulnerabilities") or [], static)
+    yield format_event("done", {result_key: result}, sse)
+
+def stream_task(request: Request, llm, task, code):
+    code_text = code.strip()
+    if not detect(code_text).is_code:
+        return {
+            "errors": [],
+            "errorMsg": "⚠️ The input does not appear to be source code. Please paste a valid code snippet."
         }
+    sse = "text/event-stream" in request.headers.get("accept", "")
+    return StreamingResponse(
+        stream_review(llm, task, code_text, sse),
+        media_type="text/event-stream" if sse else "application/x-ndjson",
+    )
 
-    return {"scan": result}
+@app.post("/analyze/stream")
+async def analyze_code_stream(input: CodeInput, request: Request, llm: ProviderRouter = Depends(get_llm)):
+    return stream_task(request, llm, "analyze", input.code)
 
-@app.post("/uploadFileToAnalyze")
-async def upload_file_to_analyze(file: UploadFile = File(...)):
-    import re, json
-    from openai import OpenAI
+@app.post("/optimize/stream")
+async def optimize_code_stream(input: CodeInput, request: Request, llm: ProviderRouter = Depends(get_llm)):
+    return stream_task(request, llm, "optimize", input.code)
+
+@app.post("/summarize/stream")
+async def summarize_code_stream(input: CodeInput, request: Request, llm: ProviderRouter = Depends(get_llm)):
+    return stream_task(request, llm, "summarize", input.code)
 
-    client = OpenAI()
+@app.post("/security-scan/stream")
+async def scan_vulnerabilities_stream(input: CodeInput, request: Request, llm: ProviderRouter = Depends(get_llm)):
+    return stream_task(request, llm, "scan", input.code)
 
+@app.post("/uploadFileToAnalyze")
+async def upload_file_to_analyze(file: UploadFile = File(...), llm: ProviderRouter = Depends(get_llm)):
     # ✅ Read uploaded file
-    content = await file.read()
-    code_text = content.decode("utf-8")
+    code_text = (await read_upload(file, MAX_UPLOAD_BYTES)).text
 
     # ✅ Detect if it looks like code
-    code_pattern = re.compile(r"(class |def |public |function |\{|\};|;|\(|\))", re.MULTILINE)
-    if not code_pattern.search(code_text):
+    detection = detect(code_text, file.filename)
+    if not detection.is_code:
         return {
             "errors": [],
             "message": "⚠️ The uploaded file does not appear to contain source code."
         }
 
-    # ✅ Build LLM prompt using the actual code
-    messages = [
-        {"role": "system", "content": "You are a code review assistant."},
-        {"role": "user", "content": f"""
-Analyze the following code and return ONLY a JSON object in this exact structure:
-
-{{
-  "errors": [
-    {{
-      "line": <line_number>,
-      "description": "<short explanation>",
-      "code": "<exact code from that line>",
-      "fix_suggestion": "<how to fix in words>",
-      "corrected_code": "<corrected line or snippet>",
-      "severity": "<Critical|Major|Minor>",
-      "category": "<Runtime Error|Logic Error|Best Practice|Syntax Error>"
-    }}
-  ],
-  "fixes": [
-    {{
-      "line": <line_number>,
-      "suggestion": "<how to fix>",
-      "corrected_code": "<corrected code line>"
-    }}
-  ],
-  "summary": "2-3 sentence overall summary of the code",
-  "functionality": [
-    "key functionality point 1",
-    "key functionality point 2"
-  ],
-  "conclusion": "short final remark about overall code quality"
-}}
-
-Rules:
-- Always include accurate line numbers.
-- No text outside the JSON.
-- If there are no errors, return empty arrays.
-
-Code:
-{code_text}
-"""}
-    ]
-
-    # ✅ Call OpenAI (your model)
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=messages
-    )
-
-    # ✅ Try parsing JSON returned by model
-    try:
-        analysis = json.loads(response.choices[0].message.content)
-    except json.JSONDecodeError:
-        analysis = {
-            "summary": "⚠️ JSON parsing failed.",
-            "raw": response.choices[0].message.content
-        }
+    # ✅ Only functions/classes not reviewed before go to the model; findings are merged back
+    analysis = await review_file(llm, "/uploadFileToAnalyze", "analyze", code_text, detection.language, ANALYSIS_PROMPT)
 
-    return {
+    return await record_findings({
         "filename": file.filename,
-        "analysis": analysis
-    }
+        "language": detection.language,
+        "analysis": analysis,
+        "result_id": await remember_result("analyze", code_text, analysis)
+    }, code_text, file.filename)
 
 @app.post("/uploadFileToOptimize")
-async def upload_file_to_optimize(file: UploadFile = File(...)):
-    import re, json
-    from openai import OpenAI
-
-    client = OpenAI()
-
+async def upload_file_to_optimize(file: UploadFile = File(...), llm: ProviderRouter = Depends(get_llm)):
     # ✅ Read uploaded file
-    content = await file.read()
-    code_text = content.decode("utf-8")
+    code_text = (await read_upload(file, MAX_UPLOAD_BYTES)).text
 
     # ✅ Detect if it looks like code
-    code_pattern = re.compile(r"(class |def |public |function |\{|\};|;|\(|\))", re.MULTILINE)
-    if not code_pattern.search(code_text):
+    detection = detect(code_text, file.filename)
+    if not detection.is_code:
         return {
             "errors": [],
             "message": "⚠️ The uploaded file does not appear to contain source code."
         }
 
-    # ✅ Build LLM prompt using the actual code
-    messages = [
-        {"role": "system", "content": "You are a senior software engineer who specializes in writing clean, efficient, optimized code."},
-        {"role": "user", "content": f"""
-Optimize the following code and return ONLY a JSON object in this structure:
-
-{{
-  "optimized_code": "<optimized version of the input code>",
-  "explanation": [
-    "point 1: what was optimized",
-    "point 2: why it improves efficiency",
-    "point 3: effect on readability, performance, or complexity"
-  ],
-  "complexity_analysis": {{
-    "before": "<estimated time/space complexity before optimization>",
-    "after": "<estimated time/space complexity after optimization>"
-  }},
-  "remarks": "short summary of improvements"
-}}
-
-Rules:
-- Focus on improving efficiency (time/space), readability, and maintainability.
-- Preserve logic and output correctness.
-- Always return valid JSON and no other text.
-- Use bullet points in explanation.
-- If no optimization possible, say so explicitly in 'remarks'.
-
-Code:
-{code_text}
-        """}
-    ]
-
-    # ✅ Call OpenAI (your model)
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=messages
-    )
+    # ✅ Call OpenAI (your model) with a prompt built from the code
+    content = await ask_model(llm, "/uploadFileToOptimize", code_text, OPTIMIZATION_PROMPT)
 
     # ✅ Try parsing JSON returned by model
     try:
-        optimization = json.loads(response.choices[0].message.content)
+        optimization = json.loads(content)
     except json.JSONDecodeError:
         optimization = {
             "summary": "⚠️ JSON parsing failed.",
-            "raw": response.choices[0].message.content
+            "raw": content
         }
 
     return {
         "filename": file.filename,
+        "language": detection.language,
         "optimization": optimization
     }
 
 @app.post("/uploadFileToSummarize")
-async def upload_file_to_summarize(file: UploadFile = File(...)):
-    import re, json
-    from openai import OpenAI
-
-    client = OpenAI()
-
+async def upload_file_to_summarize(file: UploadFile = File(...), llm: ProviderRouter = Depends(get_llm)):
     # ✅ Read uploaded file
-    content = await file.read()
-    code_text = content.decode("utf-8")
+    code_text = (await read_upload(file, MAX_UPLOAD_BYTES)).text
 
     # ✅ Detect if it looks like code
-    code_pattern = re.compile(r"(class |def |public |function |\{|\};|;|\(|\))", re.MULTILINE)
-    if not code_pattern.search(code_text):
+    detection = detect(code_text, file.filename)
+    if not detection.is_code:
         return {
             "errors": [],
             "message": "⚠️ The uploaded file does not appear to contain source code."
         }
 
-    # ✅ Build LLM prompt using the actual code
-    messages = [
-        {"role": "system", "content": "You are an expert senior developer who writes concise, accurate code summaries."},
-        {"role": "user", "content": f"""
-Summarize the code below. Return ONLY a JSON object with this exact structure (no extra text):
-
-{{
-  "summary": "<one- to two-sentence high-level summary of what the code does>",
-  "detailed_explanation": "<2-4 sentence explanation of how the code works, important functions and flow>",
-  "key_points": [
-    "bullet point 1",
-    "bullet point 2",
-    "bullet point 3"
-  ]
-}}
-
-Rules:
-- Keep JSON strictly valid.
-- When you list key_points, keep them short (6-12 words each).
-- Do NOT include examples or extra commentary outside the JSON.
-- If code is too short or trivial, still return valid JSON with concise fields.
-
-Code:
-{code_text}
-        """}
-    ]
-
-    # ✅ Call OpenAI (your model)
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=messages
-    )
+    # ✅ Call OpenAI (your model) with a prompt built from the code
+    content = await ask_model(llm, "/uploadFileToSummarize", code_text, SUMMARY_PROMPT)
 
     # ✅ Try parsing JSON returned by model
     try:
-        summarization = json.loads(response.choices[0].message.content)
+        summarization = json.loads(content)
     except json.JSONDecodeError:
         summarization = {
             "summary": "",
             "detailed_explanation": "Parsing failed — model returned non-JSON output.",
             "key_points": [],
-            "raw": response.choices[0].message.content
+            "raw": content
         }
 
     return {
         "filename": file.filename,
+        "language": detection.language,
         "summarization": summarization
     }
 
 @app.post("/uploadFileToScan")
-async def upload_file_to_scan(file: UploadFile = File(...)):
-    import re, json
-    from openai import OpenAI
+async def upload_file_to_scan(file: UploadFile = File(...), mode: Optional[str] = Form(None), llm: ProviderRouter = Depends(get_llm)):
+    # ✅ Read uploaded file
+    code_text = (await read_upload(file, MAX_UPLOAD_BYTES)).text
+
+    # ✅ Detect if it looks like code
+    detection = detect(code_text, file.filename)
+    if not detection.is_code:
+        return {
+            "errors": [],
+            "message": "⚠️ The uploaded file does not appear to contain source code."
+        }
+
+    # ✅ Local rules first, then the model (unless mode says otherwise)
+    scan = await scan_code(llm, "/uploadFileToScan", code_text, mode, detection.language)
+
+    return await record_findings({
+        "filename": file.filename,
+        "language": detection.language,
+        "scan": scan,
+        "result_id": await remember_result("scan", code_text, scan)
+    }, code_text, file.filename)
+
+# Incremental re-review: only the changed hunks (plus a little context) go to the model,
+# findings on unchanged lines are carried forward with shifted line numbers.
+# task -> (cache endpoint, prompt template, finding arrays)
+INCREMENTAL_TASKS = {
+    "analyze": ("/analyze", ANALYSIS_PROMPT, ("errors", "fixes")),
+    "scan": ("/security-scan", SCAN_PROMPT, ("vulnerabilities",)),
+}
+INCREMENTAL_CONTEXT = int(os.getenv("DETECTAI_INCREMENTAL_CONTEXT", "3"))
+# Past this share of changed lines a whole-file review is about as cheap, so do that instead
+INCREMENTAL_MAX_CHANGED = float(os.getenv("DETECTAI_INCREMENTAL_MAX_CHANGED", "0.5"))
+
+async def review_whole(llm, task, code_text, language):
+    endpoint, template, _ = INCREMENTAL_TASKS[task]
+    if task == "scan":
+        return await scan_code(llm, endpoint, code_text, "full", language)
+    return await review_in_chunks(llm, endpoint, task, make_chunks(code_text, CHUNK_TOKENS, language), template)
+
+async def incremental_review(llm, task, code_text, base_code, base_result, language):
+    endpoint, template, keys = INCREMENTAL_TASKS[task]
+    diff = Diff(base_code, code_text)
+    changed = diff.changed_lines()
+    if len(changed) > len(diff.new_lines) * INCREMENTAL_MAX_CHANGED:
+        result = await review_whole(llm, task, code_text, language)
+        result["incremental"] = {"changed_lines": len(changed), "full_review": True}
+        return result
+
+    hunks = diff.hunks(INCREMENTAL_CONTEXT, CHUNK_TOKENS)
+    line_map = diff.line_map()
+    reviewed = await review_in_chunks(llm, endpoint, task, hunks, template) if hunks else {}
+
+    # Only the task's own fields carry over; run metadata (units, cascade, cache hits) was about the base run
+    result = {key: value for key, value in base_result.items() if key in RESPONSE_MODELS[task].model_fields}
+    carried = 0
+    for key in keys:
+        # Static findings are recomputed on the whole new file below
+        previous = [f for f in base_result.get(key) or [] if not (isinstance(f, dict) and f.get("source") == "static")]
+        kept = carry_forward(previous, line_map, hunks)
+        carried += len(kept)
+        result[key] = sorted(kept + reviewed.get(key, []), key=lambda f: f["line"] if isinstance(f.get("line"), int) else 0)
+    if task == "scan":
+        result["vulnerabilities"] = merge_findings(result["vulnerabilities"], static_scan(code_text))
+    if reviewed.get("failed_chunks"):
+        result["failed_chunks"] = reviewed["failed_chunks"]
+    if reviewed.get("compaction"):
+        result["compaction"] = reviewed["compaction"]
+
+    result["incremental"] = {
+        "changed_lines": len(changed),
+        "hunks": len(hunks),
+        "reviewed_lines": sum(chunk.text.count("\n") + 1 for chunk in hunks),
+        "carried_forward": carried,
+        "full_review": False,
+    }
+    return result
+
+async def incremental_request(llm, task, input: IncrementalInput):
+    code_text = input.code.strip()
+    detection = detect(code_text)
+    if not detection.is_code:
+        return {
+            "errors": [],
+            "errorMsg": "⚠️ The input does not appear to be source code. Please paste a valid code snippet."
+        }
+
+    if input.base_result_id:
+        stored = await review_history.aget(input.base_result_id)
+        if stored is None:
+            raise HTTPException(status_code=404, detail="Unknown or expired base_result_id. Send base_code instead.")
+        base = json.loads(stored)
+        if base["task"] != task:
+            raise HTTPException(status_code=400, detail=f"base_result_id belongs to a '{base['task']}' review.")
+        base_code, base_result = base["code"], base["result"]
+    elif input.base_code is not None:
+        base_code = input.base_code.strip()
+        base_result = await review_whole(llm, task, base_code, detection.language)
+    else:
+        raise HTTPException(status_code=400, detail="Send either base_result_id or base_code.")
+
+    result = await incremental_review(llm, task, code_text, base_code, base_result, detection.language)
+    return await record_findings({
+        "language": detection.language,
+        REVIEW_TASKS[task][3]: result,
+        "result_id": await remember_result(task, code_text, result),
+    }, code_text)
+
+@app.post("/analyze/incremental")
+async def analyze_code_incremental(input: IncrementalInput, llm: ProviderRouter = Depends(get_llm)):
+    return await incremental_request(llm, "analyze", input)
+
+@app.post("/security-scan/incremental")
+async def scan_vulnerabilities_incremental(input: IncrementalInput, llm: ProviderRouter = Depends(get_llm)):
+    return await incremental_request(llm, "scan", input)
+
+# Full review: one ingestion and validation step, then the selected facets run concurrently
+async def full_review(llm, code_text, language, facets, mode):
+    facets = facets or list(REVIEW_TASKS)
+    unknown = [facet for facet in facets if facet not in REVIEW_TASKS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown facet(s) {', '.join(unknown)}. Use any of: {', '.join(REVIEW_TASKS)}.")
+    facets = list(dict.fromkeys(facets))
+
+    async def run_facet(task):
+        try:
+            return await run_review(llm, task, code_text, language, mode)
+        except HTTPException as exc:
+            return {"error": exc.detail}
+
+    results = await asyncio.gather(*(run_facet(task) for task in facets))
+    return {REVIEW_TASKS[task][3]: result for task, result in zip(facets, results)}
+
+@app.post("/review")
+async def review_code(input: ReviewInput, llm: ProviderRouter = Depends(get_llm)):
+    code_text = input.code.strip()
 
-    client = OpenAI()
+    detection = detect(code_text)
+    if not detection.is_code:
+        return {
+            "errors": [],
+            "errorMsg": "⚠️ The input does not appear to be source code. Please paste a valid code snippet."
+        }
 
+    results = await full_review(llm, code_text, detection.language, input.facets, input.mode)
+    return await record_findings({"language": detection.language, **results}, code_text)
+
+@app.post("/uploadFileToReview")
+async def upload_file_to_review(
+    file: UploadFile = File(...),
+    facets: Optional[str] = Form(None),  # comma-separated, e.g. "analyze,scan"
+    mode: Optional[str] = Form(None),
+    llm: ProviderRouter = Depends(get_llm),
+):
     # ✅ Read uploaded file
-    content = await file.read()
-    code_text = content.decode("utf-8")
+    code_text = (await read_upload(file, MAX_UPLOAD_BYTES)).text
 
     # ✅ Detect if it looks like code
-    code_pattern = re.compile(r"(class |def |public |function |\{|\};|;|\(|\))", re.MULTILINE)
-    if not code_pattern.search(code_text):
+    detection = detect(code_text, file.filename)
+    if not detection.is_code:
         return {
             "errors": [],
             "message": "⚠️ The uploaded file does not appear to contain source code."
         }
 
-    # ✅ Build LLM prompt using the actual code
-    messages = [
-        {"role": "system", "content": "You are a cybersecurity code scanning assistant."},
-        {"role": "user", "content": f"""
-Scan the following code for **security vulnerabilities** and return ONLY JSON strictly in this structure:
-
-{{
-  "vulnerabilities": [
-    {{
-      "line": <line_number>,
-      "description": "<short description of issue>",
-      "vulnerability_type": "<SQL Injection | XSS | Hardcoded Secret | etc.>",
-      "severity": "<Critical | High | Medium | Low>",
-      "fix_suggestion": "<how to fix>"
-    }}
-  ],
-  "summary": "Brief summary of the overall code security",
-  "recommendations": [
-    "Recommendation 1",
-    "Recommendation 2"
-  ]
-}}
-
-Rules:
-- If no vulnerabilities are found, return empty array for 'vulnerabilities'.
-- Only return valid JSON (no extra text).
-- Line numbers must correspond to provided code.
-Code:
-{code_text}
-        """}
-    ]
-
-    # ✅ Call OpenAI (your model)
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=messages
-    )
+    selected = [facet.strip() for facet in facets.split(",") if facet.strip()] if facets else None
+    results = await full_review(llm, code_text, detection.language, selected, mode)
+    return await record_findings({"filename": file.filename, "language": detection.language, **results}, code_text, file.filename)
+
+# Batch review of a whole repository uploaded as a zip or tarball
+BATCH_MAX_BYTES = int(os.getenv("DETECTAI_BATCH_MAX_BYTES", str(50 * 1024 * 1024)))
+BATCH_MAX_FILE_BYTES = int(os.getenv("DETECTAI_BATCH_MAX_FILE_BYTES", str(1024 * 1024)))
+BATCH_MAX_FILES = int(os.getenv("DETECTAI_BATCH_MAX_FILES", "5000"))
+# Uncompressed bytes read from one archive, so a small upload can't expand without bound
+BATCH_MAX_TOTAL_BYTES = int(os.getenv("DETECTAI_BATCH_MAX_TOTAL_BYTES", str(200 * 1024 * 1024)))
+BATCH_WORKERS = int(os.getenv("DETECTAI_BATCH_WORKERS", "8"))
+UPLOAD_READ_SIZE = 1024 * 1024
+
+# With shared state, a running job's report is published at most every
+# BATCH_PUBLISH_SECONDS (and when it ends), so any worker can answer /batchReview/{id}
+BATCH_PUBLISH_SECONDS = float(os.getenv("DETECTAI_BATCH_PUBLISH_SECONDS", "2"))
+
+batch_jobs = BatchJobStore(max_jobs=int(os.getenv("DETECTAI_BATCH_MAX_JOBS", "100")), shared=shared_state)
+_background_tasks = set()
+
+async def run_batch(llm, job, reader, members, spool):
+    """Read and review the members in order; the next one is read only when a worker is free."""
+    job.status = "running"
+    workers = asyncio.Semaphore(BATCH_WORKERS)
+    reviewed = {}  # content digest -> first path with that content
+    reviews = []
+    published_at = 0.0
+
+    async def publish(final=False):
+        nonlocal published_at
+        if batch_jobs.shared is None or (not final and time.monotonic() - published_at < BATCH_PUBLISH_SECONDS):
+            return
+        published_at = time.monotonic()
+        await asyncio.to_thread(batch_jobs.publish, job.id, job.report())
+
+    async def review(path, code_text, language):
+        try:
+            job.results[path] = await run_review(llm, job.task, code_text, language)
+            await record_findings({REVIEW_TASKS[job.task][3]: job.results[path]}, code_text, path, language)
+        except HTTPException as exc:
+            job.results[path] = {"error": exc.detail}
+        except Exception as exc:
+            job.results[path] = {"error": str(exc)}
+        finally:
+            workers.release()
+        await publish()
+
+    def skip(path, reason):
+        job.skipped.append({"path": path, "reason": reason})
+        job.total -= 1
+        workers.release()
 
-    # ✅ Try parsing JSON returned by model
     try:
-        scan = json.loads(response.choices[0].message.content)
-    except json.JSONDecodeError:
-        scan = {
-            "summary": "⚠️ JSON parsing failed.",
-            "raw": response.choices[0].message.content
+        for path, info in members:
+            await workers.acquire()
+            code_text, reason = await asyncio.to_thread(read_member, reader, info, BATCH_MAX_FILE_BYTES, BATCH_MAX_TOTAL_BYTES)
+            if code_text is None:
+                skip(path, reason)
+                continue
+            detection = detect(code_text, path)
+            if not detection.is_code:
+                skip(path, "not source code")
+                continue
+            digest = content_digest(code_text)
+            if digest in reviewed:
+                job.duplicates[path] = reviewed[digest]
+                workers.release()
+                continue
+            reviewed[digest] = path
+            reviews.append(asyncio.create_task(review(path, code_text, detection.language)))
+        await asyncio.gather(*reviews)
+        job.status = "done"
+    except Exception as exc:
+        job.status = "failed"
+        job.error = str(exc)
+    finally:
+        reader.close()
+        spool.close()
+    job.finished_at = time.time()
+    await publish(final=True)
+
+@app.post("/batchReview")
+async def batch_review(
+    archive: UploadFile = File(...),
+    task: str = Form("scan"),
+    llm: ProviderRouter = Depends(get_llm),
+):
+    if task not in REVIEW_TASKS:
+        raise HTTPException(status_code=400, detail=f"Unknown task '{task}'. Use one of: {', '.join(REVIEW_TASKS)}.")
+
+    # Stream the archive to disk so a large repository never sits in memory; the
+    # background job reads its members from there and deletes it when done
+    tmp = tempfile.NamedTemporaryFile()
+    try:
+        size = 0
+        while chunk := await archive.read(UPLOAD_READ_SIZE):
+            size += len(chunk)
+            if size > BATCH_MAX_BYTES:
+                raise HTTPException(status_code=413, detail="Archive is too large.")
+            tmp.write(chunk)
+        tmp.flush()
+
+        try:
+            reader = await asyncio.to_thread(Archive, tmp.name)
+        except ValueError as exc:
+            raise HTTPException(status_code=400, detail=str(exc))
+    except BaseException:
+        tmp.close()
+        raise
+
+    job = BatchJob(task)
+    members, job.skipped = select_members(reader.members, BATCH_MAX_FILE_BYTES, BATCH_MAX_FILES, BATCH_MAX_TOTAL_BYTES)
+    job.total = len(members)  # less the members that turn out not to be source code
+    batch_jobs.add(job)
+    await asyncio.to_thread(batch_jobs.publish, job.id, job.report())
+
+    background = asyncio.create_task(run_batch(llm, job, reader, members, tmp))
+    _background_tasks.add(background)
+    background.add_done_callback(_background_tasks.discard)
+
+    return {"job_id": job.id, "status": job.status, "files": job.total, "skipped": len(job.skipped)}
+
+@app.get("/batchReview/{job_id}")
+async def batch_review_status(job_id: str):
+    job = batch_jobs.get(job_id)
+    if job is not None:
+        return job.report()
+    # Running (or ran) on another worker
+    report = await asyncio.to_thread(batch_jobs.published, job_id)
+    if report is None:
+        raise HTTPException(status_code=404, detail="Unknown job id.")
+    return report
+
+# Background jobs for reviews that may outlast an HTTP request: submit returns a job id,
+# JOB_WORKERS workers drain a priority queue, and clients poll GET /jobs/{id} (optionally
+# long-polling with ?wait=) or subscribe to GET /jobs/{id}/events.
+JOB_TASKS = (*REVIEW_TASKS, "review")
+JOB_WORKERS = int(os.getenv("DETECTAI_JOB_WORKERS", "4"))
+JOB_MAX_WAIT = float(os.getenv("DETECTAI_JOB_MAX_WAIT", "30"))
+# Set DETECTAI_JOB_DB to a file path to keep queued jobs and results across restarts
+# (workers sharing the file only take over jobs whose worker stopped); otherwise, with
+# shared state, any worker can report on a job another worker runs
+job_queue = JobQueue(
+    SQLiteJobStore(os.getenv("DETECTAI_JOB_DB")) if os.getenv("DETECTAI_JOB_DB")
+    else SharedJobStore(shared_state) if shared_state is not None
+    else MemoryJobStore(max_jobs=int(os.getenv("DETECTAI_JOB_MAX_JOBS", "1000"))),
+    max_depth=int(os.getenv("DETECTAI_JOB_QUEUE_DEPTH", "1000")),
+    bulk_share=float(os.getenv("DETECTAI_JOB_BULK_SHARE", "0.8")),
+)
+
+class JobInput(ReviewInput):
+    task: str = "analyze"
+    priority: str = "interactive"
+
+async def run_job(job):
+    metrics.current_endpoint.set(f"job:{job.task}")
+    code_text, language = job.payload["code"], job.payload["language"]
+    if job.task == "review":
+        results = await full_review(llm_router, code_text, language, job.payload["facets"], job.payload["mode"])
+        return await record_findings({"language": language, **results}, code_text, job.payload["filename"])
+
+    result = await run_review(llm_router, job.task, code_text, language, job.payload["mode"])
+    response = {"language": language, REVIEW_TASKS[job.task][3]: result}
+    if job.task in INCREMENTAL_TASKS:
+        response["result_id"] = await remember_result(job.task, code_text, result)
+    return await record_findings(response, code_text, job.payload["filename"])
+
+async def submit_job(task, code_text, filename, priority, mode, facets):
+    if task not in JOB_TASKS:
+        raise HTTPException(status_code=400, detail=f"Unknown task '{task}'. Use one of: {', '.join(JOB_TASKS)}.")
+    if priority not in PRIORITIES:
+        raise HTTPException(status_code=400, detail=f"Unknown priority '{priority}'. Use one of: {', '.join(PRIORITIES)}.")
+
+    detection = detect(code_text, filename)
+    if not detection.is_code:
+        return {
+            "errors": [],
+            "errorMsg": "⚠️ The input does not appear to be source code. Please paste a valid code snippet."
         }
 
-    return {
-        "filename": file.filename,
-        "scan": scan
-    }
\ No newline at end of file
+    payload = {"code": code_text, "filename": filename, "language": detection.language, "mode": mode, "facets": facets}
+    job = Job(task, payload, priority)
+    try:
+        position = await job_queue.submit(job)
+    except QueueFull as exc:
+        raise HTTPException(status_code=429, detail=str(exc), headers={"Retry-After": "5"})
+    return {"job_id": job.id, "status": job.status, "position": position}
+
+@app.post("/jobs")
+async def create_job(input: JobInput):
+    return await submit_job(input.task, input.code.strip(), None, input.priority, input.mode, input.facets)
+
+@app.post("/jobs/upload")
+async def create_job_from_upload(
+    file: UploadFile = File(...),
+    task: str = Form("analyze"),
+    priority: str = Form("interactive"),
+    mode: Optional[str] = Form(None),
+    facets: Optional[str] = Form(None),  # comma-separated, for task "review"
+):
+    # ✅ Read uploaded file
+    code_text = (await read_upload(file, MAX_UPLOAD_BYTES)).text
+
+    selected = [facet.strip() for facet in facets.split(",") if facet.strip()] if facets else None
+    return await submit_job(task, code_text, file.filename, priority, mode, selected)
+
+@app.get("/jobs/stats")
+def job_stats():
+    return job_queue.stats()
+
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str, wait: float = 0):
+    job = await job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job id.")
+    # Long poll: hold the request until the job finishes or `wait` seconds pass
+    deadline = time.monotonic() + min(wait, JOB_MAX_WAIT)
+    while job.status not in FINISHED and time.monotonic() < deadline:
+        job = await job_queue.wait(job_id, deadline - time.monotonic())
+    return job.report()
+
+async def job_events(job_id, sse):
+    while True:
+        job = await job_queue.get(job_id)
+        finished = job.status in FINISHED
+        yield format_event("done" if finished else "status", job.report() if finished else {"job_id": job.id, "status": job.status}, sse)
+        if finished:
+            return
+        await job_queue.wait(job_id, JOB_MAX_WAIT)
+
+@app.get("/jobs/{job_id}/events")
+async def job_status_events(job_id: str, request: Request):
+    if await job_queue.get(job_id) is None:
+        raise HTTPException(status_code=404, detail="Unknown job id.")
+    sse = "text/event-stream" in request.headers.get("accept", "")
+    return StreamingResponse(
+        job_events(job_id, sse),
+        media_type="text/event-stream" if sse else "application/x-ndjson",
+    )
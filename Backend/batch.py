@@ -0,0 +1,194 @@
+# batch.py
+# Whole-repository reviews: read a zip/tarball, skip binary and vendored files,
+# dedupe identical files and keep per-job progress so clients can poll.
+#
+# Members are listed from the archive's headers first (no decompression), then read
+# one at a time as reviewers free up, so only the files under review are in memory.
+
+import hashlib
+import json
+import tarfile
+import time
+import uuid
+import zipfile
+import zlib
+from collections import OrderedDict
+from pathlib import PurePosixPath
+
+from cache import normalize_code
+from ingest import decode_bytes
+
+# Directories that hold third-party or generated code
+VENDORED_DIRS = {
+    "node_modules", "vendor", "third_party", "third-party", "bower_components",
+    "dist", "build", "out", "target", ".git", ".hg", ".svn", ".venv", "venv",
+    "env", "__pycache__", ".tox", ".mypy_cache", ".pytest_cache", ".angular",
+    ".idea", ".vscode", "coverage", "site-packages",
+}
+VENDORED_NAMES = {
+    "package-lock.json", "yarn.lock", "pnpm-lock.yaml", "poetry.lock",
+    "Pipfile.lock", "Cargo.lock", "composer.lock", "go.sum",
+}
+VENDORED_SUFFIXES = (".min.js", ".min.css", ".map", ".lock")
+
+# Bytes inspected when deciding whether a file is binary
+BINARY_SNIFF_BYTES = 8192
+
+
+def is_vendored(path: str) -> bool:
+    parts = PurePosixPath(path).parts
+    name = parts[-1] if parts else path
+    return (
+        any(part in VENDORED_DIRS for part in parts[:-1])
+        or name in VENDORED_NAMES
+        or name.endswith(VENDORED_SUFFIXES)
+    )
+
+
+def looks_binary(data: bytes) -> bool:
+    return b"\0" in data[:BINARY_SNIFF_BYTES]
+
+
+class Archive:
+    """A zip or tarball on disk, listed up front and read one member at a time.
+
+    Nothing is extracted to disk. Raises ValueError if the file is neither a zip nor a tarball.
+    """
+
+    def __init__(self, path: str):
+        self._zip = self._tar = None
+        self.bytes_read = 0  # uncompressed bytes read so far
+        if zipfile.is_zipfile(path):
+            self._zip = zipfile.ZipFile(path)
+            self.members = [(info.filename, info.file_size, info) for info in self._zip.infolist() if not info.is_dir()]
+        elif tarfile.is_tarfile(path):
+            self._tar = tarfile.open(path)
+            self.members = [(info.name, info.size, info) for info in self._tar.getmembers() if info.isfile()]
+        else:
+            raise ValueError("Unsupported archive format. Upload a .zip, .tar, .tar.gz, .tar.bz2 or .tar.xz file.")
+
+    def read(self, info, limit: int) -> bytes:
+        """At most limit bytes of a member (a header can understate a member's size)."""
+        with (self._zip.open(info) if self._zip is not None else self._tar.extractfile(info)) as member:
+            data = member.read(limit)
+        self.bytes_read += len(data)
+        return data
+
+    def close(self):
+        (self._zip or self._tar).close()
+
+
+def select_members(members, max_file_bytes: int, max_files: int, max_total_bytes: int):
+    """Return ([(name, info)] to read, [{"path", "reason"}] skipped), from the headers alone."""
+    selected, skipped, total = [], [], 0
+    for name, size, info in members:
+        if is_vendored(name):
+            skipped.append({"path": name, "reason": "vendored"})
+        elif size > max_file_bytes:
+            skipped.append({"path": name, "reason": "too large"})
+        elif len(selected) >= max_files:
+            skipped.append({"path": name, "reason": "file limit reached"})
+        elif total + size > max_total_bytes:
+            skipped.append({"path": name, "reason": "archive size limit reached"})
+        else:
+            selected.append((name, info))
+            total += size
+    return selected, skipped
+
+
+def read_member(archive: Archive, info, max_file_bytes: int, max_total_bytes: int):
+    """(text, None) for a readable text member, or (None, reason) when it is skipped."""
+    if archive.bytes_read >= max_total_bytes:
+        return None, "archive size limit reached"
+    try:
+        data = archive.read(info, max_file_bytes + 1)
+    except (OSError, EOFError, RuntimeError, zipfile.BadZipFile, tarfile.TarError, zlib.error):
+        return None, "unreadable"
+    if len(data) > max_file_bytes:
+        return None, "too large"
+    if looks_binary(data):
+        return None, "binary"
+    try:
+        return decode_bytes(data).text, None
+    except UnicodeDecodeError:
+        return None, "undecodable text"
+
+
+def content_digest(text: str) -> str:
+    """Identical files (up to line endings and trailing whitespace) share a digest."""
+    return hashlib.sha256(normalize_code(text).encode("utf-8")).hexdigest()
+
+
+class BatchJob:
+    def __init__(self, task: str):
+        self.id = uuid.uuid4().hex
+        self.task = task
+        self.status = "queued"  # queued -> running -> done | failed
+        self.created_at = time.time()
+        self.finished_at = None
+        self.total = 0
+        self.results = {}     # path -> parsed model result
+        self.duplicates = {}  # path -> path of the identical file that was reviewed
+        self.skipped = []     # [{"path", "reason"}]
+        self.error = None
+
+    def report(self) -> dict:
+        files = dict(self.results)
+        for path, original in self.duplicates.items():
+            if original in self.results:
+                files[path] = {"duplicate_of": original, **self.results[original]}
+
+        severities = {}
+        for result in self.results.values():
+            for finding in (result.get("errors") or []) + (result.get("vulnerabilities") or []):
+                if isinstance(finding, dict):
+                    severity = finding.get("severity") or "Unknown"
+                    severities[severity] = severities.get(severity, 0) + 1
+
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "task": self.task,
+            "total_files": self.total,
+            "reviewed": len(self.results),
+            "duplicates": len(self.duplicates),
+            "skipped": self.skipped,
+            "findings_by_severity": severities,
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            "files": files,
+        }
+
+
+class BatchJobStore:
+    """Keeps the most recent jobs in memory; the oldest are dropped past max_jobs.
+
+    With a shared store (shared.py), the worker running a job publishes its report
+    there, so any worker can answer a status request for it.
+    """
+
+    def __init__(self, max_jobs: int = 100, shared=None, ttl_seconds: float = 86400):
+        self.max_jobs = max_jobs
+        self.shared = shared
+        self.ttl_seconds = ttl_seconds
+        self._jobs = OrderedDict()
+
+    def add(self, job: BatchJob):
+        self._jobs[job.id] = job
+        while len(self._jobs) > self.max_jobs:
+            self._jobs.popitem(last=False)
+
+    def get(self, job_id: str):
+        return self._jobs.get(job_id)
+
+    def publish(self, job_id: str, report: dict):
+        """Store a report taken on the event loop (a running job's results keep changing there)."""
+        if self.shared is not None:
+            self.shared.set(f"batch:{job_id}", json.dumps(report), self.ttl_seconds)
+
+    def published(self, job_id: str):
+        """The last report any worker published for the job, or None."""
+        record = self.shared.get(f"batch:{job_id}") if self.shared is not None else None
+        return json.loads(record) if record else None
+
@@ -0,0 +1,55 @@
+package com.example.store;
+
+import java.util.ArrayList;
+import java.util.HashMap;
+import java.util.List;
+import java.util.Map;
+
+public class Inventory {
+    private final Map<String, Integer> stock = new HashMap<>();
+    private final List<String> log = new ArrayList<>();
+
+    public void add(String sku, int quantity) {
+        if (quantity < 0) {
+            throw new IllegalArgumentException("quantity must be positive");
+        }
+        stock.put(sku, stock.getOrDefault(sku, 0) + quantity);
+        log.add("add " + sku + " " + quantity);
+    }
+
+    public boolean remove(String sku, int quantity) {
+        Integer current = stock.get(sku);
+        if (current < quantity) {
+            return false;
+        }
+        stock.put(sku, current - quantity);
+        log.add("remove " + sku + " " + quantity);
+        return true;
+    }
+
+    public int total() {
+        int total = 0;
+        for (String sku : stock.keySet()) {
+            total += stock.get(sku);
+        }
+        return total;
+    }
+
+    public List<String> lowStock(int threshold) {
+        List<String> low = new ArrayList<>();
+        for (Map.Entry<String, Integer> entry : stock.entrySet()) {
+            if (entry.getValue() <= threshold) {
+                low.add(entry.getKey());
+            }
+        }
+        return low;
+    }
+
+    public String history() {
+        String out = "";
+        for (int i = 0; i <= log.size(); i++) {
+            out += log.get(i) + "\n";
+        }
+        return out;
+    }
+}
@@ -0,0 +1,40 @@
+package handlers
+
+import (
+	"encoding/json"
+	"fmt"
+	"net/http"
+	"os/exec"
+	"sync"
+)
+
+type Counter struct {
+	values map[string]int
+}
+
+var counter = Counter{values: map[string]int{}}
+var mu sync.Mutex
+
+func Increment(w http.ResponseWriter, r *http.Request) {
+	name := r.URL.Query().Get("name")
+	counter.values[name]++
+	fmt.Fprintf(w, "%s=%d", name, counter.values[name])
+}
+
+func Snapshot(w http.ResponseWriter, r *http.Request) {
+	mu.Lock()
+	defer mu.Unlock()
+	data, _ := json.Marshal(counter.values)
+	w.Header().Set("Content-Type", "application/json")
+	w.Write(data)
+}
+
+func Diagnose(w http.ResponseWriter, r *http.Request) {
+	host := r.URL.Query().Get("host")
+	out, err := exec.Command("sh", "-c", "ping -c 1 "+host).Output()
+	if err != nil {
+		http.Error(w, err.Error(), 500)
+		return
+	}
+	w.Write(out)
+}
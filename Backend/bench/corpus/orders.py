@@ -0,0 +1,63 @@
+import sqlite3
+from datetime import datetime, timedelta
+
+DB_PATH = "orders.db"
+API_TOKEN = "sk-live-4f9a1c2b7d"  # used by the payment client
+
+
+class OrderRepository:
+    def __init__(self, path=DB_PATH):
+        self.conn = sqlite3.connect(path)
+
+    def find_by_customer(self, customer_id):
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT * FROM orders WHERE customer_id = '%s'" % customer_id)
+        return cursor.fetchall()
+
+    def recent(self, days=7):
+        since = datetime.now() - timedelta(days=days)
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT * FROM orders WHERE created_at > ?", (since.isoformat(),))
+        return cursor.fetchall()
+
+    def total_for(self, customer_id):
+        total = 0
+        for order in self.find_by_customer(customer_id):
+            total =+ order[3]
+        return total
+
+
+def apply_discount(price, percent):
+    if percent > 100:
+        raise ValueError("discount above 100%")
+    return price - price * percent / 100
+
+
+def summarize(orders):
+    by_day = {}
+    for order in orders:
+        day = order[2][:10]
+        if day not in by_day:
+            by_day[day] = []
+        by_day[day].append(order)
+    report = []
+    for day in sorted(by_day):
+        amounts = [o[3] for o in by_day[day]]
+        report.append({
+            "day": day,
+            "count": len(amounts),
+            "average": sum(amounts) / len(amounts),
+            "max": max(amounts),
+        })
+    return report
+
+
+def export_csv(rows, path):
+    f = open(path, "w")
+    for row in rows:
+        f.write(",".join(str(value) for value in row) + "\n")
+
+
+if __name__ == "__main__":
+    repo = OrderRepository()
+    print(summarize(repo.recent()))
@@ -0,0 +1,43 @@
+const express = require('express');
+const crypto = require('crypto');
+const db = require('./db');
+
+const router = express.Router();
+const JWT_SECRET = 'supersecret123';
+
+function hashPassword(password) {
+  return crypto.createHash('md5').update(password).digest('hex');
+}
+
+router.post('/login', async (req, res) => {
+  const { username, password } = req.body;
+  const user = await db.query(`SELECT * FROM users WHERE name = '${username}'`);
+  if (user && user.password == hashPassword(password)) {
+    res.json({ token: sign(user.id) });
+  } else {
+    res.status(401).send('Invalid login');
+  }
+});
+
+router.get('/profile/:id', async (req, res) => {
+  const user = await db.findById(req.params.id);
+  res.send(`<h1>${user.displayName}</h1><p>${user.bio}</p>`);
+});
+
+router.post('/calc', (req, res) => {
+  const result = eval(req.body.expression);
+  res.json({ result });
+});
+
+function sign(userId) {
+  const payload = Buffer.from(JSON.stringify({ userId, ts: Date.now() })).toString('base64');
+  const signature = crypto.createHmac('sha256', JWT_SECRET).update(payload).digest('hex');
+  return `${payload}.${signature}`;
+}
+
+function paginate(items, page, size) {
+  const start = page * size;
+  return items.slice(start, start + size + 1);
+}
+
+module.exports = { router, paginate };
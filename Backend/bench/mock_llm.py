@@ -0,0 +1,178 @@
+# mock_llm.py
+# A local OpenAI-compatible chat completions server for benchmarks: no network, no cost.
+#
+# Replies are canned JSON in the schema the prompt asks for, with a few findings on
+# real line numbers of the submitted code. Latency follows a configurable distribution,
+# and a share of replies can be malformed (fenced, trailing commas, truncated, prose
+# around the JSON) or throttled with a 429, to exercise repair, retries and backoff.
+#
+#   python bench/mock_llm.py --port 8900 --latency lognormal:0.2:0.5 --malformed 0.05
+#
+# Point the backend at it with OPENAI_BASE_URL=http://127.0.0.1:8900/v1.
+
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+MALFORMED_KINDS = ("fenced", "trailing_comma", "truncated", "prose")
+STREAM_PIECE_CHARS = 24
+
+
+class LatencyModel:
+    """fixed:SECONDS, uniform:LOW:HIGH or lognormal:MEDIAN:SIGMA."""
+
+    def __init__(self, spec: str):
+        kind, *params = spec.split(":")
+        self.kind, self.params = kind, [float(p) for p in params]
+        if kind not in ("fixed", "uniform", "lognormal"):
+            raise ValueError(f"Unknown latency distribution '{spec}'.")
+
+    def sample(self, rng: random.Random) -> float:
+        if self.kind == "fixed":
+            return self.params[0]
+        if self.kind == "uniform":
+            return rng.uniform(*self.params)
+        median, sigma = self.params
+        return median * rng.lognormvariate(0, sigma)
+
+
+def code_lines(messages: list) -> list:
+    code = messages[-1]["content"] if messages else ""
+    if code.startswith("Code:\n"):
+        code = code[len("Code:\n"):]
+    return code.split("\n")
+
+
+def pick_lines(lines: list, rng: random.Random, count: int) -> list:
+    numbered = [(number, text) for number, text in enumerate(lines, start=1) if text.strip()]
+    return sorted(rng.sample(numbered, min(count, len(numbered))))
+
+
+def canned_reply(messages: list, rng: random.Random) -> dict:
+    """A plausible reply for whichever review schema the system prompt asks for."""
+    system = messages[0]["content"] if messages else ""
+    lines = code_lines(messages)
+    picked = pick_lines(lines, rng, 3)
+
+    if '"vulnerabilities"' in system:
+        return {
+            "vulnerabilities": [
+                {"line": number, "description": f"Untrusted input reaches '{text.strip()[:40]}'.",
+                 "vulnerability_type": rng.choice(["SQL Injection", "XSS", "Hardcoded Secret", "Command Injection"]),
+                 "severity": rng.choice(["Critical", "High", "Medium", "Low"]),
+                 "fix_suggestion": "Validate the input and use a safe API."}
+                for number, text in picked
+            ],
+            "summary": "Several inputs are used without validation.",
+            "recommendations": ["Use parameterized queries.", "Keep secrets out of source code."],
+        }
+    if '"optimized_code"' in system:
+        return {
+            "optimized_code": "\n".join(lines),
+            "explanation": ["Hoisted repeated work out of loops.", "Replaced manual loops with built-ins."],
+            "complexity_analysis": {"before": "O(n^2)", "after": "O(n)"},
+            "remarks": "Minor improvements; behaviour is unchanged.",
+        }
+    if '"key_points"' in system:
+        return {
+            "summary": "Defines a small service with data access helpers.",
+            "detailed_explanation": "The code reads records, aggregates them and exposes the results to callers.",
+            "key_points": ["Reads records from storage", "Aggregates per key", "Exposes helper functions"],
+        }
+    if '"errors"' in system:
+        errors = [
+            {"line": number, "description": "Possible bug on this line.", "code": text.strip(),
+             "fix_suggestion": "Check the operator and the bounds.", "corrected_code": text.strip(),
+             "severity": rng.choice(["Critical", "Major", "Minor"]),
+             "category": rng.choice(["Runtime Error", "Logic Error", "Best Practice"])}
+            for number, text in picked
+        ]
+        return {
+            "errors": errors,
+            "fixes": [{"line": e["line"], "suggestion": e["fix_suggestion"], "corrected_code": e["corrected_code"]} for e in errors],
+            "summary": "The code works for common inputs but has a few edge-case bugs.",
+            "functionality": ["Data access", "Aggregation"],
+            "conclusion": "Reasonable quality with some fixes needed.",
+        }
+    return {"summary": "Mock reply."}
+
+
+def malform(text: str, kind: str) -> str:
+    if kind == "fenced":
+        return f"```json\n{text}\n```"
+    if kind == "trailing_comma":
+        return text.replace("]", ",]", 1)
+    if kind == "truncated":
+        return text[: max(1, int(len(text) * 0.8))]
+    return f"Here is the review you asked for:\n{text}\nLet me know if you need more."
+
+
+def create_app(latency: LatencyModel, malformed: float = 0.0, error_rate: float = 0.0, seed: int = None) -> FastAPI:
+    app = FastAPI()
+    rng = random.Random(seed)
+    app.state.calls = 0
+
+    @app.get("/health")
+    def health():
+        return {"calls": app.state.calls}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        app.state.calls += 1
+        delay = latency.sample(rng)
+        if rng.random() < error_rate:
+            await asyncio.sleep(delay / 4)
+            return JSONResponse(status_code=429, headers={"retry-after": "1"},
+                                content={"error": {"message": "Rate limit reached (mock).", "type": "rate_limit"}})
+
+        text = json.dumps(canned_reply(body.get("messages") or [], rng), indent=2)
+        if rng.random() < malformed:
+            text = malform(text, rng.choice(MALFORMED_KINDS))
+        model, created = body.get("model", "mock"), int(time.time())
+
+        if not body.get("stream"):
+            await asyncio.sleep(delay)
+            return {
+                "id": "chatcmpl-mock", "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+            }
+
+        async def events():
+            pieces = [text[i:i + STREAM_PIECE_CHARS] for i in range(0, len(text), STREAM_PIECE_CHARS)]
+            await asyncio.sleep(delay * 0.3)  # time to first token
+            for piece in pieces:
+                chunk = {"id": "chatcmpl-mock", "object": "chat.completion.chunk", "created": created, "model": model,
+                         "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]}
+                yield f"data: {json.dumps(chunk)}\n\n"
+                await asyncio.sleep(delay * 0.7 / len(pieces))
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock OpenAI-compatible server for benchmarks.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency", default="lognormal:0.2:0.5", help="fixed:S, uniform:LOW:HIGH or lognormal:MEDIAN:SIGMA")
+    parser.add_argument("--malformed", type=float, default=0.0, help="share of replies that are malformed")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of calls answered with a 429")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    import uvicorn
+    app = create_app(LatencyModel(args.latency), args.malformed, args.error_rate, args.seed)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
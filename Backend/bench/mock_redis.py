@@ -0,0 +1,110 @@
+# mock_redis.py
+# A local stand-in for Redis with just what shared.py uses: GET, SET (PX/EX, NX/XX),
+# DEL, PEXPIRE, PING, SELECT and AUTH, over the Redis protocol. No scripting, so lock
+# release takes the GET + DEL path. In memory, single database, for benchmarks only.
+#
+#   python bench/mock_redis.py --port 6390
+#
+# Point the backend at it with DETECTAI_SHARED_STATE=redis://127.0.0.1:6390.
+
+import argparse
+import asyncio
+import time
+
+
+class Store:
+    def __init__(self):
+        self.values = {}  # key -> (expires_at or None, value)
+
+    def get(self, key):
+        entry = self.values.get(key)
+        if entry is None:
+            return None
+        if entry[0] is not None and entry[0] < time.monotonic():
+            del self.values[key]
+            return None
+        return entry[1]
+
+    def execute(self, command: list):
+        name, args = command[0].upper(), command[1:]
+        if name == b"PING":
+            return "+PONG"
+        if name in (b"SELECT", b"AUTH"):
+            return "+OK"
+        if name == b"GET":
+            return self.get(args[0])
+        if name == b"SET":
+            key, value, options = args[0], args[1], [arg.upper() for arg in args[2:]]
+            expires_at = None
+            for unit, scale in ((b"PX", 1000), (b"EX", 1)):
+                if unit in options:
+                    expires_at = time.monotonic() + int(options[options.index(unit) + 1]) / scale
+            exists = self.get(key) is not None
+            if (b"NX" in options and exists) or (b"XX" in options and not exists):
+                return None
+            self.values[key] = (expires_at, value)
+            return "+OK"
+        if name == b"DEL":
+            return sum(self.values.pop(key, None) is not None for key in args)
+        if name == b"PEXPIRE":
+            value = self.get(args[0])
+            if value is None:
+                return 0
+            self.values[args[0]] = (time.monotonic() + int(args[1]) / 1000, value)
+            return 1
+        return f"-ERR unknown command '{name.decode()}'"
+
+
+def encode(reply) -> bytes:
+    if reply is None:
+        return b"$-1\r\n"
+    if isinstance(reply, int):
+        return b":%d\r\n" % reply
+    if isinstance(reply, str):
+        return reply.encode() + b"\r\n"
+    return b"$%d\r\n%s\r\n" % (len(reply), reply)
+
+
+async def read_command(reader: asyncio.StreamReader) -> list:
+    header = await reader.readline()
+    if not header:
+        raise EOFError
+    if not header.startswith(b"*"):
+        return header.split()  # inline command, e.g. from telnet
+    command = []
+    for _ in range(int(header[1:])):
+        length = int((await reader.readline())[1:])
+        command.append((await reader.readexactly(length + 2))[:-2])
+    return command
+
+
+async def serve(host: str, port: int):
+    store = Store()
+
+    async def handle(reader, writer):
+        try:
+            while True:
+                command = await read_command(reader)
+                if command:
+                    writer.write(encode(store.execute(command)))
+                    await writer.drain()
+        except (EOFError, ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, host, port)
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Minimal Redis stand-in for benchmarks.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6390)
+    args = parser.parse_args()
+    asyncio.run(serve(args.host, args.port))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,372 @@
+# run.py
+# Offline benchmark: start the mock model server (mock_llm.py) and the backend under
+# uvicorn, drive every review endpoint - JSON, streaming, incremental and multipart
+# uploads - with the code in bench/corpus at increasing concurrency, and report
+# throughput, p50/p99 latency, backend memory and event-loop lag per level.
+#
+#   python bench/run.py                      # run and print the report
+#   python bench/run.py --save               # run and store the result as the baseline
+#   python bench/run.py --check              # run and exit 1 on a regression vs the baseline
+#
+# --check fails only on failed requests and on a large throughput drop; latency, memory
+# and loop lag vary too much between machines (and on shared CI runners) to gate on, so
+# their drift is reported but never fails. Compare against a baseline recorded on the
+# same machine: CI records one from the base commit on its own runner first.
+#
+# Every request carries a unique trailing comment so it misses the result cache and
+# measures the full path; --cache-hits sends the corpus unchanged instead. The
+# function-level memo ignores comments, so it is off unless --unit-memo is given.
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+BENCH_DIR = Path(__file__).resolve().parent
+BACKEND_DIR = BENCH_DIR.parent
+CORPUS_DIR = BENCH_DIR / "corpus"
+BASELINE_PATH = BENCH_DIR / "baseline.json"
+
+# JSON endpoints: path -> extra body fields; incremental ones also get the previous version
+JSON_ENDPOINTS = {
+    "/analyze": {},
+    "/optimize": {},
+    "/summarize": {},
+    "/security-scan": {},
+    "/review": {},
+    "/analyze/stream": {},
+    "/optimize/stream": {},
+    "/summarize/stream": {},
+    "/security-scan/stream": {},
+    "/analyze/incremental": {"incremental": True},
+    "/security-scan/incremental": {"incremental": True},
+}
+UPLOAD_ENDPOINTS = (
+    "/upload",
+    "/uploadFileToAnalyze",
+    "/uploadFileToOptimize",
+    "/uploadFileToSummarize",
+    "/uploadFileToScan",
+    "/uploadFileToReview",
+)
+
+# A regression is a level with more failed requests than the baseline, or whose throughput
+# fell by more than --max-throughput-drop. The metrics below are only reported when they
+# drift by more than --tolerance. Lag and memory are compared with an absolute floor,
+# since small values are mostly noise; lag is compared on its mean, because with ~10
+# samples a second a single slow tick decides the bucketed p99.
+REPORTED = (
+    # (metric, higher is better, noise floor)
+    ("throughput_rps", True, 0.0),
+    ("p50_ms", False, 0.0),
+    ("p99_ms", False, 0.0),
+    ("rss_mb", False, 20.0),
+    ("loop_lag_mean_ms", False, 10.0),
+)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def load_corpus() -> list:
+    return [(path.name, path.read_text()) for path in sorted(CORPUS_DIR.iterdir()) if path.is_file()]
+
+
+def comment(filename: str, text: str) -> str:
+    return f"# {text}" if filename.endswith(".py") else f"// {text}"
+
+
+def make_cases(corpus: list, vary: bool):
+    """Endless (endpoint, request kwargs) pairs cycling through endpoints x corpus files."""
+    counter = itertools.count()
+    endpoints = [(path, "json") for path in JSON_ENDPOINTS] + [(path, "upload") for path in UPLOAD_ENDPOINTS]
+    for (path, kind), (filename, code) in itertools.cycle(itertools.product(endpoints, corpus)):
+        if vary:
+            code = f"{code}\n{comment(filename, f'bench request {next(counter)}')}\n"
+        if kind == "upload":
+            yield path, {"files": {"file": (filename, code.encode(), "text/plain")}}
+            continue
+        body = {"code": code}
+        if JSON_ENDPOINTS[path].get("incremental"):
+            body["base_code"] = code.replace("\n", "\n\n", 1)  # one line inserted since the base
+        yield path, {"json": body}
+
+
+def memory_mb(pid: int) -> dict:
+    """Resident and peak resident memory of a process (Linux only)."""
+    try:
+        status = Path(f"/proc/{pid}/status").read_text()
+    except OSError:
+        return {"rss_mb": None, "peak_rss_mb": None}
+    values = dict(re.findall(r"^(VmRSS|VmHWM):\s+(\d+) kB", status, re.M))
+    return {
+        "rss_mb": round(int(values["VmRSS"]) / 1024, 1) if "VmRSS" in values else None,
+        "peak_rss_mb": round(int(values["VmHWM"]) / 1024, 1) if "VmHWM" in values else None,
+    }
+
+
+def lag_histogram(metrics_text: str) -> dict:
+    """Cumulative bucket counts, count and sum of the backend's event-loop lag histogram."""
+    buckets, count, total = {}, 0, 0.0
+    for line in metrics_text.splitlines():
+        if line.startswith("detectai_event_loop_lag_seconds_bucket"):
+            bound = re.search(r'le="([^"]+)"', line).group(1)
+            buckets[float(bound)] = float(line.rsplit(" ", 1)[1])
+        elif line.startswith("detectai_event_loop_lag_seconds_count"):
+            count = float(line.rsplit(" ", 1)[1])
+        elif line.startswith("detectai_event_loop_lag_seconds_sum"):
+            total = float(line.rsplit(" ", 1)[1])
+    return {"buckets": buckets, "count": count, "sum": total}
+
+
+def lag_between(before: dict, after: dict) -> dict:
+    count = after["count"] - before["count"]
+    if count <= 0:
+        return {"loop_lag_mean_ms": None, "loop_lag_p99_ms": None}
+    p99 = None
+    for bound in sorted(after["buckets"]):
+        if after["buckets"][bound] - before["buckets"].get(bound, 0) >= 0.99 * count:
+            p99 = bound
+            break
+    return {
+        "loop_lag_mean_ms": round((after["sum"] - before["sum"]) / count * 1000, 2),
+        "loop_lag_p99_ms": round(p99 * 1000, 2) if p99 not in (None, float("inf")) else None,
+    }
+
+
+def percentile(values: list, q: float):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def summarize(latencies: list) -> dict:
+    return {
+        "requests": len(latencies),
+        "p50_ms": round(percentile(latencies, 0.5) * 1000, 1) if latencies else None,
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 1) if latencies else None,
+    }
+
+
+async def run_level(client: httpx.AsyncClient, cases, concurrency: int, seconds: float) -> dict:
+    latencies, per_endpoint, errors = [], {}, {}
+    deadline = time.monotonic() + seconds
+
+    async def worker():
+        while time.monotonic() < deadline:
+            path, kwargs = next(cases)
+            started = time.perf_counter()
+            try:
+                response = await client.post(path, **kwargs)
+                await response.aread()
+                failed = response.status_code >= 400
+            except httpx.HTTPError:
+                failed = True
+            elapsed = time.perf_counter() - started
+            if failed:
+                errors[path] = errors.get(path, 0) + 1
+                continue
+            latencies.append(elapsed)
+            per_endpoint.setdefault(path, []).append(elapsed)
+
+    started = time.monotonic()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.monotonic() - started
+    return {
+        "concurrency": concurrency,
+        "throughput_rps": round(len(latencies) / elapsed, 2),
+        **summarize(latencies),
+        "errors": sum(errors.values()),
+        "endpoints": {path: summarize(values) for path, values in sorted(per_endpoint.items())},
+        "errors_by_endpoint": errors,
+    }
+
+
+def start_process(args: list, env: dict) -> subprocess.Popen:
+    log = tempfile.TemporaryFile()  # a pipe nobody reads would block a chatty process
+    process = subprocess.Popen(args, cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+    process.log = log
+    return process
+
+
+def process_output(process: subprocess.Popen) -> str:
+    process.log.seek(0)
+    return process.log.read().decode(errors="replace")
+
+
+async def wait_until_up(url: str, process: subprocess.Popen, timeout: float = 30.0):
+    give_up_at = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < give_up_at:
+            if process.poll() is not None:
+                raise RuntimeError(f"{url} exited during startup:\n{process_output(process)}")
+            try:
+                await client.get(url)
+                return
+            except httpx.HTTPError:
+                await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout} seconds.")
+
+
+async def benchmark(args) -> dict:
+    mock_port, app_port = free_port(), free_port()
+    env = {
+        **os.environ,
+        "OPENAI_API_KEY": "bench",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{mock_port}/v1",
+        "DETECTAI_PROVIDERS": "openai",
+        "DETECTAI_HEDGE_AFTER": "off",
+        "DETECTAI_UNIT_MEMO": "1" if args.unit_memo else "0",
+    }
+    mock = start_process([sys.executable, str(BENCH_DIR / "mock_llm.py"), "--port", str(mock_port),
+                          "--latency", args.latency, "--malformed", str(args.malformed),
+                          "--error-rate", str(args.error_rate), "--seed", "7"], env)
+    backend = start_process([sys.executable, "-m", "uvicorn", "app:app", "--port", str(app_port),
+                             "--log-level", "warning"], env)
+    try:
+        await wait_until_up(f"http://127.0.0.1:{mock_port}/health", mock)
+        await wait_until_up(f"http://127.0.0.1:{app_port}/", backend)
+        cases = make_cases(load_corpus(), vary=not args.cache_hits)
+        limits = httpx.Limits(max_connections=max(args.levels) + 8)
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{app_port}", limits=limits, timeout=120) as client:
+            if args.warmup:
+                await run_level(client, cases, 1, args.warmup)  # imports, first connections, tokenizer load
+            levels = []
+            for concurrency in args.levels:
+                lag_before = lag_histogram((await client.get("/metrics")).text)
+                level = await run_level(client, cases, concurrency, args.seconds)
+                lag_after = lag_histogram((await client.get("/metrics")).text)
+                level.update(lag_between(lag_before, lag_after))
+                level.update(memory_mb(backend.pid))
+                levels.append(level)
+                print(format_level(level), flush=True)
+        return {
+            "settings": {"latency": args.latency, "malformed": args.malformed, "error_rate": args.error_rate,
+                         "seconds": args.seconds, "cache_hits": args.cache_hits, "unit_memo": args.unit_memo},
+            "levels": levels,
+        }
+    finally:
+        for process in (backend, mock):
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+            process.log.close()
+
+
+def format_level(level: dict) -> str:
+    return (
+        f"c={level['concurrency']:<4} {level['throughput_rps']:>8.2f} req/s  "
+        f"p50 {level['p50_ms']} ms  p99 {level['p99_ms']} ms  errors {level['errors']}  "
+        f"rss {level['rss_mb']} MB  loop lag mean {level['loop_lag_mean_ms']} ms / p99 {level['loop_lag_p99_ms']} ms"
+    )
+
+
+def median_of_runs(runs: list) -> dict:
+    """Combine repeated runs into one result: the median of every top-level number per level."""
+    if len(runs) == 1:
+        return runs[0]
+    levels = []
+    for same_level in zip(*(run["levels"] for run in runs)):
+        level = dict(same_level[0])
+        for metric, value in level.items():
+            if isinstance(value, (int, float)) and metric != "concurrency":
+                values = [other[metric] for other in same_level if other.get(metric) is not None]
+                level[metric] = percentile(values, 0.5) if values else None
+        levels.append(level)
+    return {**runs[0], "levels": levels}
+
+
+def regressions(result: dict, baseline: dict, tolerance: float, max_throughput_drop: float):
+    """Compare each level with the baseline level of the same concurrency; returns (regressions, drift)."""
+    found, drift = [], []
+    if baseline.get("settings") != result["settings"]:
+        found.append("settings differ from the baseline; run with the baseline's settings or --save a new one")
+        return found, drift
+    base_levels = {level["concurrency"]: level for level in baseline["levels"]}
+    for level in result["levels"]:
+        base = base_levels.get(level["concurrency"])
+        if base is None:
+            continue
+        for metric, higher_is_better, floor in REPORTED:
+            now, before = level.get(metric), base.get(metric)
+            if now is None or before is None:
+                continue
+            if higher_is_better and now < before * (1 - tolerance):
+                drift.append(f"c={level['concurrency']}: {metric} fell from {before} to {now}")
+            if not higher_is_better and now > max(before * (1 + tolerance), before + floor):
+                drift.append(f"c={level['concurrency']}: {metric} rose from {before} to {now}")
+        now, before = level.get("throughput_rps"), base.get("throughput_rps")
+        if now is not None and before is not None and now < before * (1 - max_throughput_drop):
+            found.append(f"c={level['concurrency']}: throughput_rps fell from {before} to {now}")
+        if level["errors"] > base.get("errors", 0):
+            found.append(f"c={level['concurrency']}: {level['errors']} failed requests (baseline {base.get('errors', 0)})")
+    return found, drift
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark of the DetectAI backend against a mock model server.")
+    # Past saturation (about 16 here) tail latency is too noisy to gate CI on; add 64 by hand
+    parser.add_argument("--levels", default="1,4,16", help="comma-separated concurrency levels")
+    parser.add_argument("--seconds", type=float, default=10.0, help="duration of each level")
+    parser.add_argument("--warmup", type=float, default=2.0, help="seconds of unmeasured traffic before the first level")
+    parser.add_argument("--latency", default="lognormal:0.1:0.5", help="mock model latency, see mock_llm.py")
+    parser.add_argument("--malformed", type=float, default=0.05, help="share of malformed model replies")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of model calls answered with a 429")
+    parser.add_argument("--cache-hits", action="store_true", help="send the corpus unchanged so repeats hit the cache")
+    parser.add_argument("--runs", type=int, default=1, help="repeat the benchmark and keep the median of each metric")
+    parser.add_argument("--unit-memo", action="store_true", help="keep the function-level memo on")
+    parser.add_argument("--output", help="also write the full result as JSON to this file")
+    parser.add_argument("--baseline", default=str(BASELINE_PATH))
+    parser.add_argument("--save", action="store_true", help="store the result as the new baseline")
+    parser.add_argument("--check", action="store_true", help="exit 1 if the result regressed against the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.3, help="relative change reported as drift by --check")
+    parser.add_argument("--max-throughput-drop", type=float, default=0.5,
+                        help="relative throughput drop at which --check fails")
+    args = parser.parse_args()
+    args.levels = [int(level) for level in args.levels.split(",")]
+
+    runs = []
+    for run in range(args.runs):
+        if args.runs > 1:
+            print(f"Run {run + 1} of {args.runs}")
+        runs.append(asyncio.run(benchmark(args)))
+    result = median_of_runs(runs)
+    if args.runs > 1:
+        print("Median of the runs:")
+        for level in result["levels"]:
+            print(format_level(level))
+    if args.output:
+        Path(args.output).write_text(json.dumps(result, indent=2) + "\n")
+    if args.save:
+        Path(args.baseline).write_text(json.dumps(result, indent=2) + "\n")
+        print(f"Baseline written to {args.baseline}")
+    if args.check:
+        found, drift = regressions(result, json.loads(Path(args.baseline).read_text()),
+                                   args.tolerance, args.max_throughput_drop)
+        for change in drift:
+            print(f"DRIFT {change}")
+        for problem in found:
+            print(f"REGRESSION {problem}")
+        if found:
+            sys.exit(1)
+        print("No regressions against the baseline.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+# cache.py
+# Content-addressed result cache for model responses.
+#
+# Tiers, checked in order:
+#   - an in-process LRU with a max size and a TTL (always on)
+#   - an optional SQLite file that survives restarts (set db_path)
+#   - an optional store shared with the other workers (shared.py; set shared)
+#
+# The shared store may be a network round trip away, so async code uses aget/aset,
+# which reach it on a worker thread instead of blocking the event loop.
+
+import asyncio
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def normalize_code(code: str) -> str:
+    """Normalize line endings and trailing whitespace so re-submitted files hash the same.
+
+    Leading lines are kept as-is because they shift the line numbers the model reports.
+    """
+    text = code.replace("\r\n", "\n").replace("\r", "\n")
+    return "\n".join(line.rstrip() for line in text.split("\n")).rstrip("\n")
+
+
+def make_key(endpoint: str, model: str, temperature, code: str, prompt: str = None) -> str:
+    """Cache key for (endpoint, model, temperature, normalized code) and the prompt template version."""
+    h = hashlib.sha256()
+    parts = (endpoint, model, repr(temperature)) if prompt is None else (endpoint, model, repr(temperature), prompt)
+    for part in parts:
+        h.update(part.encode("utf-8"))
+        h.update(b"\0")
+    h.update(normalize_code(code).encode("utf-8"))
+    return h.hexdigest()
+
+
+class ResultCache:
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 86400, db_path: str = None,
+                 shared=None, namespace: str = ""):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.shared = shared
+        self.namespace = namespace  # prefixes keys in the shared store, so caches don't collide
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                " key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._db.execute("DELETE FROM results WHERE expires_at < ?", (time.time(),))
+            self._db.commit()
+
+    def get(self, key: str):
+        now = time.time()
+        value = self._get_memory(key, now)
+        if value is None and self._db is not None:
+            value = self._get_disk(key, now)
+        if value is not None:
+            return value
+        if self.shared is None:
+            return self._missed()
+        return self._from_shared(key, self.shared.get(self.namespace + key), now)
+
+    async def aget(self, key: str):
+        """get() for async callers; the disk and shared tiers are read off the event loop."""
+        now = time.time()
+        value = self._get_memory(key, now)
+        if value is None and self._db is not None:
+            value = await asyncio.to_thread(self._get_disk, key, now)
+        if value is not None:
+            return value
+        if self.shared is None:
+            return self._missed()
+        return self._from_shared(key, await asyncio.to_thread(self.shared.get, self.namespace + key), now)
+
+    def set(self, key: str, value: str):
+        expires_at = self._set_memory(key, value)
+        if self._db is not None:
+            self._set_disk(key, value, expires_at)
+        if self.shared is not None:
+            self.shared.set(self.namespace + key, value, self.ttl_seconds)
+
+    async def aset(self, key: str, value: str):
+        """set() for async callers; the disk and shared tiers are written off the event loop."""
+        expires_at = self._set_memory(key, value)
+        if self._db is not None:
+            await asyncio.to_thread(self._set_disk, key, value, expires_at)
+        if self.shared is not None:
+            await asyncio.to_thread(self.shared.set, self.namespace + key, value, self.ttl_seconds)
+
+    def published(self, key: str):
+        """The value any worker stored in the shared store for key, without counting a lookup."""
+        return self.shared.get(self.namespace + key) if self.shared is not None else None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM results")
+                self._db.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "persistent": self._db is not None,
+                "shared": self.shared is not None,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+    def _get_memory(self, key, now):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at >= now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._entries[key]
+            self.evictions += 1
+            return None
+
+    def _get_disk(self, key, now):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value, expires_at FROM results WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and row[1] >= now:
+                self._remember(key, row[0], row[1])
+                self.hits += 1
+                self.disk_hits += 1
+                return row[0]
+            if row is not None:
+                self._db.execute("DELETE FROM results WHERE key = ?", (key,))
+                self._db.commit()
+            return None
+
+    def _missed(self):
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def _from_shared(self, key, value, now):
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self._remember(key, value, now + self.ttl_seconds)
+            self.hits += 1
+            self.shared_hits += 1
+            return value
+
+    def _set_memory(self, key, value):
+        expires_at = time.time() + self.ttl_seconds
+        with self._lock:
+            self._remember(key, value, expires_at)
+        return expires_at
+
+    def _set_disk(self, key, value, expires_at):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO results (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, expires_at),
+            )
+            self._db.commit()
+
+    # Caller must hold self._lock
+    def _remember(self, key, value, expires_at):
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
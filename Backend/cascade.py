@@ -0,0 +1,142 @@
+# cascade.py
+# Tiered model calls: a cheaper "small" tier answers first, and the configured model
+# (the "large" tier) is only called when that first answer is not good enough to keep.
+#
+# A small-tier reply is escalated when
+#   - the call failed or the reply could not be parsed,
+#   - it reports a finding at or above the escalation severity (worth a second look), or
+#   - local checks give it a low confidence: findings on lines outside the code or
+#     quoting code that is not on that line, an optimized version that no longer
+#     parses (Python), an empty summary, or a reply that needed JSON repair.
+#
+# Per-tier calls, answers, latency and escalation reasons are kept for /cascade/stats
+# (and counted in /metrics), so the policy can be tuned from real traffic.
+
+import ast
+import os
+from collections import deque
+from typing import NamedTuple
+
+TIERS = ("small", "large")
+REASONS = ("error", "parse_failure", "severity", "low_confidence")
+
+# Analysis uses Critical/Major/Minor and scans Critical/High/Medium/Low; both map onto one scale
+SEVERITY_RANKS = {"info": 0, "low": 1, "minor": 1, "medium": 2, "moderate": 2, "major": 3, "high": 3, "critical": 4}
+FINDING_KEYS = {"analyze": "errors", "scan": "vulnerabilities"}
+REPAIRED_PENALTY = 0.8
+WINDOW = 500
+
+
+class Decision(NamedTuple):
+    escalate: bool
+    reason: str  # "accepted" or one of REASONS
+    confidence: float
+
+
+def severity_rank(severity) -> int:
+    return SEVERITY_RANKS.get(str(severity or "").strip().lower(), 0)
+
+
+def _collapse(text: str) -> str:
+    return " ".join(text.split())
+
+
+def _parses(code: str) -> bool:
+    try:
+        ast.parse(code)
+    except (SyntaxError, ValueError):
+        return False
+    return True
+
+
+def confidence(task: str, code_text: str, result: dict, outcome: str = "ok") -> float:
+    """How far local checks back up a parsed reply, from 0.0 to 1.0."""
+    score = 1.0
+    if task in FINDING_KEYS:
+        lines = [_collapse(line) for line in code_text.split("\n")]
+        findings = [item for item in result.get(FINDING_KEYS[task]) or [] if isinstance(item, dict)]
+        if findings:
+            score = sum(_finding_holds(item, lines) for item in findings) / len(findings)
+    elif task == "optimize":
+        optimized = result.get("optimized_code") or ""
+        if not optimized.strip() or (_parses(code_text) and not _parses(optimized)):
+            score = 0.0
+    elif task == "summarize":
+        score = 1.0 if (result.get("summary") or "").strip() else 0.0
+    return score * (REPAIRED_PENALTY if outcome == "repaired" else 1.0)
+
+
+def _finding_holds(item: dict, lines: list) -> bool:
+    """The finding's line exists, and the code it quotes (if any) is on or next to it."""
+    line = item.get("line")
+    if not isinstance(line, int) or not 1 <= line <= len(lines):
+        return False
+    quoted = next((_collapse(part) for part in str(item.get("code") or "").split("\n") if part.strip()), "")
+    return not quoted or any(quoted in text for text in lines[max(0, line - 2):line + 1])
+
+
+class EscalationPolicy(NamedTuple):
+    severity: str = "high"        # escalate findings at or above this severity; "off" never does
+    min_confidence: float = 0.7   # escalate replies the local checks trust less than this
+
+    @classmethod
+    def from_env(cls) -> "EscalationPolicy":
+        """DETECTAI_CASCADE_SEVERITY and DETECTAI_CASCADE_MIN_CONFIDENCE."""
+        return cls(
+            severity=os.getenv("DETECTAI_CASCADE_SEVERITY", cls._field_defaults["severity"]).lower(),
+            min_confidence=float(os.getenv("DETECTAI_CASCADE_MIN_CONFIDENCE", str(cls._field_defaults["min_confidence"]))),
+        )
+
+    def decide(self, task: str, code_text: str, result, outcome: str = "ok") -> Decision:
+        if result is None:
+            return Decision(True, "parse_failure", 0.0)
+        score = round(confidence(task, code_text, result, outcome), 4)
+        if self.severity != "off" and task in FINDING_KEYS:
+            threshold = severity_rank(self.severity)
+            if any(isinstance(item, dict) and severity_rank(item.get("severity")) >= threshold
+                   for item in result.get(FINDING_KEYS[task]) or []):
+                return Decision(True, "severity", score)
+        if score < self.min_confidence:
+            return Decision(True, "low_confidence", score)
+        return Decision(False, "accepted", score)
+
+
+class CascadeStats:
+    """Per-tier calls and latency, plus who answered and why replies were escalated."""
+
+    def __init__(self, window: int = WINDOW):
+        self.calls = dict.fromkeys(TIERS, 0)
+        self.answered = dict.fromkeys(TIERS, 0)
+        self.escalations = dict.fromkeys(REASONS, 0)
+        self.latencies = {tier: deque(maxlen=window) for tier in TIERS}
+
+    def record_call(self, tier: str, latency: float):
+        self.calls[tier] += 1
+        self.latencies[tier].append(latency)
+
+    def record_answer(self, tier: str):
+        self.answered[tier] += 1
+
+    def record_escalation(self, reason: str):
+        self.escalations[reason] += 1
+
+    def stats(self) -> dict:
+        answered = sum(self.answered.values())
+        tiers = {}
+        for tier in TIERS:
+            ordered = sorted(self.latencies[tier])
+            p50 = ordered[len(ordered) // 2] if ordered else None
+            p95 = ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))] if ordered else None
+            tiers[tier] = {
+                "calls": self.calls[tier],
+                "answered": self.answered[tier],
+                "hit_rate": round(self.answered[tier] / answered, 4) if answered else 0.0,
+                "p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+                "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+            }
+        small_calls = self.calls["small"]
+        return {
+            "tiers": tiers,
+            "escalations": self.escalations,
+            "escalation_rate": round(sum(self.escalations.values()) / small_calls, 4) if small_calls else 0.0,
+        }
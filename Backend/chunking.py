@@ -0,0 +1,180 @@
+# chunking.py
+# Split large source files into token-budgeted chunks on function/class boundaries,
+# and merge the per-chunk model results back into one response.
+#
+# Line numbers reported for a chunk are relative to that chunk; merge_results()
+# shifts them back so they point at the original file.
+
+import ast
+from typing import NamedTuple
+
+# Rough size of a token for source code; good enough for budgeting without a tokenizer
+CHARS_PER_TOKEN = 4
+
+
+class Chunk(NamedTuple):
+    start_line: int  # 1-based line in the original file
+    text: str
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def split_units(code: str, language: str = None) -> list:
+    """Return the 1-based start lines of top-level units (functions, classes, blocks).
+
+    Python is split with ast; anything else (or Python that doesn't parse) falls
+    back to brace depth and indentation heuristics.
+    """
+    lines = code.split("\n")
+    if language in (None, "python"):
+        starts = _python_unit_starts(code)
+        if starts is not None:
+            return _normalize_starts(starts, len(lines))
+    return _normalize_starts(_heuristic_unit_starts(lines), len(lines))
+
+
+def make_chunks(code: str, max_tokens: int, language: str = None) -> list:
+    """Pack consecutive units into chunks of at most max_tokens (estimated)."""
+    lines = code.split("\n")
+    if estimate_tokens(code) <= max_tokens:
+        return [Chunk(1, code)]
+
+    starts = split_units(code, language)
+    spans = [(start, end - 1) for start, end in zip(starts, starts[1:] + [len(lines) + 1])]
+
+    chunks = []
+    cur_start, cur_lines = None, []
+    for start, end in spans:
+        unit = lines[start - 1:end]
+        unit_text = "\n".join(unit)
+        if cur_lines and estimate_tokens("\n".join(cur_lines + unit)) > max_tokens:
+            chunks.append(Chunk(cur_start, "\n".join(cur_lines)))
+            cur_start, cur_lines = None, []
+
+        if estimate_tokens(unit_text) > max_tokens:
+            # A single unit over budget is cut by lines
+            for piece_start, piece in split_by_lines(unit, start, max_tokens):
+                chunks.append(Chunk(piece_start, "\n".join(piece)))
+            continue
+
+        if cur_start is None:
+            cur_start = start
+        cur_lines.extend(unit)
+
+    if cur_lines:
+        chunks.append(Chunk(cur_start, "\n".join(cur_lines)))
+    return chunks
+
+
+def remap_lines(items: list, offset: int) -> list:
+    """Shift the 'line' field of each finding by offset (chunk start - 1)."""
+    remapped = []
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        item = dict(item)
+        line = item.get("line")
+        if isinstance(line, int):
+            item["line"] = line + offset
+        elif isinstance(line, str) and line.strip().isdigit():
+            item["line"] = int(line) + offset
+        remapped.append(item)
+    return remapped
+
+
+# Keys holding per-line findings, and keys holding free-form text, for each task
+LIST_KEYS = {
+    "analyze": ("errors", "fixes"),
+    "scan": ("vulnerabilities",),
+}
+TEXT_KEYS = {
+    "analyze": ("summary", "conclusion"),
+    "scan": ("summary",),
+}
+POINT_KEYS = {
+    "analyze": ("functionality",),
+    "scan": ("recommendations",),
+}
+
+
+def merge_results(task: str, chunks: list, results: list) -> dict:
+    """Merge per-chunk results (None for a chunk whose reply could not be parsed)."""
+    merged = {key: [] for key in LIST_KEYS[task] + POINT_KEYS[task]}
+    texts = {key: [] for key in TEXT_KEYS[task]}
+    failed = []
+
+    for chunk, result in zip(chunks, results):
+        if not isinstance(result, dict):
+            failed.append(chunk.start_line)
+            continue
+        for key in LIST_KEYS[task]:
+            merged[key].extend(remap_lines(result.get(key) or [], chunk.start_line - 1))
+        for key in POINT_KEYS[task]:
+            for point in result.get(key) or []:
+                if point not in merged[key]:
+                    merged[key].append(point)
+        for key in TEXT_KEYS[task]:
+            if result.get(key) and str(result[key]) not in texts[key]:
+                texts[key].append(str(result[key]))
+
+    for key in LIST_KEYS[task]:
+        merged[key].sort(key=lambda item: item["line"] if isinstance(item.get("line"), int) else 0)
+    for key, parts in texts.items():
+        merged[key] = " ".join(parts)
+
+    merged["chunks"] = len(chunks)
+    if failed:
+        merged["failed_chunks"] = failed
+    return merged
+
+
+def _python_unit_starts(code: str):
+    try:
+        tree = ast.parse(code)
+    except (SyntaxError, ValueError):
+        return None
+    starts = []
+    for node in tree.body:
+        decorators = getattr(node, "decorator_list", [])
+        starts.append(min([node.lineno] + [d.lineno for d in decorators]))
+    return starts
+
+
+def _heuristic_unit_starts(lines: list) -> list:
+    starts = []
+    depth = 0
+    prev_indented = False
+    for number, line in enumerate(lines, start=1):
+        stripped = line.strip()
+        if not stripped:
+            continue
+        at_top = depth == 0
+        # A top-level line after an indented block starts a new unit (indent-based languages)
+        if at_top and not line[0].isspace() and prev_indented and stripped[0] not in "})]":
+            starts.append(number)
+        depth = max(depth + line.count("{") - line.count("}"), 0)
+        # Closing the outermost brace ends a unit (brace-based languages)
+        if not at_top and depth == 0:
+            starts.append(number + 1)
+        prev_indented = line[0].isspace()
+    return starts
+
+
+def _normalize_starts(starts: list, line_count: int) -> list:
+    return sorted({1} | {s for s in starts if 1 < s <= line_count})
+
+
+def split_by_lines(lines: list, start: int, max_tokens: int):
+    """Yield (start line, lines) pieces of at most max_tokens (estimated) each."""
+    piece, piece_start, size = [], start, 0
+    for offset, line in enumerate(lines):
+        line_tokens = estimate_tokens(line)
+        if piece and size + line_tokens > max_tokens:
+            yield piece_start, piece
+            piece, piece_start, size = [], start + offset, 0
+        piece.append(line)
+        size += line_tokens
+    if piece:
+        yield piece_start, piece
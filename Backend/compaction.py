@@ -0,0 +1,194 @@
+# compaction.py
+# Shrink code before it goes into a prompt: drop license headers, collapse blank-line
+# runs and long comment blocks, cut minified lines, and if the result is still over
+# the endpoint's token budget, trim the lowest-value lines first.
+#
+# Every kept line remembers its original line number, so findings the model reports
+# against the compacted text can be mapped back with restore_lines().
+
+import re
+from functools import lru_cache
+from typing import NamedTuple
+
+from chunking import estimate_tokens
+
+try:
+    import tiktoken
+except ImportError:  # optional; without it tokens are estimated from length
+    tiktoken = None
+
+ENCODING = "o200k_base"  # tokenizer used by the gpt-4o family
+
+# Comment lines kept from the start of a longer comment block
+COMMENT_BLOCK_KEEP = 3
+# Lines longer than this are treated as minified/generated and cut
+LONG_LINE_CHARS = 400
+# Tighter cut applied when the code is still over budget
+OVER_BUDGET_LINE_CHARS = 160
+
+LICENSE_RE = re.compile(r"licen[sc]e|copyright|spdx|permission is hereby granted|all rights reserved", re.I)
+COMMENT_PREFIXES = ("//", "/*", "* ", "*/", "<!--", "-->", "-- ")
+# "#" lines that are code, not comments
+DIRECTIVE_RE = re.compile(r"#(!|include|define|if|ifdef|ifndef|else|elif|endif|pragma|undef|import|region|endregion)\b")
+
+
+class Compacted(NamedTuple):
+    text: str
+    line_map: list  # line_map[i] is the original line number of compacted line i + 1
+    original_tokens: int
+    tokens: int
+    lines_cut: int = 0  # lines dropped from the end to fit the budget; the model saw an incomplete file
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.original_tokens - self.tokens
+
+    def report(self) -> dict:
+        return {"original_tokens": self.original_tokens, "prompt_tokens": self.tokens, "tokens_saved": self.tokens_saved,
+                "lines_cut": self.lines_cut}
+
+
+@lru_cache(maxsize=1)
+def _encoder():
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.get_encoding(ENCODING)
+    except Exception:  # e.g. the encoding file can't be downloaded
+        return None
+
+
+def count_tokens(text: str) -> int:
+    encoder = _encoder()
+    if encoder is None:
+        return estimate_tokens(text)
+    return len(encoder.encode(text, disallowed_special=()))
+
+
+def is_comment(line: str) -> bool:
+    stripped = line.strip()
+    if stripped in ("#", "*"):
+        return True
+    if stripped.startswith("#"):
+        return not DIRECTIVE_RE.match(stripped)
+    return stripped.startswith(COMMENT_PREFIXES)
+
+
+def compact(code: str, budget: int, strip_comments: bool = True, lossy: bool = True) -> Compacted:
+    """Compact code for a prompt and keep it within budget tokens where possible.
+
+    With strip_comments=False (e.g. for the optimizer, whose output should keep the
+    comments) only whitespace is touched unless the code is over budget. With
+    lossy=False only whitespace is ever touched, and the result may be over budget.
+    """
+    original_tokens = count_tokens(code)
+    lines = list(enumerate(code.split("\n"), start=1))
+    lines = [(number, text.rstrip()) for number, text in lines]
+    lines = _collapse_blank_runs(lines)
+    if strip_comments:
+        lines = _drop_license_header(lines)
+        lines = _shorten_comment_blocks(lines)
+        lines = _cut_long_lines(lines, LONG_LINE_CHARS)
+
+    # Still over budget: drop comments, then cut long lines harder, then the tail
+    if lossy and _tokens(lines) > budget:
+        lines = [(number, text) for number, text in lines if not is_comment(text)]
+    if lossy and _tokens(lines) > budget:
+        lines = _cut_long_lines(lines, OVER_BUDGET_LINE_CHARS)
+    lines_cut = 0
+    if lossy and _tokens(lines) > budget:
+        lines, lines_cut = _cut_tail(lines, budget)
+
+    text = "\n".join(text for _, text in lines)
+    return Compacted(text, [number for number, _ in lines], original_tokens, count_tokens(text), lines_cut)
+
+
+def restore_lines(result: dict, line_map: list) -> dict:
+    """Map the 'line' of every finding in a parsed result back to the original file."""
+    for value in result.values():
+        if not isinstance(value, list):
+            continue
+        for item in value:
+            if isinstance(item, dict) and isinstance(item.get("line"), int) and 1 <= item["line"] <= len(line_map):
+                item["line"] = line_map[item["line"] - 1]
+    return result
+
+
+def _tokens(lines: list) -> int:
+    return sum(count_tokens(text) + 1 for _, text in lines)
+
+
+def _collapse_blank_runs(lines: list) -> list:
+    kept = []
+    for number, text in lines:
+        if not text and (not kept or not kept[-1][1]):
+            continue
+        kept.append((number, text))
+    while kept and not kept[-1][1]:
+        kept.pop()
+    return kept
+
+
+def _drop_license_header(lines: list) -> list:
+    """Remove a leading comment block that mentions a license or copyright."""
+    start = 1 if lines and lines[0][1].startswith("#!") else 0
+    end = start
+    while end < len(lines) and (is_comment(lines[end][1]) or not lines[end][1]):
+        end += 1
+    header = "\n".join(text for _, text in lines[start:end])
+    if end > start and LICENSE_RE.search(header):
+        return lines[:start] + lines[end:]
+    return lines
+
+
+def _shorten_comment_blocks(lines: list) -> list:
+    kept, run = [], []
+
+    def flush():
+        kept.extend(run[:COMMENT_BLOCK_KEEP])
+        if len(run) > COMMENT_BLOCK_KEEP:
+            number, text = run[COMMENT_BLOCK_KEEP]
+            indent = text[:len(text) - len(text.lstrip())]
+            kept.append((number, f"{indent}{_comment_marker(text)} ({len(run) - COMMENT_BLOCK_KEEP} comment lines omitted)"))
+        run.clear()
+
+    for number, text in lines:
+        if text and is_comment(text):
+            run.append((number, text))
+            continue
+        flush()
+        kept.append((number, text))
+    flush()
+    return kept
+
+
+def _comment_marker(line: str) -> str:
+    stripped = line.strip()
+    if stripped.startswith("#"):
+        return "#"
+    if stripped.startswith(("<!--", "-->")):
+        return "<!-- -->"
+    if stripped.startswith("-- "):
+        return "--"
+    return "//"
+
+
+def _cut_long_lines(lines: list, limit: int) -> list:
+    return [
+        (number, f"{text[:limit]} ...[{len(text) - limit} chars cut]" if len(text) > limit else text)
+        for number, text in lines
+    ]
+
+
+def _cut_tail(lines: list, budget: int):
+    """Keep the lines that fit in budget; returns (kept lines, number of lines cut)."""
+    kept, used = [], 0
+    for number, text in lines:
+        cost = count_tokens(text) + 1
+        if used + cost > budget:
+            cut = len(lines) - len(kept)
+            kept.append((number, f"... ({cut} more lines not shown)"))
+            return kept, cut
+        kept.append((number, text))
+        used += cost
+    return kept, 0
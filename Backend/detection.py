@@ -0,0 +1,124 @@
+# detection.py
+# Cheap "is this source code, and which language?" check, run before any model call.
+#
+# Everything is compiled once at import. detect() only looks at the first
+# SAMPLE_CHARS characters, so it stays well under a millisecond on large files.
+
+import re
+from typing import NamedTuple, Optional
+
+SAMPLE_CHARS = 2000
+MAX_LINES = 60
+
+# Inputs scoring at least this much are treated as code
+CODE_THRESHOLD = 0.35
+# A language is only named with at least this much fingerprint weight
+LANGUAGE_MIN_WEIGHT = 3
+
+EXTENSIONS = {
+    ".py": "python", ".pyw": "python",
+    ".js": "javascript", ".mjs": "javascript", ".cjs": "javascript", ".jsx": "javascript",
+    ".ts": "typescript", ".tsx": "typescript",
+    ".java": "java", ".kt": "kotlin", ".scala": "scala",
+    ".c": "c", ".h": "c", ".cpp": "cpp", ".cc": "cpp", ".cxx": "cpp", ".hpp": "cpp",
+    ".cs": "csharp", ".go": "go", ".rs": "rust", ".rb": "ruby", ".php": "php",
+    ".swift": "swift", ".sql": "sql", ".sh": "shell", ".bash": "shell",
+    ".html": "html", ".htm": "html", ".css": "css", ".scss": "css",
+}
+
+# One tokenizer pass over the sample: multi-char operators, tags, identifiers, numbers, single symbols
+TOKEN_RE = re.compile(
+    r"<\?php|#include|#define|#!|===|!==|=>|->|::|:=|==|!=|<<|>>|&&|\|\||</?[A-Za-z!][\w-]*"
+    r"|[A-Za-z_$@][\w$]*|\d+|[^\s\w]"
+)
+
+# language -> {token: weight}; a language's score is the weight of its tokens present in the sample
+FINGERPRINTS = {
+    "python": {"def": 3, "elif": 3, "self": 2, "None": 2, "True": 1, "False": 1, "import": 1, "lambda": 2,
+               "__init__": 3, "__name__": 3, "print": 1, "pass": 1, "except": 2, "raise": 1, "@property": 3},
+    "javascript": {"const": 2, "let": 1, "var": 1, "function": 2, "=>": 2, "console": 3, "===": 3, "!==": 3,
+                   "require": 2, "undefined": 3, "null": 1, "document": 1, "async": 1, "await": 1},
+    "typescript": {"interface": 2, "readonly": 3, "implements": 2, "boolean": 2, "any": 1, "export": 2, "string": 1,
+                   "@Component": 4, "@Injectable": 4, "@Input": 4, "constructor": 1, "private": 1, "Observable": 3},
+    "java": {"public": 1, "static": 1, "void": 2, "System": 3, "extends": 1, "final": 1, "@Override": 4,
+             "String": 2, "throws": 3, "private": 1, "package": 1, "new": 1},
+    "c": {"#include": 3, "#define": 3, "printf": 3, "malloc": 3, "sizeof": 2, "struct": 2, "int": 1, "char": 1, "void": 1},
+    "cpp": {"std": 4, "cout": 4, "template": 2, "namespace": 1, "#include": 2, "nullptr": 4, "::": 1, "<<": 1},
+    "csharp": {"using": 2, "namespace": 2, "Console": 4, "Task": 2, "get": 1, "set": 1, "var": 1, "public": 1, "string": 1},
+    "go": {"func": 3, ":=": 3, "package": 2, "fmt": 4, "chan": 3, "defer": 3, "nil": 2},
+    "rust": {"fn": 3, "mut": 3, "impl": 3, "pub": 2, "let": 1, "Option": 1, "Result": 1, "Self": 1, "match": 1, "->": 1},
+    "ruby": {"def": 1, "end": 2, "puts": 3, "elsif": 4, "nil": 1, "attr_accessor": 4, "require": 1, "do": 1},
+    "php": {"<?php": 6, "echo": 2, "$this": 4, "function": 1, "->": 1},
+    "sql": {"SELECT": 3, "FROM": 2, "WHERE": 2, "INSERT": 2, "INTO": 1, "CREATE": 2, "TABLE": 1, "JOIN": 2, "UPDATE": 1},
+    "shell": {"#!": 3, "echo": 2, "fi": 4, "esac": 4, "then": 1, "done": 1, "export": 1},
+    "html": {"<!DOCTYPE": 4, "<html": 4, "<body": 3, "<div": 2, "</div": 2, "<script": 2, "<span": 2, "</p": 1, "<a": 1},
+    "css": {"margin": 2, "padding": 2, "display": 2, "color": 1, "px": 2, "@media": 4, "rem": 1},
+}
+
+SYMBOLS = frozenset("{}()[];=<>+-*/&|!%:.,\"'") | {"===", "!==", "=>", "->", "::", ":=", "==", "!=", "<<", ">>", "&&", "||"}
+LINE_KEYWORDS = frozenset(
+    "import from package using return if for while def class function fn func let const var "
+    "public private protected static else elif try catch except finally switch case".split()
+)
+STOPWORDS = frozenset(
+    "the a an and or but is are was were be been of to in on at for with this that it its as by "
+    "i you he she we they my your our their me us them please can could would should will not do "
+    "does did have has had what which who when where why how there here so if just very".split()
+)
+
+
+class Detection(NamedTuple):
+    is_code: bool
+    language: Optional[str]
+    score: float
+
+
+def language_from_filename(filename: str) -> Optional[str]:
+    if not filename or "." not in filename:
+        return None
+    return EXTENSIONS.get(filename[filename.rfind("."):].lower())
+
+
+def detect(text: str, filename: str = None) -> Detection:
+    """Classify text as code or not code and guess its language."""
+    sample = text[:SAMPLE_CHARS]
+    lines = [line.strip() for line in sample.split("\n") if line.strip()][:MAX_LINES]
+    if not lines:
+        return Detection(False, None, 0.0)
+
+    tokens = TOKEN_RE.findall(sample)
+    words = [token for token in tokens if token[0].isalpha()]
+    symbols = sum(1 for token in tokens if token in SYMBOLS) / len(tokens)
+    prose = sum(1 for word in words if word.lower() in STOPWORDS) / len(words) if words else 0.0
+    code_lines = sum(1 for line in lines if _looks_like_code_line(line)) / len(lines)
+
+    present = set(tokens)
+    language, best = None, 0
+    for lang, weights in FINGERPRINTS.items():
+        weight = sum(w for token, w in weights.items() if token in present)
+        if weight > best:
+            language, best = lang, weight
+    if best < LANGUAGE_MIN_WEIGHT:
+        language = None
+
+    hinted = language_from_filename(filename)
+    if hinted:
+        language = hinted
+
+    score = 0.5 * code_lines + min(symbols, 0.3) + min(best * 0.04, 0.4) - 0.8 * prose
+    if hinted:
+        score += 0.2
+    score = round(max(0.0, min(score, 1.0)), 3)
+    is_code = score >= CODE_THRESHOLD
+    return Detection(is_code, language if is_code else None, score)
+
+
+def _looks_like_code_line(line: str) -> bool:
+    if line[-1] in ";{})":
+        return True
+    if line.startswith(("//", "/*", "*", "#include", "#!", "<", "@", "}", ")", "]")):
+        return True
+    if line.endswith(":") and line.split(None, 1)[0] in LINE_KEYWORDS:
+        return True
+    first = line.split(None, 1)[0].split("(", 1)[0]
+    return first in LINE_KEYWORDS or ("=" in line and "==" not in line)
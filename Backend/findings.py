@@ -0,0 +1,191 @@
+# findings.py
+# Every finding from analyses and security scans, kept in SQLite so dashboards can page
+# through and count past findings without re-running a scan (or calling the model).
+#
+# Each stored result becomes one row in "scans" and one row per finding in "findings".
+# Severity, type, category, file and task each have an index that also covers
+# created_at, so filters with a time range, pages in newest-first order and GROUP BY
+# counts are answered from the indexes alone. Text columns compare case-insensitively.
+# Pages use a keyset cursor (created_at, id), so deep pages cost the same as the first.
+#
+# A file reviewed again with the same code replaces its earlier scan, so cache hits and
+# resubmissions don't count the same findings twice. Rows past the retention period are
+# pruned on start and then at most once every PRUNE_SECONDS, as findings are recorded.
+
+import hashlib
+import sqlite3
+import threading
+import time
+
+from cache import normalize_code
+
+# Filters a query may use: name -> column
+FILTERS = {
+    "severity": "severity",
+    "vulnerability_type": "vulnerability_type",
+    "category": "category",
+    "file": "file",
+    "task": "task",
+}
+GROUPS = (*FILTERS, "day")
+MAX_PAGE = 500
+DAY_SECONDS = 86400
+PRUNE_SECONDS = 3600
+
+FINDING_KEYS = {"analyze": "errors", "scan": "vulnerabilities"}
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS scans ("
+    " id INTEGER PRIMARY KEY, created_at REAL NOT NULL, task TEXT NOT NULL, endpoint TEXT,"
+    " file TEXT COLLATE NOCASE, language TEXT, result_id TEXT, findings INTEGER NOT NULL, code_hash TEXT)",
+    "CREATE TABLE IF NOT EXISTS findings ("
+    " id INTEGER PRIMARY KEY, scan_id INTEGER NOT NULL REFERENCES scans (id), created_at REAL NOT NULL,"
+    " task TEXT NOT NULL, file TEXT COLLATE NOCASE, line INTEGER, severity TEXT COLLATE NOCASE,"
+    " category TEXT COLLATE NOCASE, vulnerability_type TEXT COLLATE NOCASE, description TEXT,"
+    " code TEXT, source TEXT)",
+    "CREATE INDEX IF NOT EXISTS findings_created ON findings (created_at)",
+    "CREATE INDEX IF NOT EXISTS findings_scan ON findings (scan_id)",
+    "CREATE INDEX IF NOT EXISTS scans_created ON scans (created_at)",
+    "CREATE INDEX IF NOT EXISTS scans_code ON scans (code_hash, task, file)",
+    *(f"CREATE INDEX IF NOT EXISTS findings_{column} ON findings ({column}, created_at)" for column in FILTERS.values()),
+)
+
+COLUMNS = ("id", "created_at", "task", "file", "line", "severity", "category", "vulnerability_type",
+           "description", "code", "source", "scan_id")
+
+
+class FindingsStore:
+    def __init__(self, db_path: str = "findings.db", retention_seconds: float = 90 * 86400):
+        self.db_path = db_path
+        self.retention_seconds = retention_seconds
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, timeout=5.0, check_same_thread=False)
+        if db_path != ":memory:":
+            self._db.execute("PRAGMA journal_mode=WAL")  # several workers may write to one file
+        self._db.execute(SCHEMA[0])
+        if "code_hash" not in {row[1] for row in self._db.execute("PRAGMA table_info(scans)")}:
+            self._db.execute("ALTER TABLE scans ADD COLUMN code_hash TEXT")  # a file from before scans were deduped
+        for statement in SCHEMA[1:]:
+            self._db.execute(statement)
+        self._pruned_at = 0.0
+        self.prune()
+
+    def record(self, task: str, result: dict, endpoint: str = None, file: str = None,
+               language: str = None, result_id: str = None, code: str = None) -> int:
+        """Store the findings of one "analyze" or "scan" result; returns how many were stored.
+
+        With the reviewed code, an earlier scan of the same code in the same file is replaced.
+        """
+        items = [item for item in result.get(FINDING_KEYS[task]) or [] if isinstance(item, dict)]
+        now = time.time()
+        if now - self._pruned_at >= PRUNE_SECONDS:
+            self.prune()
+        code_hash = hashlib.sha256(normalize_code(code).encode("utf-8")).hexdigest() if code is not None else None
+        with self._lock, self._db:
+            if code_hash is not None:
+                earlier = "SELECT id FROM scans WHERE code_hash = ? AND task = ? AND file IS ?"
+                self._db.execute(f"DELETE FROM findings WHERE scan_id IN ({earlier})", (code_hash, task, file))
+                self._db.execute(f"DELETE FROM scans WHERE id IN ({earlier})", (code_hash, task, file))
+            scan_id = self._db.execute(
+                "INSERT INTO scans (created_at, task, endpoint, file, language, result_id, findings, code_hash)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (now, task, endpoint, file, language, result_id, len(items), code_hash),
+            ).lastrowid
+            self._db.executemany(
+                "INSERT INTO findings (scan_id, created_at, task, file, line, severity, category,"
+                " vulnerability_type, description, code, source) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (scan_id, now, task, file, item.get("line") if isinstance(item.get("line"), int) else None,
+                     _severity(item.get("severity")), _label(item.get("category")),
+                     _label(item.get("vulnerability_type")), item.get("description"), item.get("code"),
+                     item.get("source") or "model")
+                    for item in items
+                ],
+            )
+        return len(items)
+
+    def query(self, filters: dict = None, since: float = None, until: float = None,
+              cursor: str = None, limit: int = 50) -> dict:
+        """One page of findings, newest first; pass the returned next_cursor for the next page."""
+        where, params = self._where(filters, since, until)
+        if cursor:
+            created_at, last_id = _parse_cursor(cursor)
+            where.append("(created_at < ? OR (created_at = ? AND id < ?))")
+            params += [created_at, created_at, last_id]
+        limit = max(1, min(int(limit), MAX_PAGE))
+        sql = (f"SELECT {', '.join(COLUMNS)} FROM findings {_clause(where)}"
+               " ORDER BY created_at DESC, id DESC LIMIT ?")
+        with self._lock:
+            rows = self._db.execute(sql, params + [limit + 1]).fetchall()
+        items = [dict(zip(COLUMNS, row)) for row in rows[:limit]]
+        next_cursor = f"{items[-1]['created_at']!r}:{items[-1]['id']}" if len(rows) > limit else None
+        return {"items": items, "next_cursor": next_cursor}
+
+    def summary(self, group_by: str, filters: dict = None, since: float = None, until: float = None) -> dict:
+        """Finding counts per value of group_by (one of GROUPS), largest first."""
+        if group_by not in GROUPS:
+            raise ValueError(f"Unknown group '{group_by}'.")
+        key = f"CAST(created_at / {DAY_SECONDS} AS INTEGER) * {DAY_SECONDS}" if group_by == "day" else FILTERS[group_by]
+        where, params = self._where(filters, since, until)
+        order = "value" if group_by == "day" else "count DESC, value"
+        sql = f"SELECT {key} AS value, COUNT(*) AS count FROM findings {_clause(where)} GROUP BY value ORDER BY {order}"
+        with self._lock:
+            rows = self._db.execute(sql, params).fetchall()
+        return {"group_by": group_by, "total": sum(count for _, count in rows),
+                "groups": [{"value": value, "count": count} for value, count in rows]}
+
+    def prune(self):
+        self._pruned_at = time.time()
+        cutoff = self._pruned_at - self.retention_seconds
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM findings WHERE created_at < ?", (cutoff,))
+            self._db.execute("DELETE FROM scans WHERE created_at < ?", (cutoff,))
+
+    def stats(self) -> dict:
+        with self._lock:
+            scans = self._db.execute("SELECT COUNT(*) FROM scans").fetchone()[0]
+            findings = self._db.execute("SELECT COUNT(*) FROM findings").fetchone()[0]
+        return {"path": self.db_path, "scans": scans, "findings": findings,
+                "retention_days": round(self.retention_seconds / 86400, 1)}
+
+    @staticmethod
+    def _where(filters, since, until):
+        where, params = [], []
+        for name, values in (filters or {}).items():
+            values = [value for value in values if value]
+            if values:
+                where.append(f"{FILTERS[name]} IN ({', '.join('?' * len(values))})")
+                params += values
+        if since is not None:
+            where.append("created_at >= ?")
+            params.append(since)
+        if until is not None:
+            where.append("created_at < ?")
+            params.append(until)
+        return where, params
+
+
+def _label(value):
+    """Category and type labels as short single-line strings (or None)."""
+    if value is None:
+        return None
+    text = " ".join(str(value).split())
+    return text or None
+
+
+def _severity(value):
+    """Models mix "high", "High" and "HIGH"; store one spelling so counts read cleanly."""
+    label = _label(value)
+    return label.capitalize() if label else None
+
+
+def _clause(where: list) -> str:
+    return f"WHERE {' AND '.join(where)}" if where else ""
+
+
+def _parse_cursor(cursor: str):
+    try:
+        created_at, last_id = cursor.rsplit(":", 1)
+        return float(created_at), int(last_id)
+    except ValueError:
+        raise ValueError("Malformed cursor.")
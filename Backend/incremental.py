@@ -0,0 +1,79 @@
+# incremental.py
+# Diff-aware re-review: find the hunks that changed between a previously reviewed
+# version of a file and the new one, so only those go back to the model, and
+# carry the earlier findings for unchanged lines forward with shifted line numbers.
+
+import difflib
+
+from chunking import Chunk, remap_lines, split_by_lines
+
+
+class Diff:
+    def __init__(self, base: str, new: str):
+        self.base_lines = base.split("\n")
+        self.new_lines = new.split("\n")
+        matcher = difflib.SequenceMatcher(None, self.base_lines, self.new_lines, autojunk=False)
+        self.opcodes = matcher.get_opcodes()
+
+    def changed_lines(self) -> list:
+        """1-based lines of the new file that were inserted/replaced, or that border a deletion."""
+        changed = set()
+        for tag, _, _, j1, j2 in self.opcodes:
+            if tag == "equal":
+                continue
+            if j2 > j1:
+                changed.update(range(j1 + 1, j2 + 1))
+            else:
+                # Pure deletion: re-check the lines on either side of the gap
+                changed.update(line for line in (j1, j1 + 1) if 1 <= line <= len(self.new_lines))
+        return sorted(changed)
+
+    def line_map(self) -> dict:
+        """{old 1-based line: new 1-based line} for lines that are unchanged."""
+        mapping = {}
+        for tag, i1, i2, j1, _ in self.opcodes:
+            if tag == "equal":
+                for offset in range(i2 - i1):
+                    mapping[i1 + offset + 1] = j1 + offset + 1
+        return mapping
+
+    def hunks(self, context: int = 3, max_tokens: int = None) -> list:
+        """Chunks of the new file covering every changed line plus `context` lines either side.
+
+        With max_tokens, a hunk larger than that is split into pieces that fit.
+        """
+        spans = []
+        for line in self.changed_lines():
+            start, end = max(1, line - context), min(len(self.new_lines), line + context)
+            if spans and start <= spans[-1][1] + 1:
+                spans[-1][1] = max(spans[-1][1], end)
+            else:
+                spans.append([start, end])
+        if max_tokens is None:
+            return [Chunk(start, "\n".join(self.new_lines[start - 1:end])) for start, end in spans]
+        return [
+            Chunk(piece_start, "\n".join(piece))
+            for start, end in spans
+            for piece_start, piece in split_by_lines(self.new_lines[start - 1:end], start, max_tokens)
+        ]
+
+
+def carry_forward(findings: list, line_map: dict, hunks: list) -> list:
+    """Findings on unchanged lines outside the re-reviewed hunks, moved to their new line numbers.
+
+    Findings inside a hunk are dropped: the model sees those lines again and will
+    report them again if they still apply.
+    """
+    reviewed = set()
+    for chunk in hunks:
+        reviewed.update(range(chunk.start_line, chunk.start_line + chunk.text.count("\n") + 1))
+
+    carried = []
+    for finding in findings:
+        if not isinstance(finding, dict) or not isinstance(finding.get("line"), int):
+            continue
+        new_line = line_map.get(finding["line"])
+        if new_line is None or new_line in reviewed:
+            continue
+        carried.extend(remap_lines([finding], new_line - finding["line"]))
+    return carried
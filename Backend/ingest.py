@@ -0,0 +1,99 @@
+# ingest.py
+# Read uploaded files in fixed-size chunks with an early size limit, and decode
+# them incrementally instead of buffering the raw bytes and then the text.
+
+import codecs
+from typing import NamedTuple
+
+from fastapi import HTTPException, UploadFile
+
+try:
+    from charset_normalizer import from_bytes as _detect_charset
+except ImportError:  # optional; without it we fall back to cp1252/latin-1
+    _detect_charset = None
+
+READ_SIZE = 64 * 1024
+
+BOMS = (
+    (codecs.BOM_UTF32_LE, "utf-32"),
+    (codecs.BOM_UTF32_BE, "utf-32"),
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+)
+# latin-1 maps every byte, so decoding can always finish
+FALLBACK_ENCODINGS = ("cp1252", "latin-1")
+
+
+class UploadedText(NamedTuple):
+    text: str
+    encoding: str
+    size: int  # bytes read
+
+
+def too_large(max_bytes: int) -> HTTPException:
+    return HTTPException(status_code=413, detail=f"File is too large. The limit is {max_bytes // 1024} KB.")
+
+
+async def read_upload(file: UploadFile, max_bytes: int, read_size: int = READ_SIZE) -> UploadedText:
+    """Read and decode an upload chunk by chunk, raising 413 as soon as it passes max_bytes."""
+    if file.size is not None and file.size > max_bytes:
+        raise too_large(max_bytes)
+
+    first = await file.read(read_size)
+    if b"\0" in first and _bom_encoding(first) is None:
+        raise HTTPException(status_code=415, detail="The uploaded file looks binary, not source code.")
+
+    for encoding in _candidate_encodings(first):
+        try:
+            return await _decode(file, first, encoding, max_bytes, read_size)
+        except UnicodeDecodeError:
+            # The upload is spooled by the server, so it can be re-read with the next encoding
+            await file.seek(0)
+            first = await file.read(read_size)
+    raise HTTPException(status_code=415, detail="Could not decode the uploaded file.")
+
+
+def decode_bytes(data: bytes) -> UploadedText:
+    """Decode an in-memory file (e.g. an archive member) with the same encoding detection."""
+    for encoding in _candidate_encodings(data[:READ_SIZE]):
+        try:
+            return UploadedText(data.decode(encoding), encoding, len(data))
+        except UnicodeDecodeError:
+            continue
+    raise UnicodeDecodeError("latin-1", data, 0, len(data), "undecodable")
+
+
+async def _decode(file, first, encoding, max_bytes, read_size) -> UploadedText:
+    decoder = codecs.getincrementaldecoder(encoding)()
+    parts = []
+    size = 0
+    chunk = first
+    while chunk:
+        size += len(chunk)
+        if size > max_bytes:
+            raise too_large(max_bytes)
+        parts.append(decoder.decode(chunk))
+        chunk = await file.read(read_size)
+    parts.append(decoder.decode(b"", final=True))
+    return UploadedText("".join(parts), encoding, size)
+
+
+def _bom_encoding(sample: bytes):
+    for bom, encoding in BOMS:
+        if sample.startswith(bom):
+            return encoding
+    return None
+
+
+def _candidate_encodings(sample: bytes) -> list:
+    bom = _bom_encoding(sample)
+    if bom:
+        return [bom]
+    candidates = ["utf-8"]
+    if _detect_charset is not None:
+        best = _detect_charset(sample).best()
+        if best is not None and best.encoding not in candidates:
+            candidates.append(best.encoding)
+    candidates.extend(e for e in FALLBACK_ENCODINGS if e not in candidates)
+    return candidates
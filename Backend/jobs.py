@@ -0,0 +1,339 @@
+# jobs.py
+# Background review jobs: submit returns a job id straight away, a pool of async
+# workers drains a priority queue, and clients poll or subscribe for the result.
+#
+# Interactive jobs (the web UI) always run before bulk jobs (CI scans). The queue
+# has a depth limit, and bulk jobs are refused earlier than interactive ones, so a
+# flood of CI work can't starve the UI.
+#
+# Job records live in a store: in memory by default, in SQLite so queued jobs survive
+# a restart, or in the shared store (shared.py) so any worker can report on a job
+# another worker runs. Any object with save/get/claim/renew/release can stand in for these.
+#
+# In SQLite each unfinished job is leased to the worker that queued or claimed it, and
+# the worker renews its leases while it runs. Workers sharing one file only take over
+# the jobs whose lease ran out (their worker stopped), never the ones still running.
+# Store calls run on a worker thread, so a busy database doesn't stall the event loop.
+
+import asyncio
+import itertools
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from shared import owner_id
+
+PRIORITIES = {"interactive": 0, "bulk": 10}
+FINISHED = ("done", "failed")
+# How often a worker re-reads a job that runs on another worker, while a client waits on it
+REMOTE_POLL_SECONDS = 0.5
+# A job whose worker has not renewed its lease for this long is taken over by another worker
+JOB_LEASE_SECONDS = 60.0
+
+
+class QueueFull(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, task: str, payload: dict, priority: str = "interactive"):
+        self.id = uuid.uuid4().hex
+        self.task = task
+        self.payload = payload  # code, filename, language, mode
+        self.priority = priority
+        self.status = "queued"  # queued -> running -> done | failed
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.result = None
+        self.error = None
+
+    def report(self) -> dict:
+        return {
+            "job_id": self.id,
+            "task": self.task,
+            "priority": self.priority,
+            "status": self.status,
+            "filename": self.payload.get("filename"),
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "result": self.result,
+            "error": self.error,
+        }
+
+    def to_record(self) -> dict:
+        return {**self.report(), "payload": self.payload}
+
+    @classmethod
+    def from_record(cls, record: dict) -> "Job":
+        job = cls(record["task"], record["payload"], record["priority"])
+        job.id = record["job_id"]
+        for field in ("status", "created_at", "started_at", "finished_at", "result", "error"):
+            setattr(job, field, record[field])
+        return job
+
+
+class MemoryJobStore:
+    """Keeps the most recent jobs in memory; the oldest finished ones are dropped past max_jobs."""
+
+    lease_seconds = None  # nothing to lease: no other worker sees these jobs
+
+    def __init__(self, max_jobs: int = 1000):
+        self.max_jobs = max_jobs
+        self._jobs = OrderedDict()
+
+    def save(self, job: Job):
+        self._jobs[job.id] = job
+        while len(self._jobs) > self.max_jobs:
+            oldest = next((key for key, old in self._jobs.items() if old.status in FINISHED), None)
+            if oldest is None:
+                break
+            del self._jobs[oldest]
+
+    def get(self, job_id: str):
+        return self._jobs.get(job_id)
+
+    def claim(self) -> list:
+        return []  # nothing survives a restart in memory
+
+    def renew(self):
+        pass
+
+    def release(self):
+        pass
+
+
+class SQLiteJobStore:
+    """Job records in a SQLite file, so queued and interrupted jobs are picked up again after a restart.
+
+    Several workers may share the file: a job saved by a worker is leased to it until
+    it finishes, and claim() only returns jobs whose lease has run out.
+    """
+
+    def __init__(self, db_path: str, ttl_seconds: float = 7 * 86400, lease_seconds: float = JOB_LEASE_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self.lease_seconds = lease_seconds
+        self.owner = owner_id()
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, timeout=5.0, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")  # several workers may share the file
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY, status TEXT NOT NULL, record TEXT NOT NULL, created_at REAL NOT NULL,"
+            " owner TEXT, lease_until REAL)"
+        )
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(jobs)")}
+        for column, kind in (("owner", "TEXT"), ("lease_until", "REAL")):
+            if column not in columns:  # a file written before jobs were leased
+                self._db.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status)")
+        self._db.execute("DELETE FROM jobs WHERE created_at < ?", (time.time() - ttl_seconds,))
+        self._db.commit()
+
+    def save(self, job: Job):
+        lease_until = None if job.status in FINISHED else time.time() + self.lease_seconds
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO jobs (id, status, record, created_at, owner, lease_until) VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET status = excluded.status, record = excluded.record,"
+                " owner = excluded.owner, lease_until = excluded.lease_until",
+                (job.id, job.status, json.dumps(job.to_record()), job.created_at, self.owner, lease_until),
+            )
+            self._db.commit()
+
+    def get(self, job_id: str):
+        with self._lock:
+            row = self._db.execute("SELECT record FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return Job.from_record(json.loads(row[0])) if row else None
+
+    def claim(self) -> list:
+        """Lease the unfinished jobs no live worker holds to this worker, and return them."""
+        now = time.time()
+        with self._lock, self._db:
+            self._db.execute("BEGIN IMMEDIATE")  # no other worker can claim between the SELECT and the UPDATE
+            rows = self._db.execute(
+                "SELECT id, record FROM jobs WHERE status NOT IN (?, ?) AND (lease_until IS NULL OR lease_until < ?)"
+                " ORDER BY created_at", (*FINISHED, now)
+            ).fetchall()
+            self._db.executemany(
+                "UPDATE jobs SET owner = ?, lease_until = ? WHERE id = ?",
+                [(self.owner, now + self.lease_seconds, job_id) for job_id, _ in rows],
+            )
+        return [Job.from_record(json.loads(record)) for _, record in rows]
+
+    def renew(self):
+        """Extend the leases on this worker's unfinished jobs."""
+        with self._lock, self._db:
+            self._db.execute(
+                "UPDATE jobs SET lease_until = ? WHERE owner = ? AND status NOT IN (?, ?)",
+                (time.time() + self.lease_seconds, self.owner, *FINISHED),
+            )
+
+    def release(self):
+        """Give up this worker's unfinished jobs, so another worker can claim them right away."""
+        with self._lock, self._db:
+            self._db.execute(
+                "UPDATE jobs SET lease_until = NULL WHERE owner = ? AND status NOT IN (?, ?)",
+                (self.owner, *FINISHED),
+            )
+
+
+class SharedJobStore:
+    """Job records in the shared store (shared.py), readable from every worker.
+
+    The store can't list its keys, so jobs that were queued when their worker stopped
+    are not picked up again; SQLiteJobStore does that on a single host.
+    """
+
+    lease_seconds = None
+
+    def __init__(self, store, ttl_seconds: float = 7 * 86400):
+        self.store = store
+        self.ttl_seconds = ttl_seconds
+
+    def save(self, job: Job):
+        self.store.set(f"job:{job.id}", json.dumps(job.to_record()), self.ttl_seconds)
+
+    def get(self, job_id: str):
+        record = self.store.get(f"job:{job_id}")
+        return Job.from_record(json.loads(record)) if record else None
+
+    def claim(self) -> list:
+        return []
+
+    def renew(self):
+        pass
+
+    def release(self):
+        pass
+
+
+class JobQueue:
+    def __init__(self, store, max_depth: int = 1000, bulk_share: float = 0.8):
+        self.store = store
+        self.max_depth = max_depth
+        self.bulk_depth = int(max_depth * bulk_share)
+        self._queue = asyncio.PriorityQueue()
+        self._order = itertools.count()  # FIFO within a priority
+        self._live = {}                  # job id -> Job while queued or running
+        self._changed = {}               # job id -> Event set on the next status change
+        self._workers = []
+        self._leases = None
+        self.running = 0
+        self.submitted = 0
+        self.rejected = 0
+
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    async def submit(self, job: Job) -> int:
+        """Queue a job and return its position; raises QueueFull when the queue is at its limit."""
+        limit = self.bulk_depth if job.priority == "bulk" else self.max_depth
+        if self.depth() >= limit:
+            self.rejected += 1
+            raise QueueFull(f"The job queue is full ({self.depth()} waiting).")
+        # Saved before a worker can pick it up, so the "queued" record never overwrites a later one
+        await asyncio.to_thread(self.store.save, job)
+        self._enqueue(job)
+        self.submitted += 1
+        return self.depth()
+
+    async def get(self, job_id: str):
+        return self._live.get(job_id) or await asyncio.to_thread(self.store.get, job_id)
+
+    async def wait(self, job_id: str, timeout: float):
+        """Wait up to timeout seconds for the job's next status change, then return the job."""
+        job = await self.get(job_id)
+        if job is None or job.status in FINISHED:
+            return job
+        if job_id not in self._live:
+            return await self._poll(job, timeout)
+        event = self._changed.setdefault(job_id, asyncio.Event())
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return await self.get(job_id)
+
+    def start(self, handler, workers: int):
+        """Start the workers; handler(job) is awaited for each job and returns its result."""
+        self._workers = [asyncio.create_task(self._work(handler)) for _ in range(workers)]
+        if self.store.lease_seconds:
+            self._leases = asyncio.create_task(self._keep_leases())
+
+    async def stop(self):
+        tasks = self._workers + ([self._leases] if self._leases is not None else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._workers, self._leases = [], None
+        await asyncio.to_thread(self.store.release)
+
+    def stats(self) -> dict:
+        return {
+            "queued": self.depth(),
+            "running": self.running,
+            "workers": len(self._workers),
+            "max_depth": self.max_depth,
+            "bulk_depth": self.bulk_depth,
+            "submitted": self.submitted,
+            "rejected": self.rejected,
+        }
+
+    async def _poll(self, job: Job, timeout: float):
+        """Wait for a job another worker is running, by re-reading it from the store."""
+        give_up_at = time.monotonic() + timeout
+        while time.monotonic() < give_up_at:
+            await asyncio.sleep(min(REMOTE_POLL_SECONDS, max(0.0, give_up_at - time.monotonic())))
+            current = await asyncio.to_thread(self.store.get, job.id)
+            if current is None or current.status != job.status:
+                return current
+        return await asyncio.to_thread(self.store.get, job.id)
+
+    async def _keep_leases(self):
+        """Renew this worker's leases and take over jobs whose worker stopped (at start and from then on)."""
+        while True:
+            await asyncio.to_thread(self.store.renew)
+            for job in await asyncio.to_thread(self.store.claim):
+                if job.id not in self._live:
+                    job.status = "queued"
+                    self._enqueue(job)
+            await asyncio.sleep(self.store.lease_seconds / 3)
+
+    def _enqueue(self, job: Job):
+        self._live[job.id] = job
+        self._queue.put_nowait((PRIORITIES[job.priority], next(self._order), job.id))
+
+    async def _work(self, handler):
+        while True:
+            _, _, job_id = await self._queue.get()
+            job = self._live.get(job_id)
+            if job is None:
+                continue
+            job.status, job.started_at = "running", time.time()
+            self.running += 1
+            await self._update(job)
+            try:
+                job.result = await handler(job)
+                job.status = "done"
+            except asyncio.CancelledError:
+                job.status = "queued"  # shutting down; with SQLite another worker (or the next start) claims it
+                self.store.save(job)
+                raise
+            except Exception as exc:
+                job.status, job.error = "failed", getattr(exc, "detail", None) or str(exc)
+            finally:
+                self.running -= 1
+            job.finished_at = time.time()
+            del self._live[job.id]
+            await self._update(job)
+
+    async def _update(self, job: Job):
+        await asyncio.to_thread(self.store.save, job)
+        event = self._changed.pop(job.id, None)
+        if event is not None:
+            event.set()
@@ -0,0 +1,68 @@
+# llm.py
+# Application-lifetime OpenAI client with a pooled, keep-alive HTTP transport.
+#
+# app.py opens the provider in the FastAPI lifespan and hands the client to
+# endpoints through Depends(get_llm), so every request reuses warm connections.
+
+import importlib.util
+import os
+
+import httpx
+from openai import AsyncOpenAI
+
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.getenv(name, str(default)))
+
+
+def _env_float(name: str, default: float) -> float:
+    return float(os.getenv(name, str(default)))
+
+
+class LLMClientProvider:
+    def __init__(self, api_key: str = None, timeout: float = 60.0,
+                 max_connections: int = 100, max_keepalive: int = 20,
+                 keepalive_expiry: float = 30.0, http2: bool = True):
+        self.api_key = api_key
+        self.timeout = timeout
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=keepalive_expiry,
+        )
+        # HTTP/2 needs the optional 'h2' package; fall back to HTTP/1.1 keep-alive without it
+        self.http2 = http2 and importlib.util.find_spec("h2") is not None
+        self._http = None
+        self._client = None
+
+    @classmethod
+    def from_env(cls, api_key: str = None) -> "LLMClientProvider":
+        return cls(
+            api_key=api_key,
+            timeout=_env_float("DETECTAI_LLM_TIMEOUT", 60.0),
+            max_connections=_env_int("DETECTAI_POOL_MAX_CONNECTIONS", 100),
+            max_keepalive=_env_int("DETECTAI_POOL_MAX_KEEPALIVE", 20),
+            keepalive_expiry=_env_float("DETECTAI_POOL_KEEPALIVE_EXPIRY", 30.0),
+            http2=os.getenv("DETECTAI_HTTP2", "1") != "0",
+        )
+
+    @property
+    def client(self) -> AsyncOpenAI:
+        # Lazily opened so scripts that import app.py without running the lifespan still work
+        if self._client is None:
+            self.start()
+        return self._client
+
+    def start(self):
+        if self._client is not None:
+            return
+        self._http = httpx.AsyncClient(limits=self.limits, http2=self.http2, timeout=self.timeout)
+        self._client = AsyncOpenAI(api_key=self.api_key, timeout=self.timeout, http_client=self._http)
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.close()
+        if self._http is not None:
+            await self._http.aclose()
+        self._client = None
+        self._http = None
@@ -0,0 +1,147 @@
+# metrics.py
+# Request and stage instrumentation, exposed in the Prometheus text format at /metrics.
+#
+# Every request is timed per route, and the work inside it is split into stages
+# (ingest, gate, rules, prompt, upstream, parse), each timed into a histogram labelled
+# with the endpoint that is being served. Token counts, cache outcomes and parse
+# outcomes are counted per endpoint and model, cascade tiers (cascade.py) per outcome
+# and latency, and a background probe measures event-loop lag (how late a short
+# sleep wakes up).
+#
+# With DETECTAI_TRACING=1 and OpenTelemetry installed, every stage is also a span.
+
+import asyncio
+import contextvars
+import functools
+import inspect
+import os
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+try:
+    from opentelemetry import trace
+except ImportError:  # optional; without it stages are only measured, not traced
+    trace = None
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+LAG_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+TOKEN_BUCKETS = (100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000)
+
+# The route being served; background work (jobs, batches) has no request
+current_endpoint = contextvars.ContextVar("current_endpoint", default="background")
+
+tracer = trace.get_tracer("detectai") if trace is not None and os.getenv("DETECTAI_TRACING") == "1" else None
+
+
+def _labels(names: tuple, values: tuple) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name, self.help, self.labels = name, help, labels
+        self._values = {}
+
+    def inc(self, *values, amount: float = 1):
+        self._values[values] = self._values.get(values, 0) + amount
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for values, total in sorted(self._values.items()):
+            lines.append(f"{self.name}{_labels(self.labels, values)} {total}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = SECONDS_BUCKETS):
+        self.name, self.help, self.labels, self.buckets = name, help, labels, buckets
+        self._series = {}  # label values -> [bucket counts..., count, sum]
+
+    def observe(self, value: float, *values):
+        series = self._series.get(values)
+        if series is None:
+            series = self._series[values] = [0] * (len(self.buckets) + 1) + [0.0]
+        index = bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            series[index] += 1
+        series[-2] += 1
+        series[-1] += value
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for values, series in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_labels(self.labels + ('le',), values + (bound,))} {cumulative}")
+            lines.append(f"{self.name}_bucket{_labels(self.labels + ('le',), values + ('+Inf',))} {series[-2]}")
+            lines.append(f"{self.name}_count{_labels(self.labels, values)} {series[-2]}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, values)} {series[-1]}")
+        return lines
+
+
+requests = Histogram("detectai_request_seconds", "Time to serve a request.", ("endpoint", "method", "status"))
+stages = Histogram("detectai_stage_seconds", "Time spent in each stage of a request.", ("endpoint", "stage"))
+prompt_sizes = Histogram("detectai_prompt_tokens", "Prompt tokens per model call.", ("endpoint",), TOKEN_BUCKETS)
+tokens = Counter("detectai_tokens_total", "Tokens sent to and received from the model.", ("endpoint", "model", "kind"))
+cache = Counter("detectai_cache_total", "Result cache lookups before a model call.", ("endpoint", "outcome"))
+parses = Counter("detectai_parse_total", "Model replies by parse outcome.", ("endpoint", "model", "outcome"))
+cascade = Counter("detectai_cascade_total", "Model calls per cascade tier, by outcome.", ("endpoint", "tier", "outcome"))
+cascade_seconds = Histogram("detectai_cascade_tier_seconds", "Time spent in each cascade tier.", ("tier",))
+loop_lag = Histogram("detectai_event_loop_lag_seconds", "How late the event loop wakes a sleeping task.", buckets=LAG_BUCKETS)
+REGISTRY = (requests, stages, prompt_sizes, tokens, cache, parses, cascade, cascade_seconds, loop_lag)
+
+
+def render() -> str:
+    return "\n".join(line for metric in REGISTRY for line in metric.render()) + "\n"
+
+
+async def watch_event_loop(interval: float = 0.1):
+    """Run for the life of the app; anything blocking the loop shows up as lag."""
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        loop_lag.observe(max(0.0, loop.time() - started - interval))
+
+
+@contextmanager
+def stage(name: str, endpoint: str = None):
+    """Time a block as one stage of the current request (and trace it when tracing is on)."""
+    endpoint = endpoint or current_endpoint.get()
+    started = time.perf_counter()
+    if tracer is None:
+        try:
+            yield
+        finally:
+            stages.observe(time.perf_counter() - started, endpoint, name)
+        return
+    with tracer.start_as_current_span(f"detectai.{name}", attributes={"detectai.endpoint": endpoint}):
+        try:
+            yield
+        finally:
+            stages.observe(time.perf_counter() - started, endpoint, name)
+
+
+def timed(name: str, function):
+    """Wrap a sync or async function so every call is timed as stage `name`."""
+    if inspect.iscoroutinefunction(function):
+        @functools.wraps(function)
+        async def timed_async(*args, **kwargs):
+            with stage(name):
+                return await function(*args, **kwargs)
+        return timed_async
+
+    @functools.wraps(function)
+    def timed_sync(*args, **kwargs):
+        with stage(name):
+            return function(*args, **kwargs)
+    return timed_sync
@@ -0,0 +1,281 @@
+# parsing.py
+# Turn model replies into validated results instead of giving up on the first
+# json.loads error: strip markdown fences, repair the usual near-JSON mistakes
+# (trailing/missing commas, truncated output), then check the shape against a
+# per-endpoint Pydantic model. Replies that still fail can be retried by the caller.
+
+import json
+import re
+from typing import Annotated, Any, List, Optional
+
+from pydantic import BaseModel, BeforeValidator, ConfigDict, ValidationError
+
+FENCE_RE = re.compile(r"```[\w+-]*[ \t]*\n?(.*?)(?:```|$)", re.S)
+
+
+def _line_number(value: Any) -> Optional[int]:
+    """Models sometimes send "12", "12-14" or "line 12"; keep the first number."""
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float):
+        return int(value)
+    match = re.search(r"\d+", str(value))
+    return int(match.group()) if match else None
+
+
+def _text(value: Any) -> Optional[str]:
+    if value is None or isinstance(value, str):
+        return value
+    if isinstance(value, list):
+        return "\n".join(str(item) for item in value)
+    return str(value)
+
+
+def _text_list(value: Any) -> List[str]:
+    if value is None:
+        return []
+    if isinstance(value, str):
+        return [value] if value else []
+    if isinstance(value, list):
+        return [item if isinstance(item, str) else json.dumps(item) for item in value]
+    return [str(value)]
+
+
+LineNumber = Annotated[Optional[int], BeforeValidator(_line_number)]
+Text = Annotated[Optional[str], BeforeValidator(_text)]
+TextList = Annotated[List[str], BeforeValidator(_text_list)]
+
+
+class Lenient(BaseModel):
+    # Unknown keys are kept so prompt changes never lose data
+    model_config = ConfigDict(extra="allow")
+
+
+class AnalysisError(Lenient):
+    line: LineNumber = None
+    description: Text = None
+    code: Text = None
+    fix_suggestion: Text = None
+    corrected_code: Text = None
+    severity: Text = None
+    category: Text = None
+
+
+class AnalysisFix(Lenient):
+    line: LineNumber = None
+    suggestion: Text = None
+    corrected_code: Text = None
+
+
+class AnalysisResult(Lenient):
+    errors: List[AnalysisError] = []
+    fixes: List[AnalysisFix] = []
+    summary: Text = ""
+    functionality: TextList = []
+    conclusion: Text = ""
+
+
+class ComplexityAnalysis(Lenient):
+    before: Text = None
+    after: Text = None
+
+
+class OptimizationResult(Lenient):
+    optimized_code: Text = ""
+    explanation: TextList = []
+    complexity_analysis: Optional[ComplexityAnalysis] = None
+    remarks: Text = ""
+
+
+class SummaryResult(Lenient):
+    summary: Text = ""
+    detailed_explanation: Text = ""
+    key_points: TextList = []
+
+
+class Vulnerability(Lenient):
+    line: LineNumber = None
+    description: Text = None
+    vulnerability_type: Text = None
+    severity: Text = None
+    fix_suggestion: Text = None
+
+
+class ScanResult(Lenient):
+    vulnerabilities: List[Vulnerability] = []
+    summary: Text = ""
+    recommendations: TextList = []
+
+
+def strip_fences(text: str) -> str:
+    """Return the contents of the first ``` block, or the text itself if there is none."""
+    match = FENCE_RE.search(text)
+    return match.group(1) if match else text
+
+
+def repair_json(text: str) -> Optional[str]:
+    """Best-effort fix of a near-JSON object; returns None if there is no object to recover.
+
+    Drops trailing commas, inserts missing commas between values, ignores text after
+    the object and, if the reply was cut off, keeps everything up to the last complete
+    value and closes the open brackets.
+    """
+    text = strip_fences(text)
+    start = text.find("{")
+    if start < 0:
+        return None
+
+    out = []
+    stack = []            # closing brackets still owed
+    in_string = escape = False
+    is_key = False        # the open string is an object key
+    literal = False       # inside a number / true / false / null
+    value_done = False    # the last thing outside a string was a complete value
+    expect_key = False
+    checkpoint = None     # (len(out), stack) just after the last complete value
+
+    def mark():
+        nonlocal checkpoint
+        checkpoint = (len(out), list(stack))
+
+    for ch in text[start:]:
+        if in_string:
+            out.append(ch)
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+                if not is_key:
+                    value_done = True
+                    mark()
+            continue
+
+        if literal and (ch.isspace() or ch in '{}[],:"'):
+            literal = False
+            mark()
+
+        if ch.isspace():
+            out.append(ch)
+        elif ch == '"':
+            if value_done and stack:
+                out.append(",")
+                expect_key = stack[-1] == "}"
+            is_key = expect_key
+            expect_key = value_done = False
+            in_string = True
+            out.append(ch)
+        elif ch in "{[":
+            if value_done and stack:
+                out.append(",")
+            stack.append("}" if ch == "{" else "]")
+            out.append(ch)
+            value_done = False
+            expect_key = ch == "{"
+        elif ch in "}]":
+            if not stack:
+                break
+            _drop_trailing_comma(out)
+            out.append(stack.pop())
+            value_done = True
+            expect_key = False
+            mark()
+            if not stack:
+                break
+        elif ch == ",":
+            out.append(ch)
+            value_done = False
+            expect_key = bool(stack) and stack[-1] == "}"
+        elif ch == ":":
+            out.append(ch)
+            value_done = expect_key = False
+        else:
+            if not literal and value_done and stack:
+                out.append(",")
+            literal = True
+            value_done = True
+            out.append(ch)
+
+    if stack:
+        # Truncated: fall back to the last complete value and close what was open then
+        if checkpoint is None:
+            return None
+        size, stack = checkpoint
+        del out[size:]
+        _drop_trailing_comma(out)
+        out.extend(reversed(stack))
+    return "".join(out)
+
+
+def _drop_trailing_comma(out: list):
+    i = len(out) - 1
+    while i >= 0 and out[i].isspace():
+        i -= 1
+    if i >= 0 and out[i] == ",":
+        del out[i]
+
+
+def parse_reply(text, model=None):
+    """Parse a model reply into a dict, repairing it if needed.
+
+    Returns (result, outcome) where outcome is "ok", "repaired" or "failed"
+    (result is None when it failed). With a model, the result is validated and
+    normalized against it.
+    """
+    if not isinstance(text, str):
+        return None, "failed"
+    outcome = "ok"
+    try:
+        data = json.loads(text, strict=False)
+    except json.JSONDecodeError:
+        repaired = repair_json(text)
+        if repaired is None:
+            return None, "failed"
+        try:
+            data = json.loads(repaired, strict=False)
+        except json.JSONDecodeError:
+            return None, "failed"
+        outcome = "repaired"
+
+    if not isinstance(data, dict):
+        return None, "failed"
+    if model is not None:
+        try:
+            data = model.model_validate(data).model_dump()
+        except ValidationError:
+            return None, "failed"
+    return data, outcome
+
+
+class ParseStats:
+    """Per-endpoint counts of how model replies parsed, for /parse/stats."""
+
+    OUTCOMES = ("ok", "repaired", "failed", "retries")
+
+    def __init__(self):
+        self._counts = {}
+
+    def record(self, endpoint: str, outcome: str):
+        counts = self._counts.setdefault(endpoint, dict.fromkeys(self.OUTCOMES, 0))
+        counts[outcome] += 1
+
+    def stats(self) -> dict:
+        endpoints = {endpoint: self._rates(counts) for endpoint, counts in self._counts.items()}
+        totals = dict.fromkeys(self.OUTCOMES, 0)
+        for counts in self._counts.values():
+            for outcome, count in counts.items():
+                totals[outcome] += count
+        return {**self._rates(totals), "endpoints": endpoints}
+
+    @staticmethod
+    def _rates(counts: dict) -> dict:
+        replies = counts["ok"] + counts["repaired"] + counts["failed"]
+        return {
+            **counts,
+            "replies": replies,
+            "repair_rate": round(counts["repaired"] / replies, 4) if replies else 0.0,
+            "failure_rate": round(counts["failed"] / replies, 4) if replies else 0.0,
+        }
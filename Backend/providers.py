@@ -0,0 +1,483 @@
+# providers.py
+# One interface over the model backends (OpenAI, Watsonx and a local deterministic
+# stub), plus a router that sends each call to the fastest healthy provider.
+#
+# The router keeps a window of recent latencies and outcomes per provider. A call
+# goes to the healthy provider with the lowest p50. If it is still running past the
+# hedge delay, the next provider is started too and the first answer wins. A 429,
+# 5xx, timeout or connection error fails over to the next provider and puts the
+# failing one on a short cooldown (Retry-After when the provider sends one).
+#
+# Each provider also has a ProviderLimiter (ratelimit.py): its RPM/TPM buckets and
+# adaptive concurrency hold calls back before they are sent, so traffic settles
+# just under the provider's quota instead of running into it.
+#
+# Used by app.py and by .ai/evaluate_scans.py; the OpenAI SDK is only needed when
+# the "openai" provider is configured.
+
+import asyncio
+import json
+import os
+import time
+from collections import deque
+from typing import NamedTuple
+
+import httpx
+
+from ratelimit import ProviderLimiter, estimate_call_tokens
+
+try:
+    import openai
+except ImportError:  # optional; only the "openai" provider needs it
+    openai = None
+
+# Latency/outcome samples kept per provider
+WINDOW = 200
+# Samples needed before a provider's latency is trusted for ranking and hedging
+MIN_SAMPLES = 5
+# Providers failing more than this share of recent calls are tried last
+MAX_ERROR_RATE = 0.5
+# Cooldown after a retryable failure when the provider gives no Retry-After
+COOLDOWN_SECONDS = 5.0
+MAX_COOLDOWN_SECONDS = 60.0
+# Hedging never starts a second provider sooner than this
+MIN_HEDGE_SECONDS = 1.0
+
+
+class ProviderError(Exception):
+    def __init__(self, provider: str, message: str, status: int = 502,
+                 retryable: bool = True, retry_after: float = None, timeout: bool = False):
+        super().__init__(f"{provider}: {message}")
+        self.provider = provider
+        self.status = status
+        self.retryable = retryable
+        self.retry_after = retry_after
+        self.timeout = timeout
+
+
+class Completion(NamedTuple):
+    text: str
+    provider: str
+    latency: float  # seconds
+    model: str = None
+
+
+def _retry_after(headers) -> float:
+    value = headers.get("retry-after") if headers is not None else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def _status_error(provider: str, status: int, headers) -> ProviderError:
+    return ProviderError(provider, f"HTTP {status}", status=status,
+                         retryable=status == 429 or status >= 500, retry_after=_retry_after(headers))
+
+
+class Provider:
+    """Base class: complete() returns the reply text; stream() yields it in pieces."""
+
+    name = "provider"
+    model = None
+
+    @property
+    def id(self) -> str:
+        return f"{self.name}:{self.model}"
+
+    async def complete(self, messages: list, temperature=None, json_mode=False, timeout=None) -> str:
+        raise NotImplementedError
+
+    async def stream(self, messages: list, temperature=None, json_mode=False, timeout=None):
+        # Providers without token streaming send the whole reply as one piece
+        yield await self.complete(messages, temperature, json_mode, timeout)
+
+    def start(self):
+        pass
+
+    async def aclose(self):
+        pass
+
+
+class OpenAIProvider(Provider):
+    name = "openai"
+
+    def __init__(self, client_provider, model: str = "gpt-4o-mini"):
+        self.client_provider = client_provider  # llm.LLMClientProvider: pooled AsyncOpenAI client
+        self.model = model
+
+    async def complete(self, messages, temperature=None, json_mode=False, timeout=None):
+        params = self._params(messages, temperature, json_mode)
+        response = await self._call(params, timeout)
+        return response.choices[0].message.content
+
+    async def stream(self, messages, temperature=None, json_mode=False, timeout=None):
+        params = {**self._params(messages, temperature, json_mode), "stream": True}
+        stream = await self._call(params, timeout)
+        # A stream can also fail after it opened (a dropped connection, an error event)
+        try:
+            async for event in stream:
+                if event.choices and event.choices[0].delta.content:
+                    yield event.choices[0].delta.content
+        except (openai.APIError, httpx.HTTPError) as exc:
+            raise self._error(exc) from exc
+
+    def start(self):
+        self.client_provider.start()
+
+    async def aclose(self):
+        await self.client_provider.aclose()
+
+    def _params(self, messages, temperature, json_mode):
+        params = {"model": self.model, "messages": messages}
+        if temperature is not None:
+            params["temperature"] = temperature
+        if json_mode:
+            params["response_format"] = {"type": "json_object"}
+        return params
+
+    async def _call(self, params, timeout):
+        try:
+            return await self.client_provider.client.chat.completions.create(**params, timeout=timeout)
+        except (openai.APIError, httpx.HTTPError) as exc:
+            raise self._error(exc) from exc
+
+    def _error(self, exc) -> ProviderError:
+        if isinstance(exc, (openai.APITimeoutError, httpx.TimeoutException)):
+            return ProviderError(self.name, "timed out", status=504, timeout=True)
+        if isinstance(exc, openai.APIStatusError):
+            return _status_error(self.name, exc.status_code, exc.response.headers)
+        if isinstance(exc, (openai.APIConnectionError, httpx.TransportError)):
+            return ProviderError(self.name, f"connection failed: {exc}")
+        return ProviderError(self.name, f"request failed: {exc}")
+
+
+class WatsonxProvider(Provider):
+    """IBM watsonx.ai text generation over a pooled async HTTP client, reusing the IAM token until it expires."""
+
+    name = "watsonx"
+    IAM_TOKEN_URL = "https://iam.cloud.ibm.com/identity/token"
+    API_VERSION = "2024-03-01"
+
+    def __init__(self, api_key: str, project_id: str, region: str = "us-south",
+                 model: str = "ibm/granite-13b-chat-v2", max_new_tokens: int = 300, timeout: float = 60.0):
+        self.api_key = api_key
+        self.project_id = project_id
+        self.model = model
+        self.max_new_tokens = max_new_tokens
+        self.url = f"https://{region}.ml.cloud.ibm.com/ml/v1/text/generation?version={self.API_VERSION}"
+        self._http = httpx.AsyncClient(timeout=timeout)
+        self._token = None
+        self._token_expires = 0.0
+        self._token_lock = asyncio.Lock()
+
+    @classmethod
+    def from_env(cls) -> "WatsonxProvider":
+        api_key, project_id = os.getenv("WATSONX_API_KEY"), os.getenv("WATSONX_PROJECT_ID")
+        if not api_key or not project_id:
+            raise RuntimeError("Missing required Watsonx environment variables")
+        return cls(
+            api_key,
+            project_id,
+            region=os.getenv("WATSONX_REGION") or "us-south",
+            model=os.getenv("WATSONX_MODEL_ID", "ibm/granite-13b-chat-v2"),
+            max_new_tokens=int(os.getenv("WATSONX_MAX_NEW_TOKENS", "300")),
+        )
+
+    async def complete(self, messages, temperature=None, json_mode=False, timeout=None):
+        payload = {
+            "model_id": self.model,
+            "project_id": self.project_id,
+            "input": self._prompt(messages),
+            "parameters": {
+                "decoding_method": "greedy",
+                "max_new_tokens": self.max_new_tokens,
+                "temperature": 0.2 if temperature is None else temperature,
+            },
+        }
+        headers = {"Authorization": f"Bearer {await self._bearer()}"}
+        data = await self._request("POST", self.url, json=payload, headers=headers, timeout=timeout)
+        return data["results"][0]["generated_text"]
+
+    async def aclose(self):
+        await self._http.aclose()
+
+    @staticmethod
+    def _prompt(messages):
+        # text/generation takes one string; keep the roles visible to the model
+        parts = [f"{message['role'].capitalize()}:\n{message['content']}" for message in messages]
+        return "\n\n".join(parts) + "\n\nAssistant:\n"
+
+    async def _bearer(self) -> str:
+        async with self._token_lock:
+            if self._token is None or time.time() > self._token_expires - 60:
+                data = await self._request(
+                    "POST", self.IAM_TOKEN_URL,
+                    data={"grant_type": "urn:ibm:params:oauth:grant-type:apikey", "apikey": self.api_key},
+                )
+                self._token = data["access_token"]
+                self._token_expires = data.get("expiration", time.time() + 3600)
+            return self._token
+
+    async def _request(self, method, url, timeout=None, **kwargs) -> dict:
+        try:
+            response = await self._http.request(method, url, timeout=timeout or httpx.USE_CLIENT_DEFAULT, **kwargs)
+        except httpx.TimeoutException:
+            raise ProviderError(self.name, "timed out", status=504, timeout=True)
+        except httpx.TransportError as exc:
+            raise ProviderError(self.name, f"connection failed: {exc}")
+        if response.status_code >= 400:
+            raise _status_error(self.name, response.status_code, response.headers)
+        return response.json()
+
+
+class StubProvider(Provider):
+    """Deterministic local replies for tests, demos and offline runs; no network.
+
+    Recognizes the schema in the prompt and returns a valid, empty result for it.
+    """
+
+    name = "stub"
+    model = "stub"
+
+    # (marker in the prompt, reply) - checked in order
+    REPLIES = (
+        ("vulnerabilities", {"vulnerabilities": [], "summary": "Stub scan: no model was called.", "recommendations": []}),
+        ("optimized_code", None),  # echoes the code back, see complete()
+        ("key_points", {"summary": "Stub summary: no model was called.", "detailed_explanation": "", "key_points": []}),
+        ("errors", {"errors": [], "fixes": [], "summary": "Stub analysis: no model was called.", "functionality": [], "conclusion": ""}),
+        ("decision", {"decision": "comment_only", "comment": "Stub provider: no model was called."}),
+    )
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+
+    async def complete(self, messages, temperature=None, json_mode=False, timeout=None):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        prompt = "\n".join(message["content"] for message in messages)
+        for marker, reply in self.REPLIES:
+            if f'"{marker}"' in prompt:
+                if reply is None:
+                    code = messages[-1]["content"].removeprefix("Code:\n")
+                    reply = {"optimized_code": code, "explanation": [], "complexity_analysis": None,
+                             "remarks": "Stub optimizer: code returned unchanged."}
+                return json.dumps(reply)
+        return json.dumps({"summary": "Stub provider: no model was called."})
+
+
+class ProviderHealth:
+    """Rolling latency and error window for one provider."""
+
+    def __init__(self, window: int = WINDOW):
+        self.latencies = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)  # True for a failed call
+        self.calls = 0
+        self.errors = 0
+        self.hedged = 0
+        self.failures_in_a_row = 0
+        self.cooldown_until = 0.0
+
+    def record(self, latency: float):
+        self.calls += 1
+        self.latencies.append(latency)
+        self.outcomes.append(False)
+        self.failures_in_a_row = 0
+
+    def record_error(self, error: ProviderError):
+        self.calls += 1
+        self.errors += 1
+        self.outcomes.append(True)
+        self.failures_in_a_row += 1
+        if error.retryable:
+            backoff = min(COOLDOWN_SECONDS * self.failures_in_a_row, MAX_COOLDOWN_SECONDS)
+            self.cooldown_until = time.monotonic() + (error.retry_after or backoff)
+
+    def percentile(self, q: float):
+        if len(self.latencies) < MIN_SAMPLES:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def error_rate(self) -> float:
+        return sum(self.outcomes) / len(self.outcomes) if self.outcomes else 0.0
+
+    def healthy(self) -> bool:
+        return time.monotonic() >= self.cooldown_until and self.error_rate() <= MAX_ERROR_RATE
+
+    def stats(self) -> dict:
+        p50, p95 = self.percentile(0.5), self.percentile(0.95)
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "hedged": self.hedged,
+            "error_rate": round(self.error_rate(), 4),
+            "p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+            "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+            "healthy": self.healthy(),
+            "cooldown_seconds": round(max(0.0, self.cooldown_until - time.monotonic()), 1),
+        }
+
+
+class ProviderRouter:
+    def __init__(self, providers: list, hedge_after="auto", max_hedges: int = 1, limiters: dict = None):
+        """hedge_after: seconds, "auto" (the primary's p95) or None to never hedge.
+
+        limiters maps provider id -> ProviderLimiter; providers without one only get
+        adaptive concurrency.
+        """
+        if not providers:
+            raise ValueError("At least one provider is required.")
+        self.providers = providers
+        self.hedge_after = hedge_after
+        self.max_hedges = max_hedges
+        self.health = {provider.id: ProviderHealth() for provider in providers}
+        self.limiters = {provider.id: (limiters or {}).get(provider.id) or ProviderLimiter() for provider in providers}
+
+    @property
+    def id(self) -> str:
+        return ",".join(provider.id for provider in self.providers)
+
+    def ranked(self) -> list:
+        """Healthy providers first, fastest p50 first; configuration order breaks ties and covers cold starts."""
+        def rank(indexed):
+            index, provider = indexed
+            health = self.health[provider.id]
+            return (not health.healthy(), health.percentile(0.5) or 0.0, index)
+        return [provider for _, provider in sorted(enumerate(self.providers), key=rank)]
+
+    async def complete(self, messages: list, temperature=None, json_mode=False, timeout=None) -> Completion:
+        waiting = deque(self.ranked())
+        primary = waiting[0]
+        running = {}  # task -> provider
+        last_error = None
+        hedges = 0
+
+        def launch():
+            provider = waiting.popleft()
+            running[asyncio.ensure_future(self._timed(provider, messages, temperature, json_mode, timeout))] = provider
+            return provider
+
+        launch()
+        try:
+            while running:
+                delay = self._hedge_delay(primary) if waiting and hedges < self.max_hedges else None
+                done, _ = await asyncio.wait(running, timeout=delay, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # The current call is slow: start the next provider alongside it
+                    hedges += 1
+                    self.health[launch().id].hedged += 1
+                    continue
+                for task in done:
+                    del running[task]
+                    error = task.exception()
+                    if error is None:
+                        return task.result()
+                    if not isinstance(error, ProviderError) or not error.retryable:
+                        raise error
+                    last_error = error
+                if not running and waiting:
+                    launch()  # fail over
+        finally:
+            for task in running:
+                task.cancel()
+        raise last_error
+
+    async def stream(self, messages: list, temperature=None, json_mode=False, timeout=None):
+        """Yield (piece, provider id); fails over to the next provider only before the first piece."""
+        last_error = None
+        tokens = estimate_call_tokens(messages)
+        for provider in self.ranked():
+            health, limiter = self.health[provider.id], self.limiters[provider.id]
+            await limiter.acquire(tokens)
+            started, sent = time.monotonic(), False
+            try:
+                async for piece in provider.stream(messages, temperature, json_mode, timeout):
+                    sent = True
+                    yield piece, provider.id
+            except ProviderError as error:
+                health.record_error(error)
+                limiter.release(error.status == 429, error.retry_after)
+                if sent or not error.retryable:
+                    raise
+                last_error = error
+                continue
+            except BaseException:
+                limiter.release()
+                raise
+            health.record(time.monotonic() - started)
+            limiter.release()
+            return
+        raise last_error
+
+    def start(self):
+        for provider in self.providers:
+            provider.start()
+
+    async def aclose(self):
+        for provider in self.providers:
+            await provider.aclose()
+
+    def stats(self) -> dict:
+        ranked = self.ranked()
+        return {
+            "order": [provider.id for provider in ranked],
+            "providers": {
+                provider.id: {**self.health[provider.id].stats(), "limits": self.limiters[provider.id].stats()}
+                for provider in self.providers
+            },
+        }
+
+    def _hedge_delay(self, primary):
+        if self.hedge_after is None:
+            return None
+        if self.hedge_after != "auto":
+            return float(self.hedge_after)
+        p95 = self.health[primary.id].percentile(0.95)
+        return max(p95, MIN_HEDGE_SECONDS) if p95 is not None else None
+
+    async def _timed(self, provider, messages, temperature, json_mode, timeout) -> Completion:
+        health, limiter = self.health[provider.id], self.limiters[provider.id]
+        await limiter.acquire(estimate_call_tokens(messages))
+        started = time.monotonic()  # time spent waiting on the limiter is not the provider's latency
+        try:
+            text = await provider.complete(messages, temperature, json_mode, timeout)
+        except ProviderError as error:
+            health.record_error(error)
+            limiter.release(error.status == 429, error.retry_after)
+            raise
+        except BaseException:  # e.g. cancelled as the losing hedge
+            limiter.release()
+            raise
+        latency = time.monotonic() - started
+        health.record(latency)
+        limiter.release()
+        return Completion(text, provider.name, latency, provider.model)
+
+
+def router_from_env(client_provider=None, default: str = "openai", prefix: str = "DETECTAI_") -> ProviderRouter:
+    """Build the router from DETECTAI_PROVIDERS, e.g. "openai,watsonx" (in preference order).
+
+    DETECTAI_HEDGE_AFTER is seconds, "auto" (default) or "off". Per-provider quotas
+    come from DETECTAI_<NAME>_RPM, _TPM and _MAX_CONCURRENCY (see ratelimit.py).
+    Another prefix builds a second router, e.g. "DETECTAI_CASCADE_" reads
+    DETECTAI_CASCADE_PROVIDERS, _OPENAI_MODEL and _HEDGE_AFTER.
+    """
+    providers = []
+    for name in os.getenv(f"{prefix}PROVIDERS", default).split(","):
+        name = name.strip()
+        if name == "openai":
+            if client_provider is None:
+                from llm import LLMClientProvider
+                client_provider = LLMClientProvider.from_env(os.getenv("OPENAI_API_KEY"))
+            providers.append(OpenAIProvider(client_provider, os.getenv(f"{prefix}OPENAI_MODEL", "gpt-4o-mini")))
+        elif name == "watsonx":
+            providers.append(WatsonxProvider.from_env())
+        elif name == "stub":
+            providers.append(StubProvider(delay=float(os.getenv("DETECTAI_STUB_DELAY", "0"))))
+        elif name:
+            raise ValueError(f"Unknown provider '{name}'. Use openai, watsonx or stub.")
+
+    hedge_after = os.getenv(f"{prefix}HEDGE_AFTER", "auto")
+    limiters = {provider.id: ProviderLimiter.from_env(provider.name) for provider in providers}
+    return ProviderRouter(providers, hedge_after=None if hedge_after == "off" else hedge_after, limiters=limiters)
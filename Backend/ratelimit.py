@@ -0,0 +1,176 @@
+# ratelimit.py
+# Stay just under a provider's quota instead of bouncing off it:
+#   - token buckets for requests per minute and tokens per minute, charged with the
+#     estimated size of each call before it is sent
+#   - AIMD concurrency: +1/limit per successful call, halve on a 429 (at most once a
+#     second), and pause new calls for Retry-After when the provider asks
+#   - retries with full-jitter exponential backoff inside a total deadline
+#
+# providers.ProviderRouter holds one ProviderLimiter per provider.
+
+import asyncio
+import os
+import random
+import time
+
+# Output tokens assumed per call when charging the tokens-per-minute bucket
+EXPECTED_OUTPUT_TOKENS = 500
+CHARS_PER_TOKEN = 4
+# Minimum time between two multiplicative decreases, so one burst of 429s halves once
+DECREASE_INTERVAL = 1.0
+
+
+def estimate_call_tokens(messages: list) -> int:
+    chars = sum(len(message.get("content") or "") for message in messages)
+    return chars // CHARS_PER_TOKEN + EXPECTED_OUTPUT_TOKENS
+
+
+class TokenBucket:
+    """Refills continuously at per_minute/60 per second, up to one minute's worth."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()  # callers are served in arrival order
+
+    async def acquire(self, amount: float = 1):
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+
+    def drain(self):
+        """The provider says the quota is used up: start refilling from empty."""
+        self._refill()
+        self.tokens = 0.0
+
+    def available(self) -> int:
+        self._refill()
+        return int(self.tokens)
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+
+class AdaptiveConcurrency:
+    """AIMD limit on calls in flight, with a pause window for Retry-After.
+
+    release() is synchronous so a cancelled call (e.g. a losing hedge) can always
+    give its slot back.
+    """
+
+    def __init__(self, maximum: int = 64, minimum: int = 1, decrease: float = 0.5):
+        self.maximum = maximum
+        self.minimum = minimum
+        self.decrease = decrease
+        self.limit = float(maximum)
+        self.in_flight = 0
+        self.throttled = 0
+        self.paused_until = 0.0
+        self._last_decrease = 0.0
+        self._waiters = []
+
+    async def acquire(self):
+        while True:
+            pause = self.paused_until - time.monotonic()
+            if pause > 0:
+                await asyncio.sleep(pause)
+                continue
+            if self.in_flight < int(self.limit):
+                self.in_flight += 1
+                return
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            finally:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+
+    def release(self, throttled: bool = False, retry_after: float = None):
+        self.in_flight -= 1
+        now = time.monotonic()
+        if throttled:
+            self.throttled += 1
+            if now - self._last_decrease >= DECREASE_INTERVAL:
+                self.limit = max(self.minimum, self.limit * self.decrease)
+                self._last_decrease = now
+            if retry_after:
+                self.paused_until = max(self.paused_until, now + retry_after)
+        else:
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+        waiters, self._waiters = self._waiters, []
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+
+class ProviderLimiter:
+    def __init__(self, rpm: float = None, tpm: float = None, max_concurrency: int = 64):
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.concurrency = AdaptiveConcurrency(max_concurrency)
+
+    @classmethod
+    def from_env(cls, provider: str) -> "ProviderLimiter":
+        """DETECTAI_<PROVIDER>_RPM / _TPM / _MAX_CONCURRENCY, e.g. DETECTAI_OPENAI_TPM=200000."""
+        prefix = f"DETECTAI_{provider.upper()}_"
+        rpm, tpm = os.getenv(prefix + "RPM"), os.getenv(prefix + "TPM")
+        return cls(
+            rpm=float(rpm) if rpm else None,
+            tpm=float(tpm) if tpm else None,
+            max_concurrency=int(os.getenv(prefix + "MAX_CONCURRENCY", "64")),
+        )
+
+    async def acquire(self, tokens: int):
+        if self.requests is not None:
+            await self.requests.acquire(1)
+        if self.tokens is not None:
+            await self.tokens.acquire(tokens)
+        await self.concurrency.acquire()
+
+    def release(self, throttled: bool = False, retry_after: float = None):
+        if throttled:
+            for bucket in (self.requests, self.tokens):
+                if bucket is not None:
+                    bucket.drain()
+        self.concurrency.release(throttled, retry_after)
+
+    def stats(self) -> dict:
+        return {
+            "concurrency_limit": round(self.concurrency.limit, 2),
+            "in_flight": self.concurrency.in_flight,
+            "throttled": self.concurrency.throttled,
+            "paused_seconds": round(max(0.0, self.concurrency.paused_until - time.monotonic()), 1),
+            "requests_available": self.requests.available() if self.requests else None,
+            "tokens_available": self.tokens.available() if self.tokens else None,
+        }
+
+
+async def with_retries(call, deadline: float, attempts: int, timeout: float,
+                       retryable=lambda error: False, base_delay: float = 0.5, max_delay: float = 20.0):
+    """Await call(timeout) until it succeeds, retrying retryable errors with full-jitter backoff.
+
+    Gives up after `attempts` tries or when the next try could not start before
+    `deadline` seconds have passed; each try's timeout is cut to the time left.
+    """
+    give_up_at = time.monotonic() + deadline
+    for attempt in range(attempts):
+        remaining = give_up_at - time.monotonic()
+        try:
+            return await call(min(timeout, remaining))
+        except Exception as error:
+            if not retryable(error) or attempt + 1 >= attempts:
+                raise
+            delay = getattr(error, "retry_after", None) or random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+            if time.monotonic() + delay >= give_up_at:
+                raise
+            await asyncio.sleep(delay)
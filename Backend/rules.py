@@ -0,0 +1,252 @@
+# rules.py
+# Local static pre-scan for security issues that don't need a model to find:
+# hardcoded secrets, eval/exec, shell=True, string-built SQL, unsafe deserialization, ...
+#
+# Findings use the same shape as the model's "vulnerabilities" items, plus
+# "source": "static", so they can be merged straight into a scan result.
+
+import ast
+import math
+import re
+
+from chunking import Chunk
+
+# Names that end in a credential word (db_password, apiKey, AUTH_TOKEN), not names that
+# merely contain one (token_type, secret_key_env, max_tokens)
+SECRET_NAME = r"(?:password|passwd|pwd|secret|api[_-]?key|secret[_-]?key|access[_-]?key|private[_-]?key|token)"
+SECRET_NAME_RE = re.compile(rf"(?i)^\w*{SECRET_NAME}$")
+# A credential literal is at least this long and this varied (Shannon bits per character)
+SECRET_MIN_LENGTH = 8
+SECRET_MIN_ENTROPY = 2.5
+# Values that name an environment variable rather than hold a secret: SECRET_KEY, ${API_TOKEN}
+ENV_NAME_RE = re.compile(r"^\$?\{?[A-Z][A-Z0-9_]*\}?$")
+
+# (pattern, vulnerability_type, severity, description, fix_suggestion, covered_by_python_ast)
+REGEX_RULES = [
+    (r"AKIA[0-9A-Z]{16}", "Hardcoded Secret", "Critical",
+     "AWS access key ID embedded in source.", "Revoke the key and load credentials from the environment or a secret manager.", False),
+    (r"-----BEGIN (?:RSA |EC |DSA |OPENSSH |PGP )?PRIVATE KEY-----", "Hardcoded Secret", "Critical",
+     "Private key embedded in source.", "Remove the key from the repository, rotate it and load it from a secret store.", False),
+    (r"\b(?:ghp|gho|ghu|ghs|ghr)_[A-Za-z0-9]{36}\b|\bsk-[A-Za-z0-9_-]{20,}\b|\bxox[baprs]-[A-Za-z0-9-]{10,}\b", "Hardcoded Secret", "Critical",
+     "API token embedded in source.", "Revoke the token and read it from the environment or a secret manager.", False),
+    (rf"(?i)\b\w*{SECRET_NAME}\b[\"']?\s*[:=]\s*[\"'](?P<secret>[^\"'\s]{{{SECRET_MIN_LENGTH},}})[\"']", "Hardcoded Secret", "High",
+     "Credential assigned from a string literal.", "Load the value from the environment or a secret manager instead of hardcoding it.", True),
+    (r"(?<![\w.])(?:eval|exec)\s*\(", "Code Injection", "High",
+     "Dynamic code execution with eval/exec.", "Avoid eval/exec; parse the input explicitly (e.g. ast.literal_eval, JSON.parse).", True),
+    (r"\bshell\s*=\s*True\b", "Command Injection", "High",
+     "Subprocess started with shell=True.", "Pass the command as a list of arguments and keep shell=False.", True),
+    (r"\bos\.(?:system|popen)\s*\(", "Command Injection", "Medium",
+     "Shell command run through os.system/os.popen.", "Use subprocess.run with a list of arguments.", True),
+    (r"(?i)\b(?:execute|executemany|query|raw)\s*\(\s*(?:f[\"']|[\"'][^\"']*\b(?:select|insert|update|delete)\b[^\"']*[\"']\s*(?:%|\+|\.format\b))",
+     "SQL Injection", "High",
+     "SQL statement built from string formatting or concatenation.", "Use parameterized queries / bound parameters.", True),
+    (r"\b(?:pickle|cPickle|marshal|dill)\.loads?\s*\(", "Insecure Deserialization", "High",
+     "Deserializing data with pickle/marshal can execute arbitrary code.", "Use a safe format such as JSON for untrusted data.", True),
+    (r"\byaml\.load\s*\((?![^)]*SafeLoader)", "Insecure Deserialization", "High",
+     "yaml.load without SafeLoader can construct arbitrary objects.", "Use yaml.safe_load.", True),
+    (r"\bverify\s*=\s*False\b", "Insecure Transport", "Medium",
+     "TLS certificate verification disabled.", "Keep certificate verification enabled.", True),
+    (r"\bhashlib\.(?:md5|sha1)\s*\(", "Weak Cryptography", "Low",
+     "MD5/SHA-1 are not collision resistant.", "Use SHA-256 or stronger; use a password hash (bcrypt/argon2) for passwords.", True),
+    (r"\.innerHTML\s*=|\bdocument\.write\s*\(|dangerouslySetInnerHTML|bypassSecurityTrust\w*\s*\(", "XSS", "Medium",
+     "Untrusted content may be written into the DOM as HTML.", "Set textContent or sanitize the HTML before inserting it.", False),
+]
+REGEX_RULES = [(re.compile(pattern), *rest) for pattern, *rest in REGEX_RULES]
+
+
+def scan(code: str) -> list:
+    """Run the local rules over code and return vulnerability findings sorted by line."""
+    findings = []
+    ast_findings = _python_findings(code)
+    if ast_findings is not None:
+        findings.extend(ast_findings)
+
+    for number, line in enumerate(code.split("\n"), start=1):
+        for pattern, vuln_type, severity, description, fix, ast_covered in REGEX_RULES:
+            if ast_covered and ast_findings is not None:
+                continue
+            match = pattern.search(line)
+            if match and ("secret" not in pattern.groupindex or looks_like_secret(match.group("secret"))):
+                findings.append(_finding(number, vuln_type, severity, description, fix))
+
+    return _unique(sorted(findings, key=lambda f: f["line"]))
+
+
+def local_result(findings: list) -> dict:
+    """A complete scan result built only from static findings (no model call)."""
+    recommendations = []
+    for finding in findings:
+        if finding["fix_suggestion"] not in recommendations:
+            recommendations.append(finding["fix_suggestion"])
+    if findings:
+        summary = f"Static pre-scan found {len(findings)} potential issue(s)."
+    else:
+        summary = "Static pre-scan found no known insecure patterns."
+    return {"vulnerabilities": findings, "summary": summary, "recommendations": recommendations}
+
+
+def suspicious_regions(code: str, findings: list, context: int = 5) -> list:
+    """Chunks covering each flagged line plus `context` lines either side (overlaps merged)."""
+    lines = code.split("\n")
+    spans = []
+    for line in sorted({f["line"] for f in findings}):
+        start, end = max(1, line - context), min(len(lines), line + context)
+        if spans and start <= spans[-1][1] + 1:
+            spans[-1][1] = max(spans[-1][1], end)
+        else:
+            spans.append([start, end])
+    return [Chunk(start, "\n".join(lines[start - 1:end])) for start, end in spans]
+
+
+def merge_findings(model_findings: list, static_findings: list) -> list:
+    """Add static findings the model didn't already report (same line and type)."""
+    merged = [f for f in model_findings if isinstance(f, dict)]
+    reported = {(f.get("line"), str(f.get("vulnerability_type", "")).lower()) for f in merged}
+    for finding in static_findings:
+        if (finding["line"], finding["vulnerability_type"].lower()) not in reported:
+            merged.append(finding)
+    return sorted(merged, key=lambda f: f["line"] if isinstance(f.get("line"), int) else 0)
+
+
+def _finding(line, vuln_type, severity, description, fix):
+    return {
+        "line": line,
+        "description": description,
+        "vulnerability_type": vuln_type,
+        "severity": severity,
+        "fix_suggestion": fix,
+        "source": "static",
+    }
+
+
+def _unique(findings):
+    seen = set()
+    unique = []
+    for finding in findings:
+        key = (finding["line"], finding["vulnerability_type"], finding["description"])
+        if key not in seen:
+            seen.add(key)
+            unique.append(finding)
+    return unique
+
+
+def _python_findings(code: str):
+    try:
+        tree = ast.parse(code)
+    except (SyntaxError, ValueError):
+        return None
+    visitor = _SecurityVisitor()
+    visitor.visit(tree)
+    return visitor.findings
+
+
+def _dotted_name(node) -> str:
+    parts = []
+    while isinstance(node, ast.Attribute):
+        parts.append(node.attr)
+        node = node.value
+    if isinstance(node, ast.Name):
+        parts.append(node.id)
+    return ".".join(reversed(parts))
+
+
+def _is_built_string(node) -> bool:
+    if isinstance(node, ast.JoinedStr):
+        return True
+    if isinstance(node, ast.BinOp) and isinstance(node.op, (ast.Add, ast.Mod)):
+        return True
+    return isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr == "format"
+
+
+class _SecurityVisitor(ast.NodeVisitor):
+    def __init__(self):
+        self.findings = []
+
+    def add(self, node, vuln_type, severity, description, fix):
+        self.findings.append(_finding(node.lineno, vuln_type, severity, description, fix))
+
+    def visit_Call(self, node):
+        name = _dotted_name(node.func)
+        short = name.rsplit(".", 1)[-1]
+        keywords = {kw.arg: kw.value for kw in node.keywords if kw.arg}
+
+        if name in ("eval", "exec", "builtins.eval", "builtins.exec"):
+            self.add(node, "Code Injection", "High",
+                     f"Dynamic code execution with {short}().",
+                     "Avoid eval/exec; parse the input explicitly (e.g. ast.literal_eval).")
+        elif name.startswith("subprocess.") and _is_true(keywords.get("shell")):
+            self.add(node, "Command Injection", "High",
+                     f"{name}() started with shell=True.",
+                     "Pass the command as a list of arguments and keep shell=False.")
+        elif name in ("os.system", "os.popen"):
+            self.add(node, "Command Injection", "Medium",
+                     f"Shell command run through {name}().",
+                     "Use subprocess.run with a list of arguments.")
+        elif name in ("pickle.loads", "pickle.load", "cPickle.loads", "cPickle.load",
+                      "marshal.loads", "marshal.load", "dill.loads", "dill.load"):
+            self.add(node, "Insecure Deserialization", "High",
+                     f"{name}() can execute arbitrary code when given untrusted data.",
+                     "Use a safe format such as JSON for untrusted data.")
+        elif name == "yaml.load" and "SafeLoader" not in ast.dump(keywords.get("Loader", ast.Constant(None))):
+            self.add(node, "Insecure Deserialization", "High",
+                     "yaml.load without SafeLoader can construct arbitrary objects.",
+                     "Use yaml.safe_load.")
+        elif short in ("execute", "executemany", "executescript") and node.args and _is_built_string(node.args[0]):
+            self.add(node, "SQL Injection", "High",
+                     "SQL statement built from string formatting or concatenation.",
+                     "Use parameterized queries / bound parameters.")
+        elif name in ("hashlib.md5", "hashlib.sha1"):
+            self.add(node, "Weak Cryptography", "Low",
+                     f"{name}() is not collision resistant.",
+                     "Use SHA-256 or stronger; use a password hash (bcrypt/argon2) for passwords.")
+
+        if _is_false(keywords.get("verify")):
+            self.add(node, "Insecure Transport", "Medium",
+                     "TLS certificate verification disabled.",
+                     "Keep certificate verification enabled.")
+        self.generic_visit(node)
+
+    def visit_Assign(self, node):
+        for target in node.targets:
+            self._check_secret(target, node.value)
+        self.generic_visit(node)
+
+    def visit_AnnAssign(self, node):
+        if node.value is not None:
+            self._check_secret(node.target, node.value)
+        self.generic_visit(node)
+
+    def visit_keyword(self, node):
+        if node.arg and SECRET_NAME_RE.match(node.arg) and _is_secret_literal(node.value):
+            self.add(node.value, "Hardcoded Secret", "High",
+                     f"Credential '{node.arg}' passed as a string literal.",
+                     "Load the value from the environment or a secret manager instead of hardcoding it.")
+        self.generic_visit(node)
+
+    def _check_secret(self, target, value):
+        name = target.id if isinstance(target, ast.Name) else getattr(target, "attr", None)
+        if name and SECRET_NAME_RE.match(name) and _is_secret_literal(value):
+            self.add(target, "Hardcoded Secret", "High",
+                     f"Credential '{name}' assigned from a string literal.",
+                     "Load the value from the environment or a secret manager instead of hardcoding it.")
+
+
+def _is_true(node) -> bool:
+    return isinstance(node, ast.Constant) and node.value is True
+
+
+def _is_false(node) -> bool:
+    return isinstance(node, ast.Constant) and node.value is False
+
+
+def _is_secret_literal(node) -> bool:
+    return isinstance(node, ast.Constant) and isinstance(node.value, str) and looks_like_secret(node.value)
+
+
+def looks_like_secret(value: str) -> bool:
+    """Long and varied enough to be a credential, and not the name of an environment variable."""
+    if len(value) < SECRET_MIN_LENGTH or " " in value or ENV_NAME_RE.match(value):
+        return False
+    counts = [value.count(char) for char in set(value)]
+    entropy = -sum(count / len(value) * math.log2(count / len(value)) for count in counts)
+    return entropy >= SECRET_MIN_ENTROPY
@@ -0,0 +1,171 @@
+# semantic.py
+# Optional near-duplicate cache: snippets that differ only in names, literals,
+# comments or formatting share one model result.
+#
+# A snippet is reduced to a token stream with comments dropped and local names,
+# strings and numbers replaced by placeholders (keywords and attribute/method names
+# are kept, since they carry the meaning). Its shingles go into a MinHash signature,
+# entirely on the CPU. Signatures are indexed with LSH banding, so a lookup only
+# compares against entries that share at least one band, and a hit needs an
+# estimated Jaccard similarity of at least the threshold.
+#
+# The index can be snapshotted to a JSON file and loaded again at startup.
+
+import hashlib
+import json
+import os
+import random
+import threading
+from collections import OrderedDict
+from typing import NamedTuple
+
+from detection import detect
+from units import tokens
+
+PERMUTATIONS = 64
+BANDS = 16  # 16 bands of 4 rows: pairs above ~0.7 similarity almost always share a band
+SHINGLE = 4
+PRIME = (1 << 61) - 1
+_rng = random.Random(20240611)  # fixed, so signatures stay comparable across restarts and snapshots
+HASH_PARAMS = [(_rng.randrange(1, PRIME), _rng.randrange(0, PRIME)) for _ in range(PERMUTATIONS)]
+
+KEYWORDS = frozenset(
+    "if else elif for while do switch case default break continue return yield def class function fn func "
+    "lambda let const var new delete try catch except finally throw throws raise with as import from package "
+    "using namespace public private protected static final abstract interface extends implements async await "
+    "and or not in is None null nil true false True False this self super void int long float double char "
+    "bool boolean string str list dict map set struct enum type go defer select chan range print println "
+    "printf echo len".split()
+)
+
+
+class Hit(NamedTuple):
+    value: str
+    similarity: float
+
+
+def features(code: str, language: str = None) -> list:
+    """The code's tokens with comments dropped and names/literals replaced by placeholders."""
+    normalized, previous = [], None
+    for token in tokens(code, language):
+        if token[0] in "\"'`":
+            token = "STR"
+        elif token[0].isdigit():
+            token = "NUM"
+        elif (token[0].isalpha() or token[0] == "_") and token not in KEYWORDS and previous != ".":
+            token = "ID"
+        normalized.append(token)
+        previous = token
+    return normalized
+
+
+def signature(code: str, language: str = None) -> list:
+    items = features(code, language if language is not None else detect(code).language)
+    shingles = {" ".join(items[i:i + SHINGLE]) for i in range(max(1, len(items) - SHINGLE + 1))}
+    hashes = [int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "big") for s in shingles]
+    return [min((a * h + b) % PRIME for h in hashes) for a, b in HASH_PARAMS]
+
+
+def similarity(first: list, second: list) -> float:
+    return sum(x == y for x, y in zip(first, second)) / len(first)
+
+
+class SemanticCache:
+    def __init__(self, threshold: float = 0.9, max_entries: int = 5000, snapshot_path: str = None,
+                 snapshot_every: int = 100):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.snapshot_path = snapshot_path
+        self.snapshot_every = snapshot_every
+        self._entries = OrderedDict()  # entry id -> (namespace, signature, value)
+        self._buckets = {}             # (namespace, band, rows) -> set of entry ids
+        self._ids = 0
+        self._unsaved = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.similarities = []  # of recent hits, to tune the threshold
+        if snapshot_path and os.path.exists(snapshot_path):
+            self.load(snapshot_path)
+
+    def lookup(self, namespace: str, sig: list):
+        """Return the most similar cached result at or above the threshold, or None."""
+        with self._lock:
+            candidates = set()
+            for key in self._band_keys(namespace, sig):
+                candidates |= self._buckets.get(key, set())
+            best, best_similarity = None, 0.0
+            for entry_id in candidates:
+                score = similarity(sig, self._entries[entry_id][1])
+                if score > best_similarity:
+                    best, best_similarity = entry_id, score
+            if best is None or best_similarity < self.threshold:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.similarities = (self.similarities + [best_similarity])[-200:]
+            self._entries.move_to_end(best)
+            return Hit(self._entries[best][2], round(best_similarity, 4))
+
+    def add(self, namespace: str, sig: list, value: str):
+        with self._lock:
+            self._ids += 1
+            self._entries[self._ids] = (namespace, sig, value)
+            for key in self._band_keys(namespace, sig):
+                self._buckets.setdefault(key, set()).add(self._ids)
+            while len(self._entries) > self.max_entries:
+                self._evict_oldest()
+            self._unsaved += 1
+            save = self.snapshot_path and self._unsaved >= self.snapshot_every
+        if save:
+            self.save()
+
+    def save(self, path: str = None):
+        path = path or self.snapshot_path
+        if not path:
+            return
+        with self._lock:
+            entries = [list(entry) for entry in self._entries.values()]
+            self._unsaved = 0
+        temporary = f"{path}.tmp"
+        with open(temporary, "w", encoding="utf-8") as snapshot:
+            json.dump({"permutations": PERMUTATIONS, "shingle": SHINGLE, "entries": entries}, snapshot)
+        os.replace(temporary, path)  # readers never see a half-written snapshot
+
+    def load(self, path: str):
+        try:
+            with open(path, encoding="utf-8") as snapshot:
+                data = json.load(snapshot)
+        except (OSError, ValueError):
+            return  # a missing or broken snapshot just means a cold cache
+        if data.get("permutations") != PERMUTATIONS or data.get("shingle") != SHINGLE:
+            return
+        for namespace, sig, value in data["entries"][-self.max_entries:]:
+            self.add(namespace, sig, value)
+        self._unsaved = 0
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        recent = self.similarities
+        return {
+            "entries": len(self._entries),
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "mean_hit_similarity": round(sum(recent) / len(recent), 4) if recent else None,
+            "snapshot": self.snapshot_path,
+        }
+
+    def _band_keys(self, namespace: str, sig: list):
+        rows = PERMUTATIONS // BANDS
+        return [(namespace, band, tuple(sig[band * rows:(band + 1) * rows])) for band in range(BANDS)]
+
+    def _evict_oldest(self):
+        entry_id, (namespace, sig, _) = self._entries.popitem(last=False)
+        for key in self._band_keys(namespace, sig):
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self._buckets[key]
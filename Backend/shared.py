@@ -0,0 +1,334 @@
+# shared.py
+# State shared by every worker process, so scaled-out workers reuse each other's model
+# results instead of each paying for them.
+#
+# A store holds string values with a TTL plus lease locks (a lock that expires on its
+# own if its holder dies). Three backends, picked with DETECTAI_SHARED_STATE:
+#   memory                        - one process (the default behaviour, made explicit)
+#   sqlite:///path/to/state.db    - every worker on one host, through a shared file
+#   redis://host:6379/0[,...]     - every worker anywhere; several URLs are sharded
+#                                   by consistent hashing of the key
+#
+# The Redis backend speaks the plain Redis protocol (RESP) with only GET, SET, DEL and
+# PEXPIRE (EVAL when available), so Redis, Valkey, KeyDB or a local stand-in such as
+# bench/mock_redis.py can serve it. A store that cannot be reached degrades to a miss
+# and a granted lock: duplicate work is better than failing the request.
+
+import bisect
+import hashlib
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from urllib.parse import urlparse
+
+# How long an unreachable Redis node is skipped before it is tried again
+RETRY_DOWN_SECONDS = 5.0
+VIRTUAL_NODES = 128
+
+# Deletes the lock only while it still belongs to the caller
+RELEASE_SCRIPT = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) else return 0 end"
+
+
+def owner_id() -> str:
+    """Identifies this process as a lock holder."""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class MemoryStore:
+    name = "memory"
+
+    def __init__(self):
+        self._values = {}  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None or entry[0] < time.time():
+                self._values.pop(key, None)
+                return None
+            return entry[1]
+
+    def set(self, key: str, value: str, ttl_seconds: float):
+        with self._lock:
+            self._values[key] = (time.time() + ttl_seconds, value)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._values.pop(key, None)
+
+    def acquire(self, key: str, owner: str, lease_seconds: float) -> bool:
+        """Take the lease, or extend it if owner already holds it."""
+        now = time.time()
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is not None and entry[0] >= now and entry[1] != owner:
+                return False
+            self._values[key] = (now + lease_seconds, owner)
+            return True
+
+    def release(self, key: str, owner: str):
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is not None and entry[1] == owner:
+                del self._values[key]
+
+    def stats(self) -> dict:
+        return {"backend": self.name, "keys": len(self._values)}
+
+
+class SQLiteStore:
+    """A SQLite file shared by the workers on one host (WAL mode, so readers don't block)."""
+
+    name = "sqlite"
+
+    def __init__(self, db_path: str, busy_timeout: float = 5.0):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, timeout=busy_timeout, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)")
+        self._db.execute("DELETE FROM state WHERE expires_at < ?", (time.time(),))
+        self._db.commit()
+
+    def get(self, key: str):
+        with self._lock:
+            row = self._db.execute("SELECT value FROM state WHERE key = ? AND expires_at >= ?", (key, time.time())).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: str, value: str, ttl_seconds: float):
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO state (key, value, expires_at) VALUES (?, ?, ?)",
+                             (key, value, time.time() + ttl_seconds))
+            self._db.commit()
+
+    def delete(self, key: str):
+        with self._lock:
+            self._db.execute("DELETE FROM state WHERE key = ?", (key,))
+            self._db.commit()
+
+    def acquire(self, key: str, owner: str, lease_seconds: float) -> bool:
+        now = time.time()
+        with self._lock:
+            # One statement, so two processes can't both see the lease as free
+            cursor = self._db.execute(
+                "INSERT INTO state (key, value, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at "
+                "WHERE state.expires_at < ? OR state.value = excluded.value",
+                (key, owner, now + lease_seconds, now),
+            )
+            self._db.commit()
+        return cursor.rowcount == 1
+
+    def release(self, key: str, owner: str):
+        with self._lock:
+            self._db.execute("DELETE FROM state WHERE key = ? AND value = ?", (key, owner))
+            self._db.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            keys = self._db.execute("SELECT COUNT(*) FROM state WHERE expires_at >= ?", (time.time(),)).fetchone()[0]
+        return {"backend": self.name, "path": self.db_path, "keys": keys}
+
+
+class RedisError(Exception):
+    pass
+
+
+class RedisStore:
+    """One Redis-protocol server, over a single blocking connection (commands are short)."""
+
+    name = "redis"
+
+    def __init__(self, url: str, timeout: float = 1.0):
+        parsed = urlparse(url)
+        self.url = url
+        self.address = (parsed.hostname or "127.0.0.1", parsed.port or 6379)
+        self.password = parsed.password
+        self.db = int(parsed.path.strip("/") or 0)
+        self.timeout = timeout
+        self._sock = None
+        self._reader = None
+        self._lock = threading.Lock()
+        self._down_until = 0.0
+        self._has_eval = True
+        self.errors = 0
+
+    def get(self, key: str):
+        return self._safe(None, "GET", key)
+
+    def set(self, key: str, value: str, ttl_seconds: float):
+        self._safe(None, "SET", key, value, "PX", int(ttl_seconds * 1000))
+
+    def delete(self, key: str):
+        self._safe(None, "DEL", key)
+
+    def acquire(self, key: str, owner: str, lease_seconds: float) -> bool:
+        lease_ms = int(lease_seconds * 1000)
+        if self._safe("OK", "SET", key, owner, "PX", lease_ms, "NX") == "OK":  # granted while unreachable
+            return True
+        # Already held: extend it if it is ours (renewals run well before the lease runs out)
+        if self._safe(None, "GET", key) == owner:
+            self._safe(None, "PEXPIRE", key, lease_ms)
+            return True
+        return False
+
+    def release(self, key: str, owner: str):
+        if time.monotonic() < self._down_until:
+            return  # the lease runs out on its own
+        if self._has_eval:
+            try:
+                self._command("EVAL", RELEASE_SCRIPT, 1, key, owner)
+                return
+            except RedisError:
+                self._has_eval = False  # e.g. a stand-in without scripting
+            except OSError:
+                self._mark_down()
+                return
+        if self._safe(None, "GET", key) == owner:
+            self._safe(None, "DEL", key)
+
+    def stats(self) -> dict:
+        return {"backend": self.name, "url": self.url, "errors": self.errors,
+                "up": time.monotonic() >= self._down_until}
+
+    def _safe(self, fallback, *args):
+        if time.monotonic() < self._down_until:
+            return fallback
+        try:
+            return self._command(*args)
+        except (OSError, RedisError):
+            self._mark_down()
+            return fallback
+
+    def _mark_down(self):
+        self.errors += 1
+        self._down_until = time.monotonic() + RETRY_DOWN_SECONDS
+        self._close()
+
+    def _command(self, *args):
+        with self._lock:
+            if self._sock is None:
+                self._connect()
+            try:
+                self._sock.sendall(_encode(args))
+                return self._read_reply()
+            except OSError:
+                self._close()
+                raise
+
+    def _connect(self):
+        self._sock = socket.create_connection(self.address, timeout=self.timeout)
+        self._reader = self._sock.makefile("rb")
+        for args in ((("AUTH", self.password),) if self.password else ()) + ((("SELECT", self.db),) if self.db else ()):
+            self._sock.sendall(_encode(args))
+            self._read_reply()
+
+    def _close(self):
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+        self._sock = self._reader = None
+
+    def _read_reply(self):
+        line = self._reader.readline()
+        if not line:
+            raise ConnectionError("connection closed")
+        kind, body = line[:1], line[1:-2].decode()
+        if kind == b"+":
+            return body
+        if kind == b"-":
+            raise RedisError(body)
+        if kind == b":":
+            return int(body)
+        if kind == b"$":
+            length = int(body)
+            if length < 0:
+                return None
+            data = self._reader.read(length + 2)
+            return data[:-2].decode("utf-8")
+        if kind == b"*":
+            count = int(body)
+            return None if count < 0 else [self._read_reply() for _ in range(count)]
+        raise RedisError(f"unexpected reply {line!r}")
+
+
+def _encode(args) -> bytes:
+    parts = [f"*{len(args)}\r\n".encode()]
+    for arg in args:
+        data = str(arg).encode("utf-8")
+        parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+    return b"".join(parts)
+
+
+class HashRing:
+    """Consistent hashing: adding or removing a node only moves the keys on its arcs."""
+
+    def __init__(self, nodes: list, virtual_nodes: int = VIRTUAL_NODES):
+        self._ring = sorted((_hash(f"{node}#{replica}"), node) for node in nodes for replica in range(virtual_nodes))
+        self._points = [point for point, _ in self._ring]
+
+    def node(self, key: str):
+        index = bisect.bisect(self._points, _hash(key)) % len(self._ring)
+        return self._ring[index][1]
+
+
+def _hash(text: str) -> int:
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class ShardedStore:
+    """Spreads keys (and their locks) over several stores with a hash ring."""
+
+    def __init__(self, stores: list):
+        self.stores = {store.url: store for store in stores}
+        self.ring = HashRing(list(self.stores))
+        self.name = f"sharded-{stores[0].name}"
+
+    def shard(self, key: str):
+        return self.stores[self.ring.node(key)]
+
+    def get(self, key: str):
+        return self.shard(key).get(key)
+
+    def set(self, key: str, value: str, ttl_seconds: float):
+        self.shard(key).set(key, value, ttl_seconds)
+
+    def delete(self, key: str):
+        self.shard(key).delete(key)
+
+    def acquire(self, key: str, owner: str, lease_seconds: float) -> bool:
+        return self.shard(key).acquire(key, owner, lease_seconds)
+
+    def release(self, key: str, owner: str):
+        self.shard(key).release(key, owner)
+
+    def stats(self) -> dict:
+        return {"backend": self.name, "shards": [store.stats() for store in self.stores.values()]}
+
+
+def store_from_url(url: str):
+    """memory, sqlite:///path or redis://host:port/db (comma-separated Redis URLs are sharded)."""
+    url = url.strip()
+    if url == "memory":
+        return MemoryStore()
+    if url.startswith("sqlite:///"):
+        return SQLiteStore(url[len("sqlite:///"):])
+    if url.startswith(("redis://", "rediss://")):
+        urls = [part.strip() for part in url.split(",") if part.strip()]
+        if any(part.startswith("rediss://") for part in urls):
+            raise ValueError("TLS Redis URLs (rediss://) are not supported; use a local TLS proxy.")
+        stores = [RedisStore(part) for part in urls]
+        return stores[0] if len(stores) == 1 else ShardedStore(stores)
+    raise ValueError(f"Unknown shared state '{url}'. Use memory, sqlite:///path or redis://host:port.")
+
+
+def store_from_env():
+    """The store named by DETECTAI_SHARED_STATE, or None when workers keep their state to themselves."""
+    url = os.getenv("DETECTAI_SHARED_STATE")
+    return store_from_url(url) if url else None
@@ -0,0 +1,85 @@
+# singleflight.py
+# Coalesce concurrent identical requests: the first caller for a key starts the
+# upstream call, everyone else with the same key awaits that same call.
+#
+# With a shared store (shared.py) the same holds across worker processes: the worker
+# that takes the key's lease makes the call, and the others poll for the result it
+# publishes. The lease is renewed while the call runs and expires if the worker dies,
+# so a waiter then takes over.
+
+import asyncio
+
+from shared import owner_id
+
+POLL_SECONDS = 0.05
+MAX_POLL_SECONDS = 1.0
+
+
+class SingleFlight:
+    def __init__(self, store=None, lease_seconds: float = 30.0):
+        self.store = store
+        self.lease_seconds = lease_seconds
+        self.owner = owner_id()
+        self._calls = {}  # key -> asyncio.Task
+        self.calls = 0
+        self.coalesced = 0
+        self.remote_waits = 0
+        self.remote_hits = 0
+
+    async def do(self, key: str, fn, lookup=None):
+        """Run fn() once per key at a time and return its result to every concurrent caller.
+
+        lookup() returns the result another worker published for the key (or None); with
+        a shared store and a lookup, only one worker across all processes runs fn().
+        """
+        task = self._calls.get(key)
+        if task is None:
+            # A separate task, so one caller disconnecting doesn't cancel the call for the others
+            run = fn if self.store is None or lookup is None else lambda: self._across_workers(key, fn, lookup)
+            task = asyncio.ensure_future(run())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+            self.calls += 1
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+    def stats(self) -> dict:
+        stats = {"calls": self.calls, "coalesced": self.coalesced, "in_flight": self.in_flight()}
+        if self.store is not None:
+            stats.update(remote_waits=self.remote_waits, remote_hits=self.remote_hits)
+        return stats
+
+    async def _across_workers(self, key, fn, lookup):
+        lock, delay, waited = f"flight:{key}", POLL_SECONDS, False
+        while not await asyncio.to_thread(self.store.acquire, lock, self.owner, self.lease_seconds):
+            if not waited:
+                waited = True
+                self.remote_waits += 1
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, MAX_POLL_SECONDS)
+            value = await asyncio.to_thread(lookup)
+            if value is not None:
+                self.remote_hits += 1
+                return value
+
+        # The holder may have published its result just before we got the lease
+        value = await asyncio.to_thread(lookup) if waited else None
+        renew = asyncio.ensure_future(self._renew(lock))
+        try:
+            return value if value is not None else await fn()
+        finally:
+            renew.cancel()
+            await asyncio.to_thread(self.store.release, lock, self.owner)
+
+    async def _renew(self, lock):
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            await asyncio.to_thread(self.store.acquire, lock, self.owner, self.lease_seconds)
+
+    def _forget(self, key, task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
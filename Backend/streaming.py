@@ -0,0 +1,96 @@
+# streaming.py
+# Incremental parsing of a streamed JSON reply so findings can be sent to the
+# client as soon as each one is complete, instead of after the whole reply.
+
+import json
+
+
+class JsonItemStream:
+    """Feed text as it arrives; get back (key, item) for each finished item of the watched arrays.
+
+    Only arrays that are direct values of the top-level object are watched, e.g.
+    {"errors": [ {...}, {...} ], ...}. Anything before the first '{' (such as a
+    markdown fence) is ignored.
+    """
+
+    def __init__(self, keys):
+        self.keys = set(keys)
+        self.text = ""
+        self._pos = 0
+        self._started = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = None
+        self._last_string = None  # most recent string at the top level (a key, once ':' follows)
+        self._key = None
+        self._array_key = None    # watched array we're currently inside
+        self._item_start = None
+
+    def feed(self, chunk: str) -> list:
+        self.text += chunk
+        text = self.text
+        items = []
+        while self._pos < len(text):
+            ch = text[self._pos]
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        self._last_string = text[self._string_start + 1:self._pos]
+                self._pos += 1
+                continue
+
+            if not self._started:
+                if ch == "{":
+                    self._started = True
+                    self._depth = 1
+                self._pos += 1
+                continue
+
+            in_array = self._array_key is not None and self._depth == 2
+            if in_array and self._item_start is None and not ch.isspace() and ch not in ",]":
+                self._item_start = self._pos
+
+            if ch == '"':
+                self._in_string = True
+                self._string_start = self._pos
+            elif ch == ":" and self._depth == 1:
+                self._key = self._last_string
+            elif ch in "{[":
+                self._depth += 1
+                if ch == "[" and self._depth == 2 and self._key in self.keys:
+                    self._array_key = self._key
+                    self._item_start = None
+            elif ch in "}]":
+                if in_array and ch == "]":
+                    self._emit(text, items)
+                    self._array_key = None
+                self._depth -= 1
+            elif ch == "," and in_array:
+                self._emit(text, items)
+
+            self._pos += 1
+        return items
+
+    def _emit(self, text, items):
+        if self._item_start is None:
+            return
+        raw = text[self._item_start:self._pos].strip()
+        self._item_start = None
+        try:
+            items.append((self._array_key, json.loads(raw)))
+        except json.JSONDecodeError:
+            pass
+
+
+def format_event(event: str, data: dict, sse: bool) -> str:
+    """Encode one event as a Server-Sent Event or as a line of NDJSON."""
+    if sse:
+        return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+    return json.dumps({"event": event, **data}) + "\n"
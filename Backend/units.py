@@ -0,0 +1,113 @@
+# units.py
+# Function-level fingerprints, so a file review only sends the units that changed.
+#
+# A file is split into top-level units (functions, classes, blocks; see
+# chunking.split_units). Each unit gets a fingerprint that ignores whitespace and
+# comments: the AST dump for Python, the token stream with comments dropped for
+# everything else. Findings are memoized per fingerprint with unit-relative line
+# numbers; when a unit is reused its findings are re-anchored to the lines they were
+# reported on, since comment or blank-line edits inside a unit move lines without
+# changing the fingerprint.
+
+import ast
+import hashlib
+import re
+from typing import NamedTuple
+
+from chunking import split_units, split_by_lines, estimate_tokens
+
+# Comment syntax per language; anything not listed uses // and /* */
+COMMENT_STYLES = {"python": "hash", "ruby": "hash", "shell": "hash", "php": "php", "sql": "dash"}
+
+STRING_RE = r'"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\'|`(?:\\.|[^`\\])*`'
+TOKEN_RE = {
+    style: re.compile(rf"(?P<string>{STRING_RE})|(?P<comment>{comment})|(?P<token>\w+|[^\w\s])", re.S)
+    for style, comment in (
+        ("c", r"//[^\n]*|/\*.*?\*/"),
+        ("hash", r"#[^\n]*"),
+        ("php", r"#[^\n]*|//[^\n]*|/\*.*?\*/"),
+        ("dash", r"--[^\n]*|/\*.*?\*/"),
+    )
+}
+
+
+class Unit(NamedTuple):
+    start_line: int  # 1-based line in the file
+    text: str
+    fingerprint: str
+
+    @property
+    def line_count(self) -> int:
+        return self.text.count("\n") + 1
+
+
+def split(code: str, language: str = None, max_tokens: int = None) -> list:
+    """Split code into fingerprinted top-level units that together cover every line.
+
+    With max_tokens, a unit over that size (e.g. one huge class) is cut by lines into
+    pieces that each fit, so no unit has to be truncated to fit a prompt.
+    """
+    lines = code.split("\n")
+    starts = split_units(code, language)
+    units = []
+    for start, end in zip(starts, starts[1:] + [len(lines) + 1]):
+        unit_lines = lines[start - 1:end - 1]
+        text = "\n".join(unit_lines)
+        if max_tokens is not None and estimate_tokens(text) > max_tokens:
+            for piece_start, piece in split_by_lines(unit_lines, start, max_tokens):
+                piece_text = "\n".join(piece)
+                units.append(Unit(piece_start, piece_text, fingerprint(piece_text, language)))
+            continue
+        units.append(Unit(start, text, fingerprint(text, language)))
+    return units
+
+
+def fingerprint(text: str, language: str = None) -> str:
+    form = _python_form(text) if language in (None, "python") else None
+    if form is None:
+        form = _token_form(text, language)
+    return hashlib.sha256(f"{language}\0{form}".encode("utf-8")).hexdigest()
+
+
+def anchors(text: str) -> list:
+    """What memoized findings are re-anchored on: each line with its whitespace collapsed."""
+    return [" ".join(line.split()) for line in text.split("\n")]
+
+
+def relocate(items: list, old_anchors: list, new_anchors: list) -> list:
+    """Move unit-relative 'line' numbers from the memoized version of a unit to the current one.
+
+    A finding stays on its line if that line still has the same text; otherwise it moves
+    to the nearest line with that text, or keeps its number (clamped) if there is none.
+    """
+    relocated = []
+    for item in items:
+        line = item.get("line") if isinstance(item, dict) else None
+        if not isinstance(line, int) or not 1 <= line <= len(old_anchors):
+            relocated.append(item)
+            continue
+        anchor = old_anchors[line - 1]
+        if line <= len(new_anchors) and new_anchors[line - 1] == anchor:
+            relocated.append(item)
+            continue
+        matches = [number for number, text in enumerate(new_anchors, start=1) if text == anchor]
+        moved = min(matches, key=lambda number: abs(number - line)) if matches else min(line, len(new_anchors))
+        relocated.append({**item, "line": moved})
+    return relocated
+
+
+def _python_form(text: str):
+    try:
+        return ast.dump(ast.parse(text))  # no line/column attributes, no comments, no layout
+    except (SyntaxError, ValueError):
+        return None
+
+
+def tokens(text: str, language: str = None) -> list:
+    """The code's tokens (string literals kept whole), without comments or whitespace."""
+    style = COMMENT_STYLES.get(language, "c")
+    return [match.group() for match in TOKEN_RE[style].finditer(text) if match.lastgroup != "comment"]
+
+
+def _token_form(text: str, language: str = None) -> str:
+    return "\0".join(tokens(text, language))
@@ -40,4 +40,32 @@ export class DetectAIService {
   uploadFileToScan(formData: FormData | { code: string }): Observable<any> {
     return this.http.post(`${this.baseUrl}/uploadFileToScan`, formData);
   }
+
+  fullReview(code: string, facets?: string[]): Observable<any> {
+    return this.http.post(`${this.baseUrl}/review`, { code, facets });
+  }
+
+  uploadFileToReview(formData: FormData): Observable<any> {
+    return this.http.post(`${this.baseUrl}/uploadFileToReview`, formData);
+  }
+
+  batchReview(formData: FormData): Observable<any> {
+    return this.http.post(`${this.baseUrl}/batchReview`, formData);
+  }
+
+  getBatchReview(jobId: string): Observable<any> {
+    return this.http.get(`${this.baseUrl}/batchReview/${jobId}`);
+  }
+
+  submitJob(code: string, task: string, priority: string = 'interactive'): Observable<any> {
+    return this.http.post(`${this.baseUrl}/jobs`, { code, task, priority });
+  }
+
+  uploadFileAsJob(formData: FormData): Observable<any> {
+    return this.http.post(`${this.baseUrl}/jobs/upload`, formData);
+  }
+
+  getJob(jobId: string, wait: number = 0): Observable<any> {
+    return this.http.get(`${this.baseUrl}/jobs/${jobId}`, { params: { wait } });
+  }
 }